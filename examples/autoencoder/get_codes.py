@@ -2,6 +2,7 @@
 import glob
 import h5py
 import cPickle
+import quagga
 import numpy as np
 from quagga import Model
 from quagga.matrix import Matrix
@@ -35,6 +36,8 @@ with open('/home/sergii/Desktop/quagga/examples/autoencoder/vocab.pckl') as f:
     vocab = cPickle.load(f)
 word_to_idx = vocab['word_to_idx']
 idx_to_word = vocab['idx_to_word']
+# the model is only run forward, so no backward state is allocated
+quagga.inference = True
 # model_file_name = '2auto.hdf5'
 # model_file_name = '0_75drop_auto.hdf5'
 # model_file_name = '0_95_drop_auto.hdf5'
@@ -6,6 +6,7 @@ from quagga import Model
 from quagga.utils import List
 from quagga.cuda import cudart
 from quagga.matrix import Matrix
+from quagga.matrix import ShapeElement
 from quagga.context import Context
 from quagga.blocks import DotBlock
 from quagga.blocks import LstmBlock
@@ -185,11 +186,12 @@ class DataBlock(object):
         x_npa = np.zeros((len(data), int(np.max(lengths_npa))), np.int32, 'F')
         for k, e in enumerate(data):
             x_npa[k, :len(e) - 1] = e[:-1]
-        self.x.assign_npa(self.x_context, x_npa)
         y_npa = np.zeros((len(data), int(np.max(lengths_npa))), np.int32, 'F')
         for k, e in enumerate(data):
             y_npa[k, :len(e) - 1] = e[1:]
-        self._y.assign_npa(self.y_context, y_npa)
+        with ShapeElement.batch_update():
+            self.x.assign_npa(self.x_context, x_npa)
+            self._y.assign_npa(self.y_context, y_npa)
         for e in self.y:
             e.last_modification_context = self.y_context
         self.lengths.assign_npa(self.x_context, lengths_npa)
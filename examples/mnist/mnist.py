@@ -22,6 +22,7 @@ from quagga import Model
 from quagga.cuda import cudart
 from urllib import urlretrieve
 from quagga.matrix import Matrix
+from quagga.matrix import ShapeElement
 from quagga.context import Context
 from quagga.blocks import DotBlock
 from quagga.blocks import DropoutBlock
@@ -107,8 +108,9 @@ class MnistMiniBatchesGenerator(object):
 
         if indices.size:
             self.indices.assign_npa(self.context, indices)
-            self.x.nrows = indices.size
-            self.y.nrows = indices.size
+            with ShapeElement.batch_update():
+                self.x.nrows = indices.size
+                self.y.nrows = indices.size
             self.context.wait(*self.blocking_contexts)
             x.slice_columns_and_transpose(self.context, self.indices, self.x)
             y.slice_rows(self.context, self.indices, self.y)
@@ -20,6 +20,7 @@ from quagga import Model
 from quagga.utils import List
 from quagga.cuda import cudart
 from urllib import urlretrieve
+from functools import partial
 from quagga.matrix import Matrix
 from quagga.context import Context
 from quagga.blocks import DotBlock
@@ -274,7 +275,9 @@ if __name__ == '__main__':
                                     paddings=[c_bwd_repeat_block.output, h_bwd_repeat_block.output],
                                     reverse=True,
                                     device_id=0)
-    seq_hstack = SequencerBlock(block_class=HorizontalStackBlock,
+    # lstm states are stored right in the stacked matrices, so neither
+    # stacking nor splitting of gradients copies anything on the CPU
+    seq_hstack = SequencerBlock(block_class=partial(HorizontalStackBlock, share_memory=True),
                                 params=[],
                                 sequences=[List([h_fwd_repeat_block.output] + fwd_lstm_block.h[:], fwd_lstm_block.h.length + 1),
                                            List(bwd_lstm_block.h[:] + [h_bwd_repeat_block.output], bwd_lstm_block.h.length + 1)],
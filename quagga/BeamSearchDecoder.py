@@ -0,0 +1,118 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import numpy as np
+from itertools import izip
+
+
+class BeamSearchDecoder(object):
+    """
+    Beam search over a :class:`~quagga.RecurrentEngine`. Hypotheses of the
+    beam are streams of the engine, so every step of the beam is one batched
+    step of the engine. After the step states of the surviving hypotheses
+    are gathered from their parents by a single ``slice_rows`` per state
+    matrix.
+
+    The best continuations are selected with ``numpy.argpartition`` over
+    log-probabilities of all ``hypotheses x vocabulary`` candidates, only
+    the selected ones are sorted. A hypothesis that emits ``eos_token_id``
+    is finished and leaves the beam, so the beam shrinks (the so-called
+    shrinking beam). Scores of finished hypotheses are normalized by
+    ``length ** length_normalization``.
+
+    Parameters
+    ----------
+    engine : RecurrentEngine
+        Must have at least ``beam_size`` free slots during decoding
+    beam_size : int
+    max_length : int
+        Hypotheses that reach the length without ``eos_token_id`` are
+        finished as they are
+    eos_token_id : int
+        None for decoding of exactly ``max_length`` tokens
+    length_normalization : float
+        0 compares sums of log-probabilities, 1 compares their means
+    early_termination : bool
+        Stop as soon as no hypothesis of the beam can reach a better
+        normalized score than the best finished one
+    """
+    def __init__(self, engine, beam_size, max_length, eos_token_id=None,
+                 length_normalization=0.0, early_termination=True):
+        self.engine = engine
+        self.beam_size = beam_size
+        self.max_length = max_length
+        self.eos_token_id = eos_token_id
+        self.length_normalization = length_normalization
+        self.early_termination = early_termination
+        self.stream_ids = [('beam_search', id(self), k) for k in xrange(beam_size)]
+
+    def decode(self, prefix_token_ids):
+        """
+        Decodes a continuation of non-empty ``prefix_token_ids``.
+
+        Returns
+        -------
+        list of (list, float)
+            Finished hypotheses (without the prefix) and their normalized
+            scores, the best one is the first
+        """
+        if not len(prefix_token_ids):
+            raise ValueError('The prefix must have at least one token!')
+        for stream_id in self.stream_ids:
+            self.engine.add_stream(stream_id)
+        try:
+            return self._decode(prefix_token_ids)
+        finally:
+            for stream_id in self.stream_ids:
+                self.engine.evict_stream(stream_id)
+
+    def _decode(self, prefix_token_ids):
+        for token_id in prefix_token_ids:
+            probs = self.engine.step([token_id], self.stream_ids[:1])
+        scores = np.zeros(1)
+        hypotheses = [[]]
+        finished = []
+        for length in xrange(1, self.max_length + 1):
+            with np.errstate(divide='ignore'):
+                candidates = np.log(probs)
+            candidates += scores[:, np.newaxis]
+            candidates = candidates.ravel()
+            k = min(self.beam_size - len(finished), candidates.size)
+            top = np.argpartition(-candidates, k - 1)[:k]
+            top = top[np.argsort(-candidates[top], kind='mergesort')]
+            parents, token_ids = np.divmod(top, probs.shape[1])
+
+            live = []
+            for parent, token_id, score in izip(parents, token_ids, candidates[top]):
+                hypothesis = hypotheses[parent] + [int(token_id)]
+                if token_id == self.eos_token_id or length == self.max_length:
+                    finished.append((hypothesis, score / length ** self.length_normalization))
+                else:
+                    live.append((parent, token_id, score, hypothesis))
+            if not live:
+                break
+            if self.early_termination and finished:
+                # scores can only decrease, so the normalized score of a
+                # live hypothesis can not exceed the bound
+                bound = live[0][2] / self.max_length ** self.length_normalization
+                if max(score for _, score in finished) >= bound:
+                    break
+            parents, token_ids, scores, hypotheses = [list(e) for e in izip(*live)]
+            scores = np.array(scores)
+            stream_ids = self.stream_ids[:len(live)]
+            self.engine.reorder(stream_ids, [self.stream_ids[parent] for parent in parents])
+            probs = self.engine.step(token_ids, stream_ids)
+        finished.sort(key=lambda e: e[1], reverse=True)
+        return finished
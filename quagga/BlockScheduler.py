@@ -0,0 +1,241 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import sys
+import Queue
+import quagga
+import threading
+import numpy as np
+import multiprocessing
+from itertools import izip
+from collections import defaultdict
+from quagga.matrix.CpuMatrix import CpuMatrix
+from quagga.matrix.RowSparseMatrix import RowSparseMatrix
+from quagga.matrix.MemoryPlanner import _get_storage
+
+
+class _Worker(threading.Thread):
+    def __init__(self, tasks):
+        super(_Worker, self).__init__()
+        self.daemon = True
+        self.tasks = tasks
+        self.start()
+
+    def run(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+            k, method, done = task
+            try:
+                method()
+                done.put((k, None))
+            except Exception:
+                done.put((k, sys.exc_info()))
+
+
+class BlockScheduler(object):
+    """
+    Runs ``fprop`` and ``bprop`` of blocks of a :class:`~quagga.Model` on
+    a pool of threads. A block starts as soon as all blocks it depends on
+    have finished, so independent branches of the graph (e.g. the forward
+    and the backward directions of a bidirectional LSTM or independent loss
+    blocks) run on different cores. NumPy releases the GIL inside BLAS
+    calls and most ufuncs.
+
+    Dependencies are found by tracing matrix operations of the blocks
+    during ``step``, that is called once by the constructor: a block
+    depends on the preceding blocks that modified memory it uses or
+    modifies and on the ones that used memory it modifies. Memory is compared element-wise,
+    so blocks of a stacked matrix or elements of a
+    :class:`~quagga.utils.ContiguousList` do not conflict. A consumer depends on the
+    producer of every connector it registered usage of, while consumers
+    that accumulate derivatives into the same backward matrix keep their
+    sequential order, so results do not depend on the scheduling. The
+    ``bprop`` of a block additionally waits for the ``bprop`` of every block
+    that depended on it during ``fprop``.
+
+    Edges are not added for memory accesses that ``step`` does not make,
+    so it should process the longest sequences the model will see. Memory
+    must not be planned (see :meth:`~quagga.Model.plan_memory`) after the
+    dependencies are traced, because planning makes different buffers
+    share memory.
+
+    Parameters
+    ----------
+    fpropable_blocks : list
+        Blocks in the order of the sequential ``fprop``
+    bpropable_blocks : list
+        Blocks in the order of the sequential ``bprop``
+    step : callable
+        One iteration of the program that calls ``fprop`` and ``bprop`` of
+        every block sequentially, for instance the first training iteration
+    n_threads : int
+        Number of worker threads, the number of cores by default
+    """
+    def __init__(self, fpropable_blocks, bpropable_blocks, step, n_threads=None):
+        if quagga.processor_type != 'cpu':
+            raise NotImplementedError('Block scheduling is implemented only '
+                                      'for the cpu backend!')
+        if quagga.cpu_context_workers:
+            raise ValueError('Block scheduling requires synchronous '
+                             'contexts, set `quagga.cpu_context_workers` to 0!')
+        self.fpropable_blocks = list(fpropable_blocks)
+        self.bpropable_blocks = list(bpropable_blocks)
+        fprop_accesses, bprop_accesses = self._trace(step)
+        self.fprop_dependencies = _get_dependencies(fprop_accesses)
+        self.bprop_dependencies = _get_dependencies(bprop_accesses)
+        bprop_indices = dict((id(block), k) for k, block in enumerate(self.bpropable_blocks))
+        for k, dependencies in enumerate(self.fprop_dependencies):
+            i = bprop_indices.get(id(self.fpropable_blocks[k]))
+            if i is None:
+                continue
+            for j in dependencies:
+                j = bprop_indices.get(id(self.fpropable_blocks[j]))
+                if j is not None:
+                    self.bprop_dependencies[j].add(i)
+        self.n_threads = n_threads if n_threads else multiprocessing.cpu_count()
+        self._tasks = Queue.Queue()
+        self._workers = []
+
+    def _trace(self, step):
+        # returns lists of (storage id, array, whether it is modified) of
+        # every distinct memory access of `fprop` and `bprop` of the blocks,
+        # the methods are replaced with traced ones while `step` runs
+        traced = [(self.fpropable_blocks, 'fprop', [None] * len(self.fpropable_blocks)),
+                  (self.bpropable_blocks, 'bprop', [None] * len(self.bpropable_blocks))]
+        replaced = []
+        for blocks, name, accesses in traced:
+            for k, block in enumerate(blocks):
+                replaced.append((block, name, block.__dict__.get(name)))
+                setattr(block, name, self._get_traced(getattr(block, name), accesses, k))
+        self._accesses = None
+        CpuMatrix.tracer = self._record
+        try:
+            step()
+        finally:
+            CpuMatrix.tracer = None
+            for block, name, method in replaced:
+                if method is None:
+                    delattr(block, name)
+                else:
+                    setattr(block, name, method)
+        for blocks, name, accesses in traced:
+            for block, block_accesses in izip(blocks, accesses):
+                if block_accesses is None:
+                    raise ValueError('`step` has not called {} of {}!'.format(name, block))
+        return [[e.values() for e in accesses] for _, _, accesses in traced]
+
+    def _get_traced(self, method, accesses, k):
+        def traced():
+            if accesses[k] is None:
+                accesses[k] = {}
+            outer_accesses, self._accesses = self._accesses, accesses[k]
+            try:
+                return method()
+            finally:
+                self._accesses = outer_accesses
+        return traced
+
+    def _record(self, operation_name, modified_matrices, used_matrices):
+        if self._accesses is None:
+            # operations outside of the blocks, like loading of data
+            return
+        for matrices, modified in [(used_matrices, False), (modified_matrices, True)]:
+            for matrix in matrices:
+                if isinstance(matrix, RowSparseMatrix):
+                    # row-sparse matrices manage their own buffers
+                    storage, array = matrix, None
+                    key = id(storage), modified
+                else:
+                    storage, array = _get_storage(matrix.data), matrix.data
+                    key = id(storage), modified, array.__array_interface__['data'][0], array.shape, array.strides
+                # arrays keep their storages alive, so ids are not reused
+                self._accesses[key] = id(storage), array if array is not None else storage, modified
+
+    def fprop(self):
+        self._execute(self.fpropable_blocks, 'fprop', self.fprop_dependencies)
+
+    def bprop(self):
+        self._execute(self.bpropable_blocks, 'bprop', self.bprop_dependencies)
+
+    def _execute(self, blocks, method_name, dependencies):
+        if not self._workers:
+            self._workers = [_Worker(self._tasks) for _ in xrange(self.n_threads)]
+        n_dependencies = [len(e) for e in dependencies]
+        dependants = [[] for _ in blocks]
+        for k, e in enumerate(dependencies):
+            for j in e:
+                dependants[j].append(k)
+        done = Queue.Queue()
+        n_running = 0
+        for k, n in enumerate(n_dependencies):
+            if not n:
+                self._tasks.put((k, getattr(blocks[k], method_name), done))
+                n_running += 1
+        exc_info = None
+        while n_running:
+            k, error = done.get()
+            n_running -= 1
+            exc_info = exc_info or error
+            if exc_info:
+                # waits for the running blocks and does not start new ones
+                continue
+            for j in dependants[k]:
+                n_dependencies[j] -= 1
+                if not n_dependencies[j]:
+                    self._tasks.put((j, getattr(blocks[j], method_name), done))
+                    n_running += 1
+        if exc_info:
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+    def close(self):
+        """
+        Stops the worker threads, they are started again by the next
+        ``fprop`` or ``bprop``.
+        """
+        for _ in self._workers:
+            self._tasks.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+
+def _get_dependencies(accesses):
+    """
+    Returns sets of indices of the preceding blocks every block depends on,
+    ``accesses`` are lists of (storage id, array, whether it is modified)
+    of the blocks in the sequential order.
+    """
+    history = defaultdict(list)
+    dependencies = []
+    for k, block_accesses in enumerate(accesses):
+        e = set()
+        for storage, array, modified in block_accesses:
+            for j, other, other_modified in history[storage]:
+                if j not in e and (modified or other_modified) and _overlap(array, other):
+                    e.add(j)
+        for storage, array, modified in block_accesses:
+            history[storage].append((k, array, modified))
+        dependencies.append(e)
+    return dependencies
+
+
+def _overlap(a, b):
+    # blocks of a stacked matrix or elements of a ContiguousList share
+    # storage without overlapping
+    if not isinstance(a, np.ndarray) or not isinstance(b, np.ndarray):
+        return True
+    return np.shares_memory(a, b)
@@ -13,6 +13,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ----------------------------------------------------------------------------
+import quagga
+import ctypes as ct
+import numpy as np
+from quagga.matrix import GpuMatrix
+from quagga.matrix import MemoryPlanner
+from quagga.BlockScheduler import BlockScheduler
+from quagga.matrix.MemoryPlanner import _get_storage
 
 
 class Model(object):
@@ -30,6 +37,7 @@ class Model(object):
             if hasattr(block, 'bprop'):
                 self.bpropable_blocks.append(block)
         self.bpropable_blocks = list(reversed(self.bpropable_blocks))
+        self.scheduler = None
 
     def set_training_mode(self):
         for block in self.modeable_blocks:
@@ -40,9 +48,110 @@ class Model(object):
             block.set_testing_mode()
 
     def fprop(self):
+        if self.scheduler:
+            self.scheduler.fprop()
+            return
         for block in self.fpropable_blocks:
             block.fprop()
 
     def bprop(self):
+        if self.scheduler:
+            self.scheduler.bprop()
+            return
         for block in self.bpropable_blocks:
-            block.bprop()
\ No newline at end of file
+            block.bprop()
+
+    def schedule_blocks(self, step, n_threads=None):
+        """
+        Makes ``fprop`` and ``bprop`` run independent blocks concurrently
+        (see :class:`~quagga.BlockScheduler`). It should be called after the
+        model is built and memory is planned.
+
+        Parameters
+        ----------
+        step : callable
+            One iteration of the program that calls ``fprop`` and ``bprop``
+            of the model, for instance the first iteration of training. It
+            is called once and traced in order to find dependencies of
+            blocks, so it should process the longest sequences the model
+            will see.
+        n_threads : int
+            Number of threads that run blocks, the number of cores by
+            default
+        """
+        if self.scheduler:
+            raise ValueError('Blocks have already been scheduled!')
+        self.scheduler = BlockScheduler(self.fpropable_blocks, self.bpropable_blocks, step, n_threads)
+
+    def plan_memory(self, step=None, preserved_matrices=()):
+        """
+        Makes buffers of intermediate results with non-overlapping lifetimes
+        share memory (see :class:`~quagga.matrix.MemoryPlanner`). Must be
+        called after the model is built and before training starts.
+
+        Parameters
+        ----------
+        step : callable
+            One iteration of the program, ``fprop`` followed by ``bprop`` by
+            default. It is called once and traced, so it should process the
+            longest sequences the model will see.
+        preserved_matrices : list of matrices
+            Matrices which values are read outside of ``step``, for instance
+            outputs that are only observed by callbacks. Gradients of
+            trainable parameters are always preserved.
+
+        Returns
+        -------
+        (int, int)
+            Peak number of bytes of traced buffers that are live during
+            ``step`` before and after planning
+        """
+        if quagga.processor_type != 'cpu':
+            raise NotImplementedError('Memory planning is implemented only '
+                                      'for the cpu backend!')
+        if self.scheduler:
+            raise ValueError('Memory must be planned before blocks are scheduled!')
+        if step is None:
+            def step():
+                self.fprop()
+                self.bprop()
+        planner = MemoryPlanner()
+        planner.trace(step)
+        preserved_matrices = list(preserved_matrices)
+        for block in self.blocks:
+            for param in getattr(block, 'trainable_parameters', {}).itervalues():
+                preserved_matrices.extend(param.get_backward_matrices())
+        return planner.plan(preserved_matrices)
+
+    def get_nbytes(self):
+        """
+        Returns the number of bytes held by matrices and arrays that are
+        referenced by the blocks of the model and by their connectors.
+        Arrays that share memory are counted once. Matrices that are
+        created lazily are counted only after the first ``fprop``/``bprop``.
+
+        Building the same model with and without ``quagga.inference`` shows
+        how much memory the backward pass takes.
+        """
+        nbytes = {}
+        visited = set()
+        objects = list(self.blocks)
+        while objects:
+            obj = objects.pop()
+            if id(obj) in visited:
+                continue
+            visited.add(id(obj))
+            if isinstance(obj, np.ndarray):
+                storage = _get_storage(obj)
+                nbytes[id(storage)] = storage.nbytes
+            elif isinstance(obj, GpuMatrix):
+                nbytes[ct.cast(obj.data, ct.c_void_p).value] = obj.nbytes
+            elif isinstance(obj, (list, tuple)):
+                objects.extend(obj)
+            elif isinstance(obj, dict):
+                objects.extend(obj.itervalues())
+            elif hasattr(obj, '__dict__') and \
+                    type(obj).__module__.startswith('quagga.') and \
+                    not type(obj).__module__.startswith('quagga.context'):
+                objects.extend(vars(obj).itervalues())
+        return sum(nbytes.itervalues())
@@ -0,0 +1,130 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import sys
+from collections import OrderedDict
+
+
+class _Node(object):
+    __slots__ = ['parent', 'token_id', 'children', 'value', 'nbytes']
+
+    def __init__(self, parent, token_id):
+        self.parent = parent
+        self.token_id = token_id
+        self.children = {}
+        self.value = None
+        self.nbytes = 0
+
+
+class PrefixStateCache(object):
+    """
+    Cache of recurrent states after prefixes of token sequences, so that
+    streams of a :class:`~quagga.RecurrentEngine` that share a prefix (a
+    system prompt, a common start of sentences) resume from the states
+    after it instead of recomputing them (see
+    :meth:`~quagga.RecurrentEngine.prime`).
+
+    Prefixes are kept in a trie, so the longest cached prefix of a sequence
+    is found in one pass over its tokens. Every node of the trie is charged
+    ``node_nbytes`` bytes, so long prefixes count towards the size of the
+    cache even if their values are small. Entries are evicted in the least
+    recently used order when the total size exceeds ``max_nbytes``.
+
+    Parameters
+    ----------
+    max_nbytes : int
+        The maximal total number of bytes of cached arrays and trie nodes
+    """
+    # approximate size of a node with its empty children dict
+    node_nbytes = sys.getsizeof(_Node(None, None)) + sys.getsizeof({})
+
+    def __init__(self, max_nbytes):
+        self.max_nbytes = max_nbytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._root = _Node(None, None)
+        # nodes with values from the least to the most recently used
+        self._lru = OrderedDict()
+
+    def __len__(self):
+        return len(self._lru)
+
+    def lookup(self, token_ids):
+        """
+        Finds the longest cached prefix of ``token_ids``.
+
+        Returns
+        -------
+        (int, object)
+            The length of the prefix and its value, ``(0, None)`` on a miss
+        """
+        node = self._root
+        found_length, found_node = 0, None
+        for length, token_id in enumerate(token_ids, 1):
+            node = node.children.get(token_id)
+            if node is None:
+                break
+            if node.value is not None:
+                found_length, found_node = length, node
+        if found_node is None:
+            self.misses += 1
+            return 0, None
+        self.hits += 1
+        del self._lru[found_node]
+        self._lru[found_node] = None
+        return found_length, found_node.value
+
+    def put(self, token_ids, value, nbytes):
+        """
+        Caches ``value`` of ``nbytes`` bytes for the prefix ``token_ids``.
+        A value that alone with the nodes of its prefix exceeds
+        ``max_nbytes`` is not cached.
+        """
+        if not len(token_ids):
+            raise ValueError('An empty prefix can not be cached!')
+        if nbytes + len(token_ids) * self.node_nbytes > self.max_nbytes:
+            return
+        node = self._root
+        for token_id in token_ids:
+            if token_id not in node.children:
+                node.children[token_id] = _Node(node, token_id)
+                self.nbytes += self.node_nbytes
+            node = node.children[token_id]
+        if node.value is not None:
+            del self._lru[node]
+            self.nbytes -= node.nbytes
+        node.value = value
+        node.nbytes = nbytes
+        self.nbytes += nbytes
+        self._lru[node] = None
+        while self.nbytes > self.max_nbytes:
+            self._remove(next(iter(self._lru)))
+
+    def _remove(self, node):
+        del self._lru[node]
+        self.nbytes -= node.nbytes
+        node.value = None
+        node.nbytes = 0
+        # prunes branches that do not lead to values anymore
+        while node.parent and node.value is None and not node.children:
+            del node.parent.children[node.token_id]
+            self.nbytes -= self.node_nbytes
+            node = node.parent
+
+    def clear(self):
+        self._root = _Node(None, None)
+        self._lru = OrderedDict()
+        self.nbytes = 0
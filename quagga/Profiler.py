@@ -0,0 +1,179 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import json
+import threading
+from functools import wraps
+from timeit import default_timer
+from collections import OrderedDict
+from quagga.context import CpuContext
+from quagga.context import GpuContext
+from quagga.utils import AllocationCounter
+
+
+class _Stats(object):
+    def __init__(self):
+        self.calls = 0
+        self.time = 0.0
+        self.nbytes = 0
+
+
+class Profiler(object):
+    """
+    Opt-in profiler of blocks of a :class:`~quagga.Model`.
+
+    :meth:`attach` replaces ``fprop`` and ``bprop`` of the model and of
+    every block (and of every time step block inside of a
+    :class:`~quagga.blocks.SequencerBlock`) with wrappers that record wall
+    time and the number of calls. :meth:`detach` restores them, so a model
+    that is not being profiled does not pay anything.
+
+    Blocks are named ``'<index in model.blocks>:<class name>'``, time step
+    blocks get ``'[<k>]'`` appended to the name of their sequencer. Times of
+    enclosing calls include times of the nested ones.
+
+    Parameters
+    ----------
+    synchronize : bool
+        Wait for all contexts of the profiled blocks before and after every
+        call, so the time of asynchronous work is attributed to the block
+        that submitted it
+    track_allocations : bool
+        Count bytes of numpy arrays allocated during every call (by any
+        thread)
+    trace : bool
+        Keep every call as an event of the Chrome trace (see
+        :meth:`save_chrome_trace`)
+    """
+    def __init__(self, synchronize=False, track_allocations=False, trace=True):
+        self.synchronize = synchronize
+        self.track_allocations = track_allocations
+        self.trace = trace
+        self.stats = OrderedDict()
+        self.events = []
+        self._contexts = []
+        self._wrapped = []
+        self._thread_ids = {}
+        self._start = default_timer()
+
+    def attach(self, model):
+        self._wrap(model, 'Model')
+        for i, block in enumerate(model.blocks):
+            self._wrap(block, '{}:{}'.format(i, type(block).__name__))
+
+    def detach(self):
+        for obj, method_name, method in reversed(self._wrapped):
+            if method is None:
+                delattr(obj, method_name)
+            else:
+                setattr(obj, method_name, method)
+        self._wrapped = []
+        self._contexts = []
+
+    def reset(self):
+        self.stats = OrderedDict()
+        self.events = []
+
+    def _wrap(self, block, name):
+        for context in _get_contexts(block):
+            if all(context is not c for c in self._contexts):
+                self._contexts.append(context)
+        for method_name in ['fprop', 'bprop']:
+            if hasattr(block, method_name):
+                self._wrapped.append((block, method_name, block.__dict__.get(method_name)))
+                method = getattr(block, method_name)
+                setattr(block, method_name, self._profiled(method, name, method_name))
+        if type(block).__name__ == 'SequencerBlock':
+            for k, step_block in enumerate(block.blocks):
+                self._wrap(step_block, '{}[{}]'.format(name, k))
+
+    def _profiled(self, method, name, method_name):
+        stats = self.stats.setdefault((name, method_name), _Stats())
+
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            if self.synchronize:
+                self._synchronize()
+            counter = AllocationCounter() if self.track_allocations else None
+            start = default_timer()
+            if counter:
+                with counter:
+                    method(*args, **kwargs)
+                    if self.synchronize:
+                        self._synchronize()
+            else:
+                method(*args, **kwargs)
+                if self.synchronize:
+                    self._synchronize()
+            end = default_timer()
+            stats.calls += 1
+            stats.time += end - start
+            nbytes = counter.nbytes if counter else 0
+            stats.nbytes += nbytes
+            if self.trace:
+                thread = threading.current_thread().ident
+                event = {'name': name,
+                         'cat': method_name,
+                         'ph': 'X',
+                         'ts': (start - self._start) * 1e6,
+                         'dur': (end - start) * 1e6,
+                         'pid': 0,
+                         'tid': self._thread_ids.setdefault(thread, len(self._thread_ids))}
+                if counter:
+                    event['args'] = {'nbytes': nbytes}
+                self.events.append(event)
+        return wrapper
+
+    def _synchronize(self):
+        for context in self._contexts:
+            context.synchronize()
+
+    def get_table(self, sort_by='time'):
+        """
+        Returns a text table with the number of calls, total and mean time
+        and allocated bytes of every profiled method.
+
+        Parameters
+        ----------
+        sort_by : str
+            'time', 'calls', 'nbytes' or 'name' (the order of attaching)
+        """
+        rows = [(name, method_name, s) for (name, method_name), s in self.stats.iteritems() if s.calls]
+        if sort_by != 'name':
+            rows.sort(key=lambda row: getattr(row[2], sort_by), reverse=True)
+        lines = ['{:40} {:6} {:>8} {:>12} {:>12} {:>14}'.
+                 format('block', 'method', 'calls', 'total, ms', 'mean, ms', 'allocated, B')]
+        for name, method_name, s in rows:
+            lines.append('{:40} {:6} {:8d} {:12.3f} {:12.3f} {:14d}'.
+                         format(name, method_name, s.calls, s.time * 1e3, s.time / s.calls * 1e3, s.nbytes))
+        return '\n'.join(lines)
+
+    def save_chrome_trace(self, path):
+        """
+        Saves recorded calls in the Chrome trace event format, it can be
+        opened with chrome://tracing.
+        """
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+
+
+def _get_contexts(block):
+    contexts = []
+    for value in vars(block).itervalues():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        for value in values:
+            if isinstance(value, (CpuContext, GpuContext)):
+                contexts.append(value)
+    return contexts
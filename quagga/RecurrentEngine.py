@@ -0,0 +1,292 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import numpy as np
+from itertools import izip
+from quagga.Model import Model
+from quagga.matrix import Matrix
+from quagga.context import Context
+from quagga.blocks import DotBlock
+from quagga.blocks import LstmBlock
+from quagga.connector import Connector
+from quagga.blocks import SoftmaxBlock
+from quagga.blocks import RowSlicingBlock
+
+
+class RecurrentEngine(object):
+    """
+    Runs a language model of stacked LSTM layers over many independent
+    streams of tokens in one batch. Every stream occupies a slot, a row of
+    the batch, which keeps its cell and hidden states between steps. Streams
+    can be added, reset and evicted at any moment without rebuilding the
+    graph, and a step of any subset of streams costs the same few GEMMs per
+    layer as a step of all of them: rows of the streams that do not take
+    part in the step are masked, so their states stay untouched.
+
+    Parameters should be created in the inference mode (see
+    ``quagga.inference``) or be non-trainable, otherwise the blocks allocate
+    the backward state that is never used. Connectors of parameters that
+    are obtained on another device must be fprop'ed (for instance by
+    :meth:`~quagga.blocks.ParameterContainer.fprop`) before the first step.
+
+    Parameters
+    ----------
+    embd_W : Connector
+        Token embeddings, ``(vocab_size, x_dim)``
+    lstm_parameters : list of (W, R, b)
+        Connectors of parameters of every LSTM layer, ``b`` can be None
+    sce_W : Connector
+        Output projection, ``(hidden_dim, vocab_size)``
+    sce_b : Connector
+    n_slots : int
+        The maximal number of concurrent streams
+    initial_states : list of (numpy.ndarray, numpy.ndarray)
+        ``(1, hidden_dim)`` initial cell and hidden states of every layer,
+        zeros by default
+    device_id : int
+    """
+    def __init__(self, embd_W, lstm_parameters, sce_W, sce_b, n_slots,
+                 initial_states=None, device_id=None):
+        self.context = Context(device_id)
+        device_id = self.context.device_id
+        self.n_slots = n_slots
+        self.token_ids = Connector(Matrix.empty(n_slots, 1, 'int', device_id))
+        self.mask = Connector(Matrix.empty(n_slots, 1, device_id=device_id))
+        self.load_mask = Matrix.empty(n_slots, 1, device_id=device_id)
+        self.gather_indices = Matrix.empty(n_slots, 1, 'int', device_id)
+        embd_block = RowSlicingBlock(embd_W, self.token_ids)
+        self.lstm_blocks = []
+        self.prev_states = []
+        self.load_buffers = []
+        self.initial_states = []
+        x = embd_block.output
+        for k, (W, R, b) in enumerate(lstm_parameters):
+            hidden_dim = R.nrows
+            if initial_states:
+                c0, h0 = initial_states[k]
+            else:
+                c0 = h0 = np.zeros((1, hidden_dim), np.float32)
+            self.initial_states.append(tuple(np.asarray(s0, np.float32).reshape(1, hidden_dim) for s0 in [c0, h0]))
+            # states are loaded by masked addition, so they must not
+            # start with nans
+            zeros = np.zeros((n_slots, hidden_dim), np.float32)
+            prev_c = Connector(Matrix.from_npa(zeros, device_id=device_id))
+            prev_h = Connector(Matrix.from_npa(zeros, device_id=device_id))
+            self.prev_states.append((prev_c, prev_h))
+            self.load_buffers.append((Matrix.empty(n_slots, hidden_dim, device_id=device_id),
+                                      Matrix.empty(n_slots, hidden_dim, device_id=device_id)))
+            lstm_block = LstmBlock(W, R, b, None, x, self.mask, prev_c, prev_h, device_id)
+            self.lstm_blocks.append(lstm_block)
+            x = lstm_block.h
+        dot_block = DotBlock(sce_W, sce_b, x, device_id)
+        softmax_block = SoftmaxBlock(dot_block.output, device_id)
+        self.probs = softmax_block.output
+        self.model = Model([embd_block] + self.lstm_blocks + [dot_block, softmax_block])
+        self.model.set_testing_mode()
+
+        self.slots = {}
+        self._free_slots = range(n_slots - 1, -1, -1)
+        # states that are written to the slots before the next step, None
+        # stands for the initial states
+        self._loaded_states = dict.fromkeys(xrange(n_slots))
+        # states of the last step are copied to the slots lazily, so that
+        # a reordering of them is done by the copy itself
+        self._states_pending = False
+        self._gather_indices_npa = None
+
+    @property
+    def streams(self):
+        return self.slots.keys()
+
+    def add_stream(self, stream_id):
+        """
+        Assigns a free slot to a new stream, the stream starts from the
+        initial states.
+        """
+        if stream_id in self.slots:
+            raise ValueError('Stream {} is already added!'.format(stream_id))
+        if not self._free_slots:
+            raise ValueError('There are no free slots, evict some streams!')
+        slot = self._free_slots.pop()
+        self.slots[stream_id] = slot
+        self._loaded_states[slot] = None
+        return slot
+
+    def evict_stream(self, stream_id):
+        slot = self._get_slot(stream_id)
+        self._loaded_states.pop(slot, None)
+        self._free_slots.append(slot)
+        del self.slots[stream_id]
+
+    def reset_stream(self, stream_id):
+        """
+        Returns the stream to the initial states, the states are reset
+        lazily by the next step together with the other reset streams.
+        """
+        self._loaded_states[self._get_slot(stream_id)] = None
+
+    def set_states(self, stream_id, states):
+        """
+        Replaces states of the stream with ``states`` in the format of
+        :meth:`get_states`. Like resets, they are written lazily by the next
+        step together with the other loaded states.
+        """
+        slot = self._get_slot(stream_id)
+        if len(states) != len(self.prev_states):
+            raise ValueError('There must be states of every layer!')
+        for state, (prev_c, prev_h) in izip(states, self.prev_states):
+            for s, prev_s in izip(state, [prev_c, prev_h]):
+                if np.size(s) != prev_s.ncols:
+                    raise ValueError('States have wrong dimensions!')
+        self._loaded_states[slot] = states
+
+    def _get_slot(self, stream_id):
+        try:
+            return self.slots[stream_id]
+        except KeyError:
+            raise ValueError('Stream {} is not added!'.format(stream_id))
+
+    def step(self, token_ids, stream_ids):
+        """
+        Feeds ``token_ids[i]`` to the stream ``stream_ids[i]`` and advances
+        states of these streams, the other streams are not changed.
+
+        Returns
+        -------
+        numpy.ndarray
+            ``(len(stream_ids), vocab_size)`` probabilities of the next
+            tokens of the streams
+        """
+        if len(token_ids) != len(stream_ids):
+            raise ValueError('There must be one token for every stream!')
+        slots = [self._get_slot(stream_id) for stream_id in stream_ids]
+        if len(set(slots)) != len(slots):
+            raise ValueError('A stream can make only one step at a time!')
+        self._update_states()
+        self._load_states()
+        # host arrays must stay alive until they are transferred
+        self._token_ids_npa = np.zeros((self.n_slots, 1), np.int32, 'F')
+        self._token_ids_npa[slots, 0] = token_ids
+        self._mask_npa = np.zeros((self.n_slots, 1), np.float32, 'F')
+        self._mask_npa[slots, 0] = 1.0
+        self.token_ids.assign_npa(self.context, self._token_ids_npa)
+        self.mask.assign_npa(self.context, self._mask_npa)
+        self.token_ids.fprop()
+        self.mask.fprop()
+        for prev_c, prev_h in self.prev_states:
+            prev_c.fprop()
+            prev_h.fprop()
+        self.model.fprop()
+        self._states_pending = True
+        return self.probs.to_host()[slots]
+
+    def reorder(self, stream_ids, parent_stream_ids):
+        """
+        Replaces states of ``stream_ids[i]`` with the states of
+        ``parent_stream_ids[i]``, the other streams keep their states. It
+        must be called right after a step and applies to the states produced
+        by the step, the reordering is done by a single gather per state
+        matrix instead of the usual copy.
+        """
+        if not self._states_pending:
+            raise ValueError('States can be reordered only right after a step!')
+        if len(stream_ids) != len(parent_stream_ids):
+            raise ValueError('There must be one parent for every stream!')
+        slots = [self._get_slot(stream_id) for stream_id in stream_ids]
+        parent_slots = [self._get_slot(stream_id) for stream_id in parent_stream_ids]
+        if self._gather_indices_npa is None:
+            indices = np.arange(self.n_slots, dtype=np.int32)
+        else:
+            indices = self._gather_indices_npa[:, 0]
+        new_indices = indices.copy()
+        new_indices[slots] = indices[parent_slots]
+        self._gather_indices_npa = np.asfortranarray(new_indices[:, np.newaxis])
+
+    def _update_states(self):
+        if not self._states_pending:
+            return
+        # the host array must stay alive until it is transferred
+        self._transferred_indices_npa = self._gather_indices_npa
+        self._gather_indices_npa = None
+        if self._transferred_indices_npa is not None:
+            self.gather_indices.assign_npa(self.context, self._transferred_indices_npa)
+        for lstm_block, (prev_c, prev_h) in izip(self.lstm_blocks, self.prev_states):
+            # rows of masked slots of c and h are equal to the previous ones
+            for s, prev_s in [(lstm_block.c, prev_c), (lstm_block.h, prev_h)]:
+                if self._transferred_indices_npa is None:
+                    prev_s.assign(lstm_block.f_context, s)
+                else:
+                    s.slice_rows(lstm_block.f_context, self.gather_indices, prev_s)
+        self._states_pending = False
+
+    def _load_states(self):
+        if not self._loaded_states:
+            return
+        # host arrays must stay alive until they are transferred
+        self._load_mask_npa = np.zeros((self.n_slots, 1), np.float32, 'F')
+        self._load_mask_npa[self._loaded_states.keys(), 0] = 1.0
+        self.load_mask.assign_npa(self.context, self._load_mask_npa)
+        self._load_buffers_npa = []
+        for k, (prev_state, load_buffer) in enumerate(izip(self.prev_states, self.load_buffers)):
+            for i, (prev_s, buffer) in enumerate(izip(prev_state, load_buffer)):
+                buffer_npa = np.zeros((self.n_slots, prev_s.ncols), np.float32, 'F')
+                for slot, states in self._loaded_states.iteritems():
+                    buffer_npa[slot] = (states or self.initial_states)[k][i].ravel()
+                self._load_buffers_npa.append(buffer_npa)
+                buffer.assign_npa(self.context, buffer_npa)
+                prev_s.assign_masked_addition(self.context, self.load_mask, buffer, prev_s)
+        self._loaded_states = {}
+
+    def prime(self, stream_id, token_ids, cache=None):
+        """
+        Starts the stream from the initial states and feeds it
+        ``token_ids`` one by one.
+
+        If a :class:`~quagga.PrefixStateCache` is given, the stream resumes
+        from the longest cached prefix of ``token_ids`` and the states after
+        all of them are cached.
+
+        Returns
+        -------
+        numpy.ndarray
+            ``(1, vocab_size)`` probabilities of the next token
+        """
+        if not len(token_ids):
+            raise ValueError('There must be at least one token!')
+        n, value = cache.lookup(token_ids) if cache is not None else (0, None)
+        if value:
+            states, probs = value
+            probs = probs.copy()
+            self.set_states(stream_id, states)
+        else:
+            self.reset_stream(stream_id)
+        for token_id in token_ids[n:]:
+            probs = self.step([token_id], [stream_id])
+        if cache is not None and n < len(token_ids):
+            states = self.get_states(stream_id)
+            nbytes = probs.nbytes + sum(c.nbytes + h.nbytes for c, h in states)
+            cache.put(token_ids, (states, probs), nbytes)
+        return probs
+
+    def get_states(self, stream_id):
+        """
+        Returns a list of ``(c, h)`` states of every layer of the stream,
+        each of them is a ``(1, hidden_dim)`` array.
+        """
+        slot = self._get_slot(stream_id)
+        self._update_states()
+        self._load_states()
+        return [(prev_c.to_host()[[slot]], prev_h.to_host()[[slot]])
+                for prev_c, prev_h in self.prev_states]
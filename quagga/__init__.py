@@ -15,6 +15,18 @@
 # ----------------------------------------------------------------------------
 processor_type = 'gpu'
 dtype = 'float'
+# Number of worker threads that execute work of CpuContext instances
+# asynchronously. 0 means that CPU work is done in the calling thread.
+cpu_context_workers = 0
+# If True, connectors are created without backward usage, so blocks that
+# are built in this mode allocate no derivatives and backward contexts and
+# compute nothing for bprop. It does not affect already built blocks.
+inference = False
 
 
-from quagga.Model import Model
\ No newline at end of file
+from quagga.Model import Model
+from quagga.BlockScheduler import BlockScheduler
+from quagga.Profiler import Profiler
+from quagga.RecurrentEngine import RecurrentEngine
+from quagga.PrefixStateCache import PrefixStateCache
+from quagga.BeamSearchDecoder import BeamSearchDecoder
\ No newline at end of file
@@ -0,0 +1,27 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+from quagga.benchmarks.runner import run
+from quagga.benchmarks.runner import save
+from quagga.benchmarks.runner import load
+from quagga.benchmarks.runner import compare
+from quagga.benchmarks.runner import measure
+from quagga.benchmarks.runner import print_comparison
+from quagga.benchmarks.block_benchmarks import get_block_benchmarks
+from quagga.benchmarks.decoding_benchmarks import get_decoding_benchmarks
+from quagga.benchmarks.matrix_benchmarks import get_matrix_benchmarks
+from quagga.benchmarks.model_benchmarks import get_model_benchmarks
+from quagga.benchmarks.shape_benchmarks import get_shape_benchmarks
+from quagga.benchmarks.scatter_add_benchmarks import get_scatter_add_benchmarks
@@ -0,0 +1,106 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+"""
+CPU benchmarks of matrix operations, blocks, models and shape propagation.
+
+Run benchmarks and save results:
+
+    python -m quagga.benchmarks run -o results.json [-k REGEX] [--quick] [--reference]
+
+Compare two runs, the exit status is 1 if there are regressions:
+
+    python -m quagga.benchmarks compare base.json new.json [-t 0.1]
+"""
+import sys
+import argparse
+from quagga.benchmarks import run
+from quagga.benchmarks import save
+from quagga.benchmarks import load
+from quagga.benchmarks import compare
+from quagga.benchmarks import print_comparison
+from quagga.benchmarks import get_block_benchmarks
+from quagga.benchmarks import get_shape_benchmarks
+from quagga.benchmarks import get_decoding_benchmarks
+from quagga.benchmarks import get_matrix_benchmarks
+from quagga.benchmarks import get_model_benchmarks
+from quagga.benchmarks import get_scatter_add_benchmarks
+
+
+# (batch_size, dim)
+SHAPES = [(16, 128), (64, 256), (128, 512), (256, 1024)]
+QUICK_SHAPES = SHAPES[:2]
+BEAM_SIZES = [1, 4, 16, 64]
+QUICK_BEAM_SIZES = BEAM_SIZES[:2]
+# embedding scatter-add: vocabulary sizes and (batch_size, sequence_length)
+VOCAB_SIZES = [10000, 100000, 1000000]
+QUICK_VOCAB_SIZES = VOCAB_SIZES[:1]
+BATCH_SHAPES = [(16, 50), (32, 100), (64, 200), (64, 400)]
+QUICK_BATCH_SHAPES = BATCH_SHAPES[:2]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='python -m quagga.benchmarks')
+    subparsers = parser.add_subparsers(dest='command')
+    run_parser = subparsers.add_parser('run', help='run benchmarks')
+    run_parser.add_argument('-o', '--output', help='json file for results')
+    run_parser.add_argument('-k', '--pattern', help='run only benchmarks which names match the regular expression')
+    run_parser.add_argument('--quick', action='store_true', help='use only the small shapes')
+    run_parser.add_argument('--reference', action='store_true',
+                            help='time the reference python loops of the scatter_add benchmarks')
+    run_parser.add_argument('--sequence-length', type=int, default=10)
+    run_parser.add_argument('--min-run-time', type=float, default=0.2, help='seconds spent on one benchmark')
+    run_parser.add_argument('--repeats', type=int, default=5)
+    compare_parser = subparsers.add_parser('compare', help='compare two runs')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('-t', '--threshold', type=float, default=0.1,
+                                help='relative slowdown that is reported as a regression')
+    compare_parser.add_argument('--statistic', choices=['min', 'median'], default='min')
+    compare_parser.add_argument('--all', action='store_true', help='print benchmarks that did not change too')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        shapes = QUICK_SHAPES if args.quick else SHAPES
+        beam_sizes = QUICK_BEAM_SIZES if args.quick else BEAM_SIZES
+        vocab_sizes = QUICK_VOCAB_SIZES if args.quick else VOCAB_SIZES
+        batch_shapes = QUICK_BATCH_SHAPES if args.quick else BATCH_SHAPES
+        benchmarks = get_matrix_benchmarks(shapes, args.sequence_length) + \
+                     get_block_benchmarks(shapes, args.sequence_length) + \
+                     get_model_benchmarks(shapes, args.sequence_length) + \
+                     get_shape_benchmarks() + \
+                     get_decoding_benchmarks(beam_sizes) + \
+                     get_scatter_add_benchmarks(vocab_sizes, batch_shapes, reference=args.reference)
+        results = run(benchmarks, args.pattern, args.min_run_time, args.repeats)
+        results['meta']['shapes'] = shapes
+        results['meta']['sequence_length'] = args.sequence_length
+        results['meta']['beam_sizes'] = beam_sizes
+        results['meta']['vocab_sizes'] = vocab_sizes
+        results['meta']['batch_shapes'] = batch_shapes
+        results['meta']['reference'] = args.reference
+        if args.output:
+            save(results, args.output)
+        return 0
+
+    comparison = compare(load(args.base), load(args.new), args.threshold, args.statistic)
+    print_comparison(comparison, only_flagged=not args.all)
+    regressions = [e for e in comparison if e[-1] == 'regression']
+    print '{} benchmarks compared, {} regressions, {} improvements'.\
+        format(len(comparison), len(regressions), sum(e[-1] == 'improvement' for e in comparison))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,322 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+"""
+Benchmarks of block ``fprop`` and ``fprop`` followed by ``bprop``. Every
+benchmark is a function that takes a :class:`ConnectorFactory` and returns
+the block and its output connectors. Inputs of a block are created by the
+factory, so they are ``fprop``-ed before and their backward matrices are
+read after every timed ``bprop``.
+"""
+import numpy as np
+from quagga.utils import List
+from quagga.matrix import Matrix
+from quagga import blocks
+from quagga.connector import Connector
+from quagga.blocks.AttentionBlock import AttentionBlock as _AttentionBlock
+from quagga.learning.policies import FixedValuePolicy
+
+
+_benchmarks = []
+
+
+def _benchmark(fprop=True, bprop=True):
+    """
+    Registers a benchmark, ``fprop`` and ``bprop`` tell which of the
+    block methods exist.
+    """
+    def decorator(function):
+        _benchmarks.append((function, fprop, bprop))
+        return function
+    return decorator
+
+
+class ConnectorFactory(object):
+    def __init__(self, batch_size, dim, sequence_length, seed=42):
+        self.rng = np.random.RandomState(seed)
+        self.b = batch_size
+        self.d = dim
+        self.T = sequence_length
+        self.connectors = []
+
+    def _connector(self, a, bpropagable):
+        connector = Connector(Matrix.from_npa(a, device_id=0), 0 if bpropagable else None)
+        self.connectors.append(connector)
+        return connector
+
+    def m(self, nrows=None, ncols=None, bpropagable=True):
+        nrows = self.b if nrows is None else nrows
+        ncols = self.d if ncols is None else ncols
+        a = self.rng.randn(nrows, ncols) / np.sqrt(ncols)
+        return self._connector(a.astype(np.float32), bpropagable)
+
+    def positive(self, nrows=None, ncols=None):
+        nrows = self.b if nrows is None else nrows
+        ncols = self.d if ncols is None else ncols
+        return self._connector(self.rng.rand(nrows, ncols).astype(np.float32), False)
+
+    def mask(self, ncols=1):
+        a = (self.rng.rand(self.b, ncols) < 0.8).astype(np.float32)
+        return self._connector(a, False)
+
+    def indices(self, nrows, ncols, high):
+        a = self.rng.randint(high, size=(nrows, ncols)).astype(np.int32)
+        return self._connector(a, False)
+
+    def sequence(self, nrows=None, ncols=None, bpropagable=True):
+        return List([self.m(nrows, ncols, bpropagable) for _ in xrange(self.T)])
+
+    def masks(self):
+        return List([self.mask() for _ in xrange(self.T)])
+
+
+@_benchmark(bprop=False)
+def ArgmaxBlock(f):
+    block = blocks.ArgmaxBlock(f.m(bpropagable=False), 1)
+    return block, []
+
+
+@_benchmark()
+def AttentionBlock(f):
+    block = _AttentionBlock(f.sequence(), f.m(f.d, 1))
+    return block, [block.output]
+
+
+@_benchmark()
+def ColSlicingBlock(f):
+    block = blocks.ColSlicingBlock(f.m(f.d, 4 * f.b), f.indices(1, f.b, 4 * f.b))
+    return block, [block.output]
+
+
+@_benchmark()
+def DotBlock(f):
+    block = blocks.DotBlock(f.m(f.d, f.d), f.m(1, f.d), f.m())
+    return block, [block.output]
+
+
+@_benchmark()
+def DropoutBlock(f):
+    block = blocks.DropoutBlock(0.5, f.m())
+    return block, [block.output]
+
+
+@_benchmark()
+def GaussianNoiseBlock(f):
+    block = blocks.GaussianNoiseBlock(0.0, 1.0, f.m())
+    return block, [block.output]
+
+
+@_benchmark(fprop=False)
+def GradientReversalBlock(f):
+    block = blocks.GradientReversalBlock(f.m())
+    return block, []
+
+
+@_benchmark()
+def HorizontalStackBlock(f):
+    block = blocks.HorizontalStackBlock(f.m(), f.m())
+    return block, [block.output]
+
+
+@_benchmark()
+def InputlessLstmBlock(f):
+    block = blocks.InputlessLstmBlock(f.m(f.d, 4 * f.d), f.m(1, 4 * f.d), 5.0, f.mask(), f.m(), f.m())
+    return block, [block.c, block.h]
+
+
+@_benchmark(fprop=False)
+def L2RegularizationBlock(f):
+    block = blocks.L2RegularizationBlock(f.m(), 0.01)
+    return block, []
+
+
+@_benchmark()
+def LastSelectorBlock(f):
+    block = blocks.LastSelectorBlock(f.sequence())
+    return block, [block.output]
+
+
+@_benchmark()
+def LstmBlock(f):
+    block = blocks.LstmBlock(f.m(f.d, 4 * f.d), f.m(f.d, 4 * f.d), f.m(1, 4 * f.d), 5.0,
+                             f.m(), f.mask(), f.m(), f.m())
+    return block, [block.c, block.h]
+
+
+@_benchmark()
+def MeanPoolingBlock(f):
+    block = blocks.MeanPoolingBlock(f.m())
+    return block, [block.output]
+
+
+@_benchmark()
+def NonlinearityBlock_sigmoid(f):
+    block = blocks.NonlinearityBlock(f.m(), 'sigmoid')
+    return block, [block.output]
+
+
+@_benchmark()
+def NonlinearityBlock_tanh(f):
+    block = blocks.NonlinearityBlock(f.m(), 'tanh')
+    return block, [block.output]
+
+
+@_benchmark()
+def NonlinearityBlock_relu(f):
+    block = blocks.NonlinearityBlock(f.m(), 'relu')
+    return block, [block.output]
+
+
+@_benchmark(bprop=False)
+def ParameterContainer(f):
+    init = lambda: f.rng.randn(f.d, f.d).astype(np.float32)
+    block = blocks.ParameterContainer(W={'init': init, 'device_id': 0},
+                                      R={'init': init, 'device_id': 0})
+    return block, [block['W'], block['R']]
+
+
+@_benchmark()
+def RepeatBlock(f):
+    block = blocks.RepeatBlock(f.m(), f.T, axis=0)
+    return block, [block.output]
+
+
+@_benchmark()
+def RowSlicingBlock(f):
+    block = blocks.RowSlicingBlock(f.m(4 * f.b), f.indices(f.b, 1, 4 * f.b))
+    return block, [block.output]
+
+
+@_benchmark()
+def RowSlicingBlock_batch(f):
+    block = blocks.RowSlicingBlock(f.m(4 * f.b), f.indices(f.b, f.T, 4 * f.b))
+    return block, block.output
+
+
+@_benchmark(bprop=False)
+def ScheduledSamplingBlock(f):
+    block = blocks.ScheduledSamplingBlock(f.positive(), f.indices(f.b, 1, f.d), FixedValuePolicy(0.5), 42)
+    return block, []
+
+
+@_benchmark()
+def SequencerBlock_LstmBlock(f):
+    block = blocks.SequencerBlock(block_class=blocks.LstmBlock,
+                                  params=[f.m(f.d, 4 * f.d), f.m(f.d, 4 * f.d), f.m(1, 4 * f.d), 5.0],
+                                  sequences=[f.sequence(), f.masks()],
+                                  output_names=['h'],
+                                  prev_names=['c', 'h'],
+                                  paddings=[f.m(), f.m()])
+    return block, block.h
+
+
+@_benchmark()
+def SequentialHorizontalStackBlock(f):
+    block = blocks.SequentialHorizontalStackBlock(f.sequence(), f.sequence())
+    return block, block.output
+
+
+@_benchmark()
+def SequentialLstmBlock(f):
+    block = blocks.SequentialLstmBlock(f.m(f.d, 4 * f.d), f.m(f.d, 4 * f.d), f.m(1, 4 * f.d), 5.0,
+                                       f.sequence(), f.masks(), f.m(), f.m())
+    return block, block.h
+
+
+@_benchmark()
+def SequentialMeanPoolingBlock(f):
+    block = blocks.SequentialMeanPoolingBlock(f.sequence())
+    return block, [block.output]
+
+
+@_benchmark()
+def SequentialSumPoolingBlock(f):
+    block = blocks.SequentialSumPoolingBlock(f.sequence())
+    return block, [block.output]
+
+
+@_benchmark()
+def SigmoidCeBlock(f):
+    block = blocks.SigmoidCeBlock(f.m(), f.mask(f.d), f.mask())
+    return block, []
+
+
+@_benchmark()
+def SoftmaxBlock(f):
+    block = blocks.SoftmaxBlock(f.m())
+    return block, [block.output]
+
+
+@_benchmark()
+def SoftmaxCeBlock(f):
+    block = blocks.SoftmaxCeBlock(f.m(), f.indices(f.b, 1, f.d), f.mask())
+    return block, []
+
+
+@_benchmark()
+def SseBlock(f):
+    block = blocks.SseBlock(f.m(), f.m(bpropagable=False))
+    return block, []
+
+
+@_benchmark()
+def VerticalStackBlock(f):
+    block = blocks.VerticalStackBlock(f.m(), f.m())
+    return block, [block.output]
+
+
+def get_block_benchmarks(shapes, sequence_length=10):
+    """
+    Returns a list of ``(name, setup)`` pairs for :func:`~quagga.benchmarks.run`:
+    ``fprop`` and ``fprop`` followed by ``bprop`` of every block for every
+    ``(batch_size, dim)`` shape.
+    """
+    benchmarks = []
+    for batch_size, dim in shapes:
+        for benchmark, has_fprop, has_bprop in _benchmarks:
+            for bprop in [False, True]:
+                if not (has_bprop if bprop else has_fprop):
+                    continue
+                name = 'block.{}.{} {}x{}'.format(benchmark.__name__, 'fprop_bprop' if bprop else 'fprop', batch_size, dim)
+                setup = _get_setup(benchmark, bprop, batch_size, dim, sequence_length)
+                benchmarks.append((name, setup))
+    return benchmarks
+
+
+def _get_setup(benchmark, bprop, batch_size, dim, sequence_length):
+    def setup():
+        factory = ConnectorFactory(batch_size, dim, sequence_length)
+        block, outputs = benchmark(factory)
+        inputs = [c for c in factory.connectors if c.bpropagable]
+        # consumers of the outputs
+        for output in outputs:
+            if output.bpropagable:
+                output.register_usage(0, 0)
+        for connector in factory.connectors:
+            connector.fprop()
+
+        def fprop():
+            if hasattr(block, 'fprop'):
+                block.fprop()
+
+        def fprop_bprop():
+            for connector in factory.connectors:
+                connector.fprop()
+            fprop()
+            block.bprop()
+            for connector in inputs:
+                connector.backward_matrix
+        return fprop_bprop if bprop else fprop
+    return setup
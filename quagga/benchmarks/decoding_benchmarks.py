@@ -0,0 +1,56 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+"""
+Benchmarks of beam search over a stack of LSTMs. The timed function decodes
+``n_steps`` tokens without early termination, its ``n_items`` is the number
+of hypothesis steps, so the throughput is reported in beams per second.
+"""
+import quagga
+import numpy as np
+from quagga import RecurrentEngine
+from quagga import BeamSearchDecoder
+from quagga.matrix import Matrix
+from quagga.connector import Connector
+
+
+def get_decoding_benchmarks(beam_sizes, dim=256, n_layers=2, vocab_size=1000, n_steps=10):
+    """
+    Returns a list of ``(name, setup)`` pairs for :func:`~quagga.benchmarks.run`,
+    one for every beam width.
+    """
+    benchmarks = []
+    for beam_size in beam_sizes:
+        name = 'decoding.beam_search {}x{} {}'.format(n_layers, dim, beam_size)
+        benchmarks.append((name, lambda beam_size=beam_size: _setup(beam_size, dim, n_layers, vocab_size, n_steps)))
+    return benchmarks
+
+
+def _setup(beam_size, dim, n_layers, vocab_size, n_steps):
+    rng = np.random.RandomState(42)
+    inference = quagga.inference
+    quagga.inference = True
+    try:
+        m = lambda nrows, ncols: Connector(Matrix.from_npa((rng.randn(nrows, ncols) / np.sqrt(ncols)).astype(np.float32), device_id=0))
+        lstm_parameters = [(m(dim, 4 * dim), m(dim, 4 * dim), m(1, 4 * dim)) for _ in xrange(n_layers)]
+        engine = RecurrentEngine(m(vocab_size, dim), lstm_parameters, m(dim, vocab_size), m(1, vocab_size), beam_size, device_id=0)
+    finally:
+        quagga.inference = inference
+    decoder = BeamSearchDecoder(engine, beam_size, n_steps, early_termination=False)
+
+    def decode():
+        decoder.decode([0])
+    decode.n_items = beam_size * n_steps
+    return decode
@@ -0,0 +1,542 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+"""
+Benchmarks of :class:`~quagga.matrix.CpuMatrix` operations. Every benchmark
+is a function that takes a :class:`MatrixFactory` and a context and returns
+the operation to be timed. Most operations work on ``batch_size x dim``
+matrices, sequence operations take ``sequence_length`` of them.
+"""
+import numpy as np
+from quagga.matrix import CpuMatrix
+from quagga.context import CpuContext
+from quagga.utils import ContiguousList
+
+
+_benchmarks = []
+
+
+def _benchmark(function):
+    _benchmarks.append(function)
+    return function
+
+
+class MatrixFactory(object):
+    def __init__(self, batch_size, dim, sequence_length, seed=42):
+        self.rng = np.random.RandomState(seed)
+        self.b = batch_size
+        self.d = dim
+        self.T = sequence_length
+
+    def npa(self, nrows=None, ncols=None):
+        nrows = self.b if nrows is None else nrows
+        ncols = self.d if ncols is None else ncols
+        return (4 * self.rng.rand(nrows, ncols) - 2).astype(np.float32)
+
+    def m(self, nrows=None, ncols=None):
+        return CpuMatrix.from_npa(self.npa(nrows, ncols))
+
+    def positive(self, nrows=None, ncols=None):
+        return CpuMatrix.from_npa(np.abs(self.npa(nrows, ncols)))
+
+    def mask(self, ncols=1):
+        return CpuMatrix.from_npa((self.rng.rand(self.b, ncols) < 0.8).astype(np.float32))
+
+    def indices(self, nrows, ncols, high):
+        return CpuMatrix.from_npa(self.rng.randint(high, size=(nrows, ncols)).astype(np.int32))
+
+    def sequence(self, nrows=None, ncols=None):
+        return [self.m(nrows, ncols) for _ in xrange(self.T)]
+
+    def contiguous_sequence(self, nrows=None, ncols=None):
+        nrows = self.b if nrows is None else nrows
+        ncols = self.d if ncols is None else ncols
+        sequence = ContiguousList(self.T, nrows, ncols)
+        for m in sequence:
+            m.npa = self.npa(nrows, ncols)
+        return sequence
+
+
+@_benchmark
+def to_host(f, c):
+    a = f.m()
+    return lambda: a.to_host()
+
+
+@_benchmark
+def assign(f, c):
+    a, out = f.m(), f.m()
+    return lambda: out.assign(c, a)
+
+
+@_benchmark
+def assign_npa(f, c):
+    a, out = f.npa(), f.m()
+    return lambda: out.assign_npa(c, a)
+
+
+@_benchmark
+def fill(f, c):
+    out = f.m()
+    return lambda: out.fill(c, 0.5)
+
+
+@_benchmark
+def fill_mask(f, c):
+    out, mask = f.m(), f.mask()
+    return lambda: out.fill(c, 0.5, mask)
+
+
+@_benchmark
+def slice_columns(f, c):
+    W, out, indices = f.m(f.d, 4 * f.b), f.m(f.d, f.b), f.indices(1, f.b, 4 * f.b)
+    return lambda: W.slice_columns(c, indices, out)
+
+
+@_benchmark
+def add_scaled_columns_slice(f, c):
+    W, a, indices = f.m(f.d, 4 * f.b), f.m(f.d, f.b), f.indices(1, f.b, 4 * f.b)
+    return lambda: W.add_scaled_columns_slice(c, indices, 0.1, a)
+
+
+@_benchmark
+def slice_columns_and_transpose(f, c):
+    W, out, indices = f.m(f.d, 4 * f.b), f.m(), f.indices(1, f.b, 4 * f.b)
+    return lambda: W.slice_columns_and_transpose(c, indices, out)
+
+
+@_benchmark
+def slice_rows(f, c):
+    W, out, indices = f.m(4 * f.b), f.m(), f.indices(f.b, 1, 4 * f.b)
+    return lambda: W.slice_rows(c, indices, out)
+
+
+@_benchmark
+def add_scaled_rows_slice(f, c):
+    W, a, indices = f.m(4 * f.b), f.m(), f.indices(f.b, 1, 4 * f.b)
+    return lambda: W.add_scaled_rows_slice(c, indices, 0.1, a)
+
+
+@_benchmark
+def slice_rows_batch(f, c):
+    W, out, indices = f.m(4 * f.b), f.sequence(), f.indices(f.b, f.T, 4 * f.b)
+    return lambda: W.slice_rows_batch(c, indices, out)
+
+
+@_benchmark
+def slice_rows_batch_contiguous(f, c):
+    W, out, indices = f.m(4 * f.b), f.contiguous_sequence(), f.indices(f.b, f.T, 4 * f.b)
+    return lambda: W.slice_rows_batch(c, indices, out)
+
+
+@_benchmark
+def add_scaled_rows_batch_slice(f, c):
+    W, a, indices = f.m(4 * f.b), f.sequence(), f.indices(f.b, f.T, 4 * f.b)
+    return lambda: W.add_scaled_rows_batch_slice(c, indices, 0.1, a)
+
+
+@_benchmark
+def assign_hstack(f, c):
+    out, matrices = f.m(f.b, 4 * f.d), [f.m() for _ in xrange(4)]
+    return lambda: out.assign_hstack(c, matrices)
+
+
+@_benchmark
+def hsplit(f, c):
+    a, matrices = f.m(f.b, 4 * f.d), [f.m() for _ in xrange(4)]
+    return lambda: a.hsplit(c, matrices)
+
+
+@_benchmark
+def batch_hstack(f, c):
+    x, y, out = f.sequence(), f.sequence(), f.sequence(f.b, 2 * f.d)
+    return lambda: CpuMatrix.batch_hstack(c, x, y, out)
+
+
+@_benchmark
+def batch_hsplit(f, c):
+    a, x, y = f.sequence(f.b, 2 * f.d), f.sequence(), f.sequence()
+    return lambda: CpuMatrix.batch_hsplit(c, a, x, y)
+
+
+@_benchmark
+def batch_hstack_contiguous(f, c):
+    x, y, out = f.contiguous_sequence(), f.contiguous_sequence(), f.contiguous_sequence(f.b, 2 * f.d)
+    return lambda: CpuMatrix.batch_hstack(c, x, y, out)
+
+
+@_benchmark
+def batch_hsplit_contiguous(f, c):
+    a, x, y = f.contiguous_sequence(f.b, 2 * f.d), f.contiguous_sequence(), f.contiguous_sequence()
+    return lambda: CpuMatrix.batch_hsplit(c, a, x, y)
+
+
+@_benchmark
+def assign_vstack(f, c):
+    out, matrices = f.m(4 * f.b), [f.m() for _ in xrange(4)]
+    return lambda: out.assign_vstack(c, matrices)
+
+
+@_benchmark
+def vsplit(f, c):
+    a, matrices = f.m(4 * f.b), [f.m() for _ in xrange(4)]
+    return lambda: a.vsplit(c, matrices)
+
+
+@_benchmark
+def assign_sequential_mean_pooling(f, c):
+    out, matrices = f.m(), f.sequence()
+    return lambda: out.assign_sequential_mean_pooling(c, matrices)
+
+
+@_benchmark
+def assign_sequential_sum_pooling(f, c):
+    out, matrices = f.m(), f.sequence()
+    return lambda: out.assign_sequential_sum_pooling(c, matrices)
+
+
+@_benchmark
+def assign_sequential_sum_pooling_contiguous(f, c):
+    out, matrices = f.m(), f.contiguous_sequence()
+    return lambda: out.assign_sequential_sum_pooling(c, matrices)
+
+
+@_benchmark
+def assign_sequential_weighted_sum(f, c):
+    out, w, matrices = f.m(), f.m(f.b, f.T), f.sequence()
+    return lambda: out.assign_sequential_weighted_sum(c, w, matrices)
+
+
+@_benchmark
+def sequentially_tile(f, c):
+    a, matrices = f.m(), f.sequence()
+    return lambda: CpuMatrix.sequentially_tile(c, a, matrices)
+
+
+@_benchmark
+def sequentially_tile_contiguous(f, c):
+    a, matrices = f.m(), f.contiguous_sequence()
+    return lambda: CpuMatrix.sequentially_tile(c, a, matrices)
+
+
+@_benchmark
+def assign_dL_dpre_a(f, c):
+    out, derivative, a, matrices = f.m(f.b, f.T), f.m(), f.m(f.b, f.T), f.sequence()
+    return lambda: out.assign_dL_dpre_a(c, derivative, a, matrices)
+
+
+@_benchmark
+def add_attention_derivative(f, c):
+    out, dL_dpre_a, matrices = f.m(f.d, 1), f.m(f.b, f.T), f.sequence()
+    return lambda: out.add_attention_derivative(c, dL_dpre_a, matrices)
+
+
+@_benchmark
+def add_attention_tile(f, c):
+    derivative, a, dL_dpre_a, u, matrices = f.m(), f.m(f.b, f.T), f.m(f.b, f.T), f.m(f.d, 1), f.sequence()
+    return lambda: CpuMatrix.add_attention_tile(c, derivative, a, dL_dpre_a, u, matrices)
+
+
+@_benchmark
+def tile(f, c):
+    out, a = f.m(), f.m(1, f.d)
+    return lambda: out.tile(c, 0, a)
+
+
+@_benchmark
+def assign_repeat(f, c):
+    out, a = f.m(f.T * f.b), f.m()
+    return lambda: out.assign_repeat(c, a, f.T, 0)
+
+
+@_benchmark
+def add_repeat_derivative(f, c):
+    out, a = f.m(), f.m(f.T * f.b)
+    return lambda: out.add_repeat_derivative(c, a, f.T, 0)
+
+
+@_benchmark
+def dropout(f, c):
+    a, out, generator = f.m(), f.m(), CpuMatrix.get_random_generator(42)
+    return lambda: a.dropout(c, generator, 0.5, out)
+
+
+@_benchmark
+def add_gaussian_noise(f, c):
+    a, out, generator = f.m(), f.m(), CpuMatrix.get_random_generator(42)
+    return lambda: a.add_gaussian_noise(c, generator, 0.0, 1.0, out)
+
+
+@_benchmark
+def assign_mask_zeros(f, c):
+    out, a, b = f.m(), f.m(), f.mask(f.d)
+    return lambda: out.assign_mask_zeros(c, a, b)
+
+
+@_benchmark
+def add_mask_zeros(f, c):
+    out, a, b = f.m(), f.m(), f.mask(f.d)
+    return lambda: out.add_mask_zeros(c, a, b)
+
+
+@_benchmark
+def assign_masked_addition(f, c):
+    out, mask, a, b = f.m(), f.mask(), f.m(), f.m()
+    return lambda: out.assign_masked_addition(c, mask, a, b)
+
+
+@_benchmark
+def add_hprod_one_minus_mask(f, c):
+    out, mask, a = f.m(), f.mask(), f.m()
+    return lambda: out.add_hprod_one_minus_mask(c, mask, a)
+
+
+@_benchmark
+def mask_column_numbers_row_wise(f, c):
+    out, numbers = f.m(f.b, f.T), f.indices(f.b, 1, f.T)
+    return lambda: out.mask_column_numbers_row_wise(c, numbers)
+
+
+@_benchmark
+def clip(f, c):
+    a, out = f.m(), f.m()
+    return lambda: a.clip(c, -1.0, 1.0, out)
+
+
+@_benchmark
+def tanh(f, c):
+    a, out, derivative = f.m(), f.m(), f.m()
+    return lambda: a.tanh(c, out, derivative)
+
+
+@_benchmark
+def sigmoid(f, c):
+    a, out, derivative = f.m(), f.m(), f.m()
+    return lambda: a.sigmoid(c, out, derivative)
+
+
+@_benchmark
+def tanh_sigm(f, c):
+    a, out, derivative = f.m(f.b, 4 * f.d), f.m(f.b, 4 * f.d), f.m(f.b, 4 * f.d)
+    return lambda: a.tanh_sigm(c, out, derivative, axis=1)
+
+
+@_benchmark
+def lstm_fprop(f, c):
+    x, W, R, b = f.m(), f.m(f.d, 4 * f.d), f.m(f.d, 4 * f.d), f.m(1, 4 * f.d)
+    prev_h, prev_c, mask = f.m(), f.m(), f.mask()
+    zifo, dzifo_dpre_zifo = f.m(f.b, 4 * f.d), f.m(f.b, 4 * f.d)
+    h, cell, tanh_c, dtanh_c_dc = f.m(), f.m(), f.m(), f.m()
+    return lambda: CpuMatrix.lstm_fprop(c, x, W, prev_h, R, b, prev_c, mask, zifo, cell, tanh_c, h,
+                                        dzifo_dpre_zifo, dtanh_c_dc)
+
+
+@_benchmark
+def lstm_bprop(f, c):
+    zifo, dzifo_dpre_zifo = f.m(f.b, 4 * f.d), f.m(f.b, 4 * f.d)
+    tanh_c, dtanh_c_dc, prev_c, mask = f.m(), f.m(), f.m(), f.mask()
+    dL_dc, dL_dh, dL_dprev_c, dL_dprev_h = f.m(), f.m(), f.m(), f.m()
+    dzifo_dpre_zifo_npa = dzifo_dpre_zifo.to_host()
+
+    def operation():
+        # dzifo_dpre_zifo is overwritten with dL/dpre_zifo, so it is restored
+        # to keep values from vanishing into denormals over many calls
+        dzifo_dpre_zifo.assign_npa(c, dzifo_dpre_zifo_npa)
+        CpuMatrix.lstm_bprop(c, zifo, dzifo_dpre_zifo, tanh_c, dtanh_c_dc, prev_c, dL_dc, dL_dh,
+                             mask, dL_dprev_c, dL_dprev_h, 5.0)
+    return operation
+
+
+@_benchmark
+def relu(f, c):
+    a, out, derivative = f.m(), f.m(), f.m()
+    return lambda: a.relu(c, out, derivative)
+
+
+@_benchmark
+def softmax(f, c):
+    a, out = f.m(), f.m()
+    return lambda: a.softmax(c, out)
+
+
+@_benchmark
+def add_softmax_derivative(f, c):
+    out, probs, derivative = f.m(), f.positive(), f.m()
+    return lambda: out.add_softmax_derivative(c, probs, derivative)
+
+
+@_benchmark
+def assign_softmax_ce_derivative(f, c):
+    out, probs, targets = f.m(), f.positive(), f.indices(f.b, 1, f.d)
+    return lambda: out.assign_softmax_ce_derivative(c, probs, targets)
+
+
+@_benchmark
+def add_softmax_ce_derivative(f, c):
+    out, probs, targets = f.m(), f.positive(), f.indices(f.b, 1, f.d)
+    return lambda: out.add_softmax_ce_derivative(c, probs, targets)
+
+
+@_benchmark
+def scale(f, c):
+    a, out = f.m(), f.m()
+    return lambda: a.scale(c, 0.5, out)
+
+
+@_benchmark
+def assign_scaled_addition(f, c):
+    out, a, b = f.m(), f.m(), f.m()
+    return lambda: out.assign_scaled_addition(c, 0.5, a, b)
+
+
+@_benchmark
+def assign_scaled_subtraction(f, c):
+    out, a, b = f.m(), f.m(), f.m()
+    return lambda: out.assign_scaled_subtraction(c, 0.5, a, b)
+
+
+@_benchmark
+def add_scaled_subtraction(f, c):
+    out, a, b = f.m(), f.m(), f.m()
+    return lambda: out.add_scaled_subtraction(c, 0.5, a, b)
+
+
+@_benchmark
+def add_scaled(f, c):
+    out, a = f.m(), f.m()
+    return lambda: out.add_scaled(c, 0.5, a)
+
+
+@_benchmark
+def add(f, c):
+    out, a = f.m(), f.m()
+    return lambda: out.add(c, a)
+
+
+@_benchmark
+def add_row_broadcast(f, c):
+    out, a = f.m(), f.m(1, f.d)
+    return lambda: out.add(c, a)
+
+
+@_benchmark
+def assign_sum(f, c):
+    out, matrices = f.m(), f.sequence()
+    return lambda: out.assign_sum(c, matrices)
+
+
+@_benchmark
+def add_sum(f, c):
+    out, matrices = f.m(), f.sequence()
+    return lambda: out.add_sum(c, matrices)
+
+
+@_benchmark
+def hprod(f, c):
+    # a zero-one multiplier keeps values of the in-place product bounded
+    out, a = f.m(), f.mask(f.d)
+    return lambda: out.hprod(c, a)
+
+
+@_benchmark
+def add_hprod(f, c):
+    out, a, b = f.m(), f.m(), f.m()
+    return lambda: out.add_hprod(c, a, b)
+
+
+@_benchmark
+def add_scaled_hprod(f, c):
+    out, a, b = f.m(), f.m(), f.m()
+    return lambda: out.add_scaled_hprod(c, a, b, 0.9, 0.1)
+
+
+@_benchmark
+def assign_hprod(f, c):
+    out, a, b, d = f.m(), f.m(), f.m(), f.m()
+    return lambda: out.assign_hprod(c, a, b, d)
+
+
+@_benchmark
+def assign_sum_hprod(f, c):
+    out, matrices = f.m(), [f.m() for _ in xrange(11)]
+    return lambda: out.assign_sum_hprod(c, *matrices)
+
+
+@_benchmark
+def assign_hprod_sum(f, c):
+    out, a, b = f.m(f.b, 1), f.m(), f.m()
+    return lambda: out.assign_hprod_sum(c, a, b)
+
+
+@_benchmark
+def add_scaled_div_sqrt(f, c):
+    out, a, b = f.m(), f.m(), f.positive()
+    return lambda: out.add_scaled_div_sqrt(c, 0.1, a, b, 1e-6)
+
+
+@_benchmark
+def assign_dot(f, c):
+    out, a, b = f.m(), f.m(), f.m(f.d, f.d)
+    return lambda: out.assign_dot(c, a, b)
+
+
+@_benchmark
+def add_dot(f, c):
+    out, a, b = f.m(), f.m(), f.m(f.d, f.d)
+    return lambda: out.add_dot(c, a, b)
+
+
+@_benchmark
+def add_dot_TN(f, c):
+    out, a, b = f.m(f.d, f.d), f.m(), f.m()
+    return lambda: out.add_dot(c, a, b, 'T')
+
+
+@_benchmark
+def add_dot_NT(f, c):
+    out, a, b = f.m(), f.m(), f.m(f.d, f.d)
+    return lambda: out.add_dot(c, a, b, 'N', 'T')
+
+
+@_benchmark
+def argmax(f, c):
+    a, out = f.m(), f.indices(f.b, 1, 1)
+    return lambda: a.argmax(c, out)
+
+
+def get_matrix_benchmarks(shapes, sequence_length=10):
+    """
+    Returns a list of ``(name, setup)`` pairs for :func:`~quagga.benchmarks.run`,
+    one for every operation and every ``(batch_size, dim)`` shape.
+    """
+    benchmarks = []
+    for batch_size, dim in shapes:
+        for benchmark in _benchmarks:
+            name = 'matrix.{} {}x{}'.format(benchmark.__name__, batch_size, dim)
+            setup = _get_setup(benchmark, batch_size, dim, sequence_length)
+            benchmarks.append((name, setup))
+    return benchmarks
+
+
+def _get_setup(benchmark, batch_size, dim, sequence_length):
+    def setup():
+        context = CpuContext()
+        operation = benchmark(MatrixFactory(batch_size, dim, sequence_length), context)
+
+        def function():
+            operation()
+            context.synchronize()
+        return function
+    return setup
@@ -0,0 +1,129 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+"""
+Benchmarks of ``fprop`` followed by ``bprop`` of whole models on random
+data. Every model is timed with sequential blocks and with blocks scheduled
+on a thread pool (see :class:`~quagga.BlockScheduler`).
+"""
+import numpy as np
+from functools import partial
+from quagga import Model
+from quagga.utils import List
+from quagga.matrix import Matrix
+from quagga.blocks import DotBlock
+from quagga.blocks import LstmBlock
+from quagga.blocks import RepeatBlock
+from quagga.connector import Connector
+from quagga.blocks import SequencerBlock
+from quagga.blocks import SoftmaxCeBlock
+from quagga.blocks import RowSlicingBlock
+from quagga.blocks import ParameterContainer
+from quagga.blocks import HorizontalStackBlock
+
+
+def get_model_benchmarks(shapes, sequence_length=10, vocab_size=1000):
+    """
+    Returns a list of ``(name, setup)`` pairs for :func:`~quagga.benchmarks.run`:
+    the sequential and the scheduled model for every ``(batch_size, dim)``
+    shape.
+    """
+    benchmarks = []
+    for batch_size, dim in shapes:
+        for scheduled in [False, True]:
+            name = 'model.bidirectional_lstm.{} {}x{}'.format('scheduled' if scheduled else 'sequential', batch_size, dim)
+            setup = partial(_setup, scheduled, batch_size, dim, sequence_length, vocab_size)
+            benchmarks.append((name, setup))
+    return benchmarks
+
+
+def get_bidirectional_lstm(batch_size, dim, sequence_length, vocab_size, seed=42):
+    """
+    Returns the model of ``examples/penn_treebank/bidirectional_lstm.py``:
+    every token is predicted from the forward LSTM state of the preceding
+    tokens and the backward LSTM state of the following ones. The directions
+    do not depend on each other, so they can run concurrently.
+    """
+    rng = np.random.RandomState(seed)
+    init = lambda *shape: lambda: (rng.randn(*shape) / np.sqrt(shape[0])).astype(np.float32)
+    parameters = {'embd_W': init(vocab_size, dim),
+                  'sce_dot_block_W': init(2 * dim, vocab_size),
+                  'sce_dot_block_b': init(1, vocab_size)}
+    for direction in ['fwd', 'bwd']:
+        parameters['lstm_{}_W'.format(direction)] = init(dim, 4 * dim)
+        parameters['lstm_{}_R'.format(direction)] = init(dim, 4 * dim)
+        parameters['lstm_{}_b'.format(direction)] = init(1, 4 * dim)
+        parameters['lstm_{}_c0'.format(direction)] = init(1, dim)
+        parameters['lstm_{}_h0'.format(direction)] = init(1, dim)
+    p = ParameterContainer(**dict((name, {'init': init, 'device_id': 0}) for name, init in parameters.iteritems()))
+    sentences = rng.randint(vocab_size, size=(batch_size, sequence_length)).astype(np.int32)
+    sentence_batch = Connector(Matrix.from_npa(sentences, device_id=0))
+    true_labels = List([Connector(Matrix.from_npa(sentences[:, k:k + 1], device_id=0))
+                        for k in xrange(sequence_length)])
+    mask = List([Connector(Matrix.from_npa((rng.rand(batch_size, 1) < 0.9).astype(np.float32), device_id=0))
+                 for _ in xrange(sequence_length)])
+    for connector in [sentence_batch] + true_labels[:] + mask[:]:
+        connector.fprop()
+
+    seq_embd_block = RowSlicingBlock(p['embd_W'], sentence_batch)
+    blocks = [p, seq_embd_block]
+    h = {}
+    for direction, reverse in [('fwd', False), ('bwd', True)]:
+        # the forward direction reads all tokens but the last one, the
+        # backward direction all tokens but the first one
+        k = 1 if reverse else 0
+        c_repeat_block = RepeatBlock(p['lstm_{}_c0'.format(direction)], sentence_batch.nrows, axis=0, device_id=0)
+        h_repeat_block = RepeatBlock(p['lstm_{}_h0'.format(direction)], sentence_batch.nrows, axis=0, device_id=0)
+        lstm_block = SequencerBlock(block_class=LstmBlock,
+                                    params=[p['lstm_{}_W'.format(direction)],
+                                            p['lstm_{}_R'.format(direction)],
+                                            p['lstm_{}_b'.format(direction)], 5.0],
+                                    sequences=[List(seq_embd_block.output[k:k + sequence_length - 1]),
+                                               List(mask[k:k + sequence_length - 1])],
+                                    output_names=['h'],
+                                    prev_names=['c', 'h'],
+                                    paddings=[c_repeat_block.output, h_repeat_block.output],
+                                    reverse=reverse,
+                                    device_id=0)
+        blocks.extend([c_repeat_block, h_repeat_block, lstm_block])
+        h[direction] = lstm_block.h[:] + [h_repeat_block.output] if reverse else \
+            [h_repeat_block.output] + lstm_block.h[:]
+    seq_hstack = SequencerBlock(block_class=partial(HorizontalStackBlock, share_memory=True),
+                                params=[],
+                                sequences=[List(h['fwd']), List(h['bwd'])],
+                                output_names=['output'],
+                                device_id=0)
+    seq_dot_block = SequencerBlock(block_class=DotBlock,
+                                   params=[p['sce_dot_block_W'], p['sce_dot_block_b']],
+                                   sequences=[seq_hstack.output],
+                                   output_names=['output'],
+                                   device_id=0)
+    seq_sce_block = SequencerBlock(block_class=SoftmaxCeBlock,
+                                   params=[],
+                                   sequences=[seq_dot_block.output, true_labels, mask],
+                                   device_id=0)
+    blocks.extend([seq_hstack, seq_dot_block, seq_sce_block])
+    return Model(blocks)
+
+
+def _setup(scheduled, batch_size, dim, sequence_length, vocab_size):
+    model = get_bidirectional_lstm(batch_size, dim, sequence_length, vocab_size)
+
+    def fprop_bprop():
+        model.fprop()
+        model.bprop()
+    if scheduled:
+        model.schedule_blocks(fprop_bprop)
+    return fprop_bprop
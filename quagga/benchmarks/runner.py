@@ -0,0 +1,184 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import re
+import sys
+import json
+import time
+import quagga
+import platform
+import traceback
+import numpy as np
+from timeit import default_timer
+
+
+def measure(function, min_run_time=0.2, repeats=5):
+    """
+    Times ``function`` calls.
+
+    The function is called once to warm up caches and lazily allocated
+    buffers, then the number of calls per repeat is doubled until a repeat
+    takes at least ``min_run_time / repeats`` seconds.
+
+    Returns
+    -------
+    dict
+        ``min`` and ``median`` time of one call in seconds over repeats,
+        the number of calls per repeat and the number of repeats
+    """
+    function()
+    number = 1
+    while True:
+        elapsed = _time(function, number)
+        if elapsed >= min_run_time / repeats:
+            break
+        number *= 2
+    times = [elapsed / number]
+    times.extend(_time(function, number) / number for _ in xrange(repeats - 1))
+    return {'min': min(times),
+            'median': float(np.median(times)),
+            'number': number,
+            'repeats': repeats}
+
+
+def _time(function, number):
+    t = default_timer()
+    for _ in xrange(number):
+        function()
+    return default_timer() - t
+
+
+def run(benchmarks, pattern=None, min_run_time=0.2, repeats=5, verbose=True):
+    """
+    Runs benchmarks on the CPU backend.
+
+    Parameters
+    ----------
+    benchmarks : list of (str, callable)
+        Pairs of a benchmark name and a setup function that returns the
+        function to be timed. If the function has ``n_items`` attribute,
+        the number of items processed by one call, the throughput is
+        reported as ``items_per_second``
+    pattern : str
+        Regular expression, only benchmarks which names match it are run
+    min_run_time : float
+        Approximate time in seconds spent on timing of one benchmark
+    repeats : int
+    verbose : bool
+        Print a line for every benchmark
+
+    Returns
+    -------
+    dict
+        ``meta`` describes the machine and the run, ``results`` maps
+        benchmark names to :func:`measure` results and ``errors`` maps
+        names of benchmarks that failed to their tracebacks
+    """
+    if quagga.cpu_context_workers:
+        raise ValueError('Benchmarks require synchronous contexts, '
+                         'set `quagga.cpu_context_workers` to 0!')
+    processor_type = quagga.processor_type
+    quagga.processor_type = 'cpu'
+    results = {}
+    errors = {}
+    try:
+        for name, setup in benchmarks:
+            if pattern and not re.search(pattern, name):
+                continue
+            try:
+                function = setup()
+                results[name] = measure(function, min_run_time, repeats)
+                if hasattr(function, 'n_items'):
+                    results[name]['items_per_second'] = function.n_items / results[name]['min']
+            except Exception:
+                errors[name] = traceback.format_exc()
+                if verbose:
+                    print '{:60} {:>12}'.format(name, 'error')
+                continue
+            if verbose:
+                line = '{:60} {:12.3f} us'.format(name, results[name]['min'] * 1e6)
+                if 'items_per_second' in results[name]:
+                    line += ' {:12.1f} /s'.format(results[name]['items_per_second'])
+                print line
+                sys.stdout.flush()
+    finally:
+        quagga.processor_type = processor_type
+    meta = {'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'node': platform.node(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'min_run_time': min_run_time,
+            'repeats': repeats}
+    return {'meta': meta, 'results': results, 'errors': errors}
+
+
+def save(run_results, path):
+    with open(path, 'w') as f:
+        json.dump(run_results, f, indent=2, sort_keys=True)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(base_results, new_results, threshold=0.1, statistic='min'):
+    """
+    Compares two runs of the same benchmarks.
+
+    Parameters
+    ----------
+    base_results : dict
+        Result of :func:`run` (or :func:`load`) for the reference code
+    new_results : dict
+        Result of :func:`run` (or :func:`load`) for the changed code
+    threshold : float
+        Relative slowdown above which a benchmark is flagged as a regression
+        (and relative speedup above which it is flagged as an improvement)
+    statistic : str
+        'min' or 'median'
+
+    Returns
+    -------
+    list of (str, float, float, float, str)
+        Benchmark name, base time, new time, ratio ``new / base`` and
+        one of 'regression', 'improvement' or '' for every benchmark that
+        is present in both runs
+    """
+    base, new = base_results['results'], new_results['results']
+    comparison = []
+    for name in sorted(set(base) & set(new)):
+        base_time = base[name][statistic]
+        new_time = new[name][statistic]
+        ratio = new_time / base_time
+        if ratio > 1.0 + threshold:
+            flag = 'regression'
+        elif ratio < 1.0 / (1.0 + threshold):
+            flag = 'improvement'
+        else:
+            flag = ''
+        comparison.append((name, base_time, new_time, ratio, flag))
+    return comparison
+
+
+def print_comparison(comparison, only_flagged=False):
+    print '{:60} {:>12} {:>12} {:>8}'.format('benchmark', 'base, us', 'new, us', 'ratio')
+    for name, base_time, new_time, ratio, flag in comparison:
+        if only_flagged and not flag:
+            continue
+        print '{:60} {:12.3f} {:12.3f} {:8.3f} {}'.\
+            format(name, base_time * 1e6, new_time * 1e6, ratio, flag)
@@ -0,0 +1,88 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+"""
+Benchmarks of the scatter-add of embedding derivatives into a
+``vocab_size x dim`` matrix: ``add_scaled_rows_batch_slice`` adds a whole
+``batch_size x sequence_length`` batch of rows, ``add_scaled_rows_slice``
+one time step of it. Indices follow a Zipf-like distribution, which gives
+realistic rates of duplicates. ``n_items`` is the number of added rows.
+
+With ``reference=True`` the same benchmarks time the per-index python
+loops that the vectorized kernels replaced, so that comparing such a run
+with a normal one shows the speedup:
+
+    python -m quagga.benchmarks run -k scatter_add --reference -o loop.json
+    python -m quagga.benchmarks run -k scatter_add -o vector.json
+    python -m quagga.benchmarks compare loop.json vector.json
+"""
+import numpy as np
+from quagga.matrix import CpuMatrix
+from quagga.context import CpuContext
+
+
+def get_scatter_add_benchmarks(vocab_sizes, batch_shapes, dim=64, reference=False):
+    """
+    Returns a list of ``(name, setup)`` pairs for :func:`~quagga.benchmarks.run`,
+    two for every vocabulary size and ``(batch_size, sequence_length)``
+    shape. If ``reference`` is True the benchmarks time the python loops
+    instead of the ``CpuMatrix`` methods.
+    """
+    benchmarks = []
+    for vocab_size in vocab_sizes:
+        for batch_size, sequence_length in batch_shapes:
+            for operation in ['add_scaled_rows_batch_slice', 'add_scaled_rows_slice']:
+                name = 'scatter_add.{} {} {}x{}x{}'.format(operation, vocab_size, batch_size, sequence_length, dim)
+                setup = lambda operation=operation, vocab_size=vocab_size, batch_size=batch_size, \
+                    sequence_length=sequence_length: _setup(operation, vocab_size, batch_size, sequence_length, dim, reference)
+                benchmarks.append((name, setup))
+    return benchmarks
+
+
+def _setup(operation, vocab_size, batch_size, sequence_length, dim, reference):
+    rng = np.random.RandomState(42)
+    context = CpuContext()
+    W = CpuMatrix.from_npa(rng.rand(vocab_size, dim).astype(np.float32))
+    indices = rng.zipf(1.2, size=(batch_size, sequence_length)) % vocab_size
+    indices = CpuMatrix.from_npa(indices.astype(np.int32))
+    if operation == 'add_scaled_rows_slice':
+        indices = CpuMatrix.from_npa(indices.npa[:, :1])
+        a = CpuMatrix.from_npa(rng.rand(batch_size, dim).astype(np.float32))
+        n_items = batch_size
+        loop = _loop_add_scaled_rows_slice
+    else:
+        a = [CpuMatrix.from_npa(rng.rand(batch_size, dim).astype(np.float32)) for _ in xrange(sequence_length)]
+        n_items = batch_size * sequence_length
+        loop = _loop_add_scaled_rows_batch_slice
+
+    if reference:
+        function = lambda: loop(W, indices, 0.1, a)
+    else:
+        def function():
+            getattr(W, operation)(context, indices, 0.1, a)
+            context.synchronize()
+    function.n_items = n_items
+    return function
+
+
+def _loop_add_scaled_rows_batch_slice(W, rows_indxs, alpha, dense_matrices):
+    for k, m in enumerate(dense_matrices):
+        for i, idx in enumerate(rows_indxs.npa[:, k]):
+            W.npa[idx] += alpha * m.npa[i]
+
+
+def _loop_add_scaled_rows_slice(W, row_indxs, alpha, a):
+    for i, idx in enumerate(row_indxs.npa.flatten()):
+        W.npa[idx] += alpha * a.npa[i]
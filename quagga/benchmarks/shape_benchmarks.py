@@ -0,0 +1,85 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+"""
+Benchmarks of shape propagation. A data block changes the number of rows
+and columns of its output every batch, the change is propagated to shapes
+and views of every matrix of the model.
+"""
+import numpy as np
+from itertools import cycle
+from quagga.utils import List
+from quagga.matrix import Matrix
+from quagga.matrix import ShapeElement
+from quagga.connector import Connector
+from quagga.blocks import LstmBlock
+from quagga.blocks import RepeatBlock
+from quagga.blocks import SequencerBlock
+from quagga.blocks import RowSlicingBlock
+
+
+def build_lstm_graph(batch_size, dim, sequence_length, n_layers, vocab_size=64, seed=42):
+    """
+    Builds an embedding followed by ``n_layers`` of LSTMs over a batch of
+    ``sequence_length`` tokens, in the same way as the char_lm example.
+
+    Returns
+    -------
+    (Connector, list)
+        The data connector with token indices and the list of blocks
+    """
+    rng = np.random.RandomState(seed)
+    m = lambda nrows, ncols: Connector(Matrix.from_npa((rng.randn(nrows, ncols) / np.sqrt(ncols)).astype(np.float32), device_id=0), 0)
+    x = Connector(Matrix.empty(batch_size, sequence_length, 'int', 0))
+    _mask = Matrix.empty(x.nrows, x.ncols, 'float', 0)
+    mask = List([Connector(_mask[:, i]) for i in xrange(sequence_length)], x.ncols)
+    embedding = RowSlicingBlock(m(vocab_size, dim), x)
+    blocks = [embedding]
+    h = embedding.output
+    for _ in xrange(n_layers):
+        c_repeat = RepeatBlock(m(1, dim), x.nrows, axis=0, device_id=0)
+        h_repeat = RepeatBlock(m(1, dim), x.nrows, axis=0, device_id=0)
+        lstm = SequencerBlock(block_class=LstmBlock,
+                              params=[m(dim, 4 * dim), m(dim, 4 * dim), m(1, 4 * dim), 5.0],
+                              sequences=[h, mask],
+                              output_names=['h'],
+                              prev_names=['c', 'h'],
+                              paddings=[c_repeat.output, h_repeat.output])
+        blocks.extend([c_repeat, h_repeat, lstm])
+        h = lstm.h
+    return x, blocks
+
+
+def get_shape_benchmarks(batch_size=32, dim=32, sequence_length=400, n_layers=5):
+    """
+    Returns a list of ``(name, setup)`` pairs for :func:`~quagga.benchmarks.run`
+    that time the per-batch reshape of the data connector of
+    :func:`build_lstm_graph`.
+    """
+    name = 'shape.lstm_graph_reshape {}x{}'.format(sequence_length, n_layers)
+
+    def setup():
+        x, blocks = build_lstm_graph(batch_size, dim, sequence_length, n_layers)
+        shapes = cycle([(batch_size // 2, sequence_length // 2), (batch_size, sequence_length)])
+
+        def reshape():
+            nrows, ncols = next(shapes)
+            with ShapeElement.batch_update():
+                x.nrows = nrows
+                x.ncols = ncols
+        # blocks must outlive the benchmark
+        reshape.blocks = blocks
+        return reshape
+    return [(name, setup)]
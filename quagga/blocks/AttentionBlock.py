@@ -46,11 +46,9 @@ class AttentionBlock(object):
         self.a = Matrix.empty(matrices[0].nrows, matrices.length,
                               'float', device_id)
         self.dL_dpre_a = Matrix.empty_like(self.a)
-        self.a_cols = [self.a[:, i] for i in xrange(len(self.matrices))]
 
     def fprop(self):
-        for i in xrange(self.length):
-            self.a_cols[i].assign_dot(self.context, self.matrices[i], self.u)
+        self.a.assign_sequential_dot(self.context, self.matrices[:self.length], self.u)
         if hasattr(self, 'mask'):
             self.a.fill(self.context, -3.402823466e+38, self.mask, 0.0)
         self.a.softmax(self.context, self.a)
@@ -44,4 +44,4 @@ class ColSlicingBlock(object):
 
     def bprop(self):
         if hasattr(self, 'dL_dW'):
-            self.dL_dW.add_columns_slice(self.col_indexes, self.output.bprop())
\ No newline at end of file
+            self.dL_dW.add_columns_slice(self.context, self.col_indexes, self.output.bprop())
\ No newline at end of file
@@ -27,6 +27,7 @@ class LstmBlock(object):
     W
     R
     b
+        Can be None for the cell without bias
     grad_clipping
     x
     mask
@@ -39,6 +40,10 @@ class LstmBlock(object):
     Returns
     -------
     """
+    # intermediate matrices that are used only by the block itself and can
+    # be recalculated by `recompute`
+    recomputable_attributes = ['zifo', 'tanh_c', '_dzifo_dpre_zifo', 'dL_dpre_zifo', '_dtanh_c_dc']
+
     def __init__(self, W, R, b, grad_clipping, x, mask, prev_c, prev_h, device_id=None):
         self.f_context = Context(device_id)
         device_id = self.f_context.device_id
@@ -52,7 +57,9 @@ class LstmBlock(object):
             self.R_b_context = Context(device_id)
         else:
             self.R = R.register_usage(device_id)
-        if b.bpropagable:
+        if b is None:
+            self.b = None
+        elif b.bpropagable:
             self.b, self.dL_db = b.register_usage(device_id, device_id)
             self.b_b_context = Context(device_id)
         else:
@@ -67,7 +74,6 @@ class LstmBlock(object):
             self.mask = mask.register_usage(device_id)
         if prev_c.bpropagable:
             self.prev_c, self.dL_dprev_c = prev_c.register_usage(device_id, device_id)
-            self.prev_c_b_context = Context(device_id)
         else:
             self.prev_c = prev_c.register_usage(device_id)
         if prev_h.bpropagable:
@@ -84,10 +90,6 @@ class LstmBlock(object):
         batch_size = self.x.nrows
 
         self.zifo = Matrix.empty(batch_size, 4 * dim, device_id=device_id)
-        self.z = self.zifo[:, 0*dim:1*dim]
-        self.i = self.zifo[:, 1*dim:2*dim]
-        self.f = self.zifo[:, 2*dim:3*dim]
-        self.o = self.zifo[:, 3*dim:4*dim]
         self.c = Matrix.empty_like(self.prev_c, device_id)
         self.c = Connector(self.c, device_id if self.learning else None)
         self.tanh_c = Matrix.empty_like(self.c, device_id)
@@ -95,16 +97,9 @@ class LstmBlock(object):
         self.h = Connector(self.h, device_id if self.learning else None)
 
         if self.learning:
+            # dL/dpre_zifo overwrites dzifo/dpre_zifo during the backward step
             self._dzifo_dpre_zifo = Matrix.empty_like(self.zifo)
-            self.dz_dpre_z = self._dzifo_dpre_zifo[:, 0*dim:1*dim]
-            self.di_dpre_i = self._dzifo_dpre_zifo[:, 1*dim:2*dim]
-            self.df_dpre_f = self._dzifo_dpre_zifo[:, 2*dim:3*dim]
-            self.do_dpre_o = self._dzifo_dpre_zifo[:, 3*dim:4*dim]
             self.dL_dpre_zifo = self._dzifo_dpre_zifo
-            self.dL_dpre_z = self.dz_dpre_z
-            self.dL_dpre_i = self.di_dpre_i
-            self.dL_dpre_f = self.df_dpre_f
-            self.dL_dpre_o = self.do_dpre_o
             self._dtanh_c_dc = Matrix.empty_like(self.c)
 
     @property
@@ -117,56 +112,55 @@ class LstmBlock(object):
         if self.learning:
             return self._dtanh_c_dc
 
+    @property
+    def b_contexts(self):
+        names = ['b_context', 'W_b_context', 'R_b_context', 'b_b_context', 'x_b_context', 'prev_h_b_context']
+        return [getattr(self, name) for name in names if hasattr(self, name)]
+
     def fprop(self):
         # zifo = tanh_sigm(x[t] * W + h[t-1] * R + b)
-        self.zifo.assign_dot(self.f_context, self.x, self.W)
-        self.zifo.add_dot(self.f_context, self.prev_h, self.R)
-        self.zifo.add(self.f_context, self.b)
-        self.zifo.tanh_sigm(self.f_context, self.zifo, self.dzifo_dpre_zifo, axis=1)
-
         # c[t] = i[t] .* z[t] + f[t] .* c[t-1]
         # h[t] = o[t] .* tanh(c[t])
-        self.c.assign_sum_hprod(self.f_context, self.i, self.z, self.f, self.prev_c)
-        self.c.tanh(self.f_context, self.tanh_c, self.dtanh_c_dc)
-        self.h.assign_hprod(self.f_context, self.o, self.tanh_c)
-        if hasattr(self, 'mask'):
-            # s[t] = mask .* s[t] + (1 - mask) .* s[t-1]
-            self.c.assign_masked_addition(self.f_context, self.mask, self.c, self.prev_c)
-            self.h.assign_masked_addition(self.f_context, self.mask, self.h, self.prev_h)
+        # s[t] = mask .* s[t] + (1 - mask) .* s[t-1]
+        Matrix.lstm_fprop(self.f_context, self.x, self.W, self.prev_h, self.R,
+                          self.b, self.prev_c, getattr(self, 'mask', None),
+                          self.zifo, self.c, self.tanh_c, self.h,
+                          self.dzifo_dpre_zifo, self.dtanh_c_dc)
         self.c.fprop()
         self.h.fprop()
 
+    def recompute(self, c, h):
+        """
+        Recalculates `recomputable_attributes` the same way as `fprop` does.
+        The block outputs may still be in use, so the new cell state and
+        hidden state are written into `c` and `h` matrices instead.
+        """
+        Matrix.lstm_fprop(self.f_context, self.x, self.W, self.prev_h, self.R,
+                          self.b, self.prev_c, getattr(self, 'mask', None),
+                          self.zifo, c, self.tanh_c, h,
+                          self.dzifo_dpre_zifo, self.dtanh_c_dc)
+
     def bprop(self):
         dL_dc = self.c.backward_matrix
         dL_dh = self.h.backward_matrix
-        if hasattr(self, 'mask'):
-            # dL/ds[t-1] = (1 - mask) .* dL/ds[t]
-            # dL/ds[t] = mask .* dL/ds[t]
-            if hasattr(self, 'dL_dprev_c'):
-                self.dL_dprev_c.add_hprod_one_minus_mask(self.prev_c_b_context, self.mask, dL_dc)
-            dL_dc.hprod(self.prev_c_b_context, self.mask)
-            if hasattr(self, 'dL_dprev_h'):
-                self.dL_dprev_h.add_hprod_one_minus_mask(self.prev_h_b_context, self.mask, dL_dh)
-            dL_dh.hprod(self.prev_h_b_context, self.mask)
-        # dL/dc[t] = dL[t+1]/dc[t] + dL/dh[t] .* o[t] .* dtanh(c[t])/dc[t]
-        dL_dc.add_hprod(self.b_context, dL_dh, self.o, self.dtanh_c_dc)
-
         # self.dzifo_dpre_zifo was calculated in self.f_context,
         # now we have to explicitly wait it in context self.b_context, because
         # self.dx_dpre_x does not have proper last_modif_context
         self.b_context.wait(self.f_context)
+        # dL/ds[t-1] = (1 - mask) .* dL/ds[t]
+        # dL/ds[t] = mask .* dL/ds[t]
+        # dL/dc[t] = dL[t+1]/dc[t] + dL/dh[t] .* o[t] .* dtanh(c[t])/dc[t]
         # dL/dpre_o[t] = dL/dh[t] .* tanh(c[t]) .* do[t]/dpre_o[t]
         # dL/dpre_f[t] = dL/dc[t] .* c[t-1] .* df[t]/dpre_f[t]
         # dL/dpre_i[t] = dL/dc[t] .* z[t] .* di[t]/dpre_i[t]
         # dL/dpre_z[t] = dL/dc[t] .* i[t] .* dz[t]/dpre_z[t]
-        self.dL_dpre_o.assign_hprod(self.b_context, dL_dh, self.tanh_c, self.do_dpre_o)
-        self.dL_dpre_f.assign_hprod(self.b_context, dL_dc, self.prev_c, self.df_dpre_f)
-        self.dL_dpre_i.assign_hprod(self.b_context, dL_dc, self.z, self.di_dpre_i)
-        self.dL_dpre_z.assign_hprod(self.b_context, dL_dc, self.i, self.dz_dpre_z)
-        if self.grad_clipping:
-            self.dL_dpre_zifo.clip(self.b_context, -self.grad_clipping, self.grad_clipping)
-        else:
-            self.dL_dpre_zifo.last_modif_context = self.b_context
+        # dL/dc[t-1] = f[t] .* dL/dc[t]
+        Matrix.lstm_bprop(self.b_context, self.zifo, self.dL_dpre_zifo,
+                          self.tanh_c, self.dtanh_c_dc, self.prev_c,
+                          dL_dc, dL_dh, getattr(self, 'mask', None),
+                          getattr(self, 'dL_dprev_c', None),
+                          getattr(self, 'dL_dprev_h', None),
+                          self.grad_clipping)
         if hasattr(self, 'dL_dW'):
             # dL_dW += x[t].T * dL/dpre_zifo[t]
             self.dL_dW.add_dot(self.W_b_context, self.x, self.dL_dpre_zifo, 'T')
@@ -179,9 +173,6 @@ class LstmBlock(object):
         if hasattr(self, 'dL_dx'):
             # dL/dx[t] = dL/dpre_zifo[t] * W.T
             self.dL_dx.add_dot(self.x_b_context, self.dL_dpre_zifo, self.W, 'N', 'T')
-        if hasattr(self, 'dL_dprev_c'):
-            # dL/dc[t-1] = f[t] .* dL/dc[t]
-            self.dL_dprev_c.add_hprod(self.prev_c_b_context, self.f, dL_dc)
         if hasattr(self, 'dL_dprev_h'):
             # dL/dh[t-1] = dL/dpre_zifo[t] * R.T
-            self.dL_dprev_h.add_dot(self.prev_h_b_context, self.dL_dpre_zifo, self.R, 'N', 'T')
\ No newline at end of file
+            self.dL_dprev_h.add_dot(self.prev_h_b_context, self.dL_dpre_zifo, self.R, 'N', 'T')
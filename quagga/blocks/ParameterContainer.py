@@ -13,27 +13,108 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ----------------------------------------------------------------------------
+import quagga
+from collections import defaultdict
 from quagga.matrix import Matrix
+from quagga.context import Context
 from quagga.connector import Connector
 
 
 class ParameterContainer(object):
+    """
+    Creates parameters from their definitions. A definition is a dict with
+    the ``init`` function that returns a numpy array, ``device_id`` and
+    optional ``trainable`` and ``flat`` flags.
+
+    Trainable parameters marked as ``flat`` are placed together with their
+    gradients into one contiguous ``(n, 1)`` matrix per device, so that the
+    individual parameters become views of it. Connectors of these matrices
+    are stored in ``flat_parameters`` by device id and can be passed to a
+    learning step instead of the individual parameters: then the update of
+    all of them is done by a few operations over the whole storage.
+
+    In the inference mode (see ``quagga.inference``) all parameters are
+    created as non-trainable ones.
+    """
     def __init__(self, **kwargs):
         self.parameters = {}
         self.trainable_parameters = {}
+        self.flat_parameters = {}
+        flat_definitions = defaultdict(list)
         for name, definition in kwargs.iteritems():
             device_id = definition['device_id']
+            trainable = 'trainable' not in definition or definition['trainable']
+            trainable = trainable and not quagga.inference
+            if trainable and definition.get('flat'):
+                flat_definitions[device_id].append((name, definition['init']()))
+                continue
             matrix = Matrix.from_npa(definition['init'](), device_id=device_id)
-            if 'trainable' not in definition or definition['trainable']:
+            if trainable:
                 param = Connector(matrix, device_id)
                 self.trainable_parameters[name] = param
             else:
                 param = Connector(matrix)
             self.parameters[name] = param
+        for device_id, definitions in flat_definitions.iteritems():
+            self.flat_parameters[device_id] = self._create_flat_parameters(device_id, sorted(definitions))
+
+    def _create_flat_parameters(self, device_id, definitions):
+        nelems = sum(a.size for _, a in definitions)
+        flat_matrix = Matrix.empty(nelems, 1, device_id=device_id)
+        flat_dL_dmatrix = Matrix.empty(nelems, 1, device_id=device_id)
+        context = Context(device_id)
+        views = []
+        offset = 0
+        for name, a in definitions:
+            nrows, ncols = a.shape
+            matrix = flat_matrix.contiguous_view(offset, nrows, ncols)
+            matrix.assign_npa(context, a)
+            dL_dmatrix = flat_dL_dmatrix.contiguous_view(offset, nrows, ncols)
+            param = Connector(matrix, device_id, dL_dmatrix)
+            self.trainable_parameters[name] = param
+            self.parameters[name] = param
+            views.append((param, dL_dmatrix))
+            offset += a.size
+        # host arrays must stay alive until they are transferred
+        context.synchronize()
+        return _FlatConnector(flat_matrix, flat_dL_dmatrix, views)
 
     def __getitem__(self, item):
         return self.parameters[item]
 
     def fprop(self):
+        for flat_param in self.flat_parameters.itervalues():
+            flat_param.propagate_contexts()
         for param in self.parameters.itervalues():
-            param.fprop()
\ No newline at end of file
+            param.fprop()
+
+
+class _FlatConnector(Connector):
+    """
+    Connector of the flat storage of parameters. Its backward matrix is
+    ready when gradients of all the parameters are.
+    """
+    def __init__(self, f_matrix, b_matrix, views):
+        super(_FlatConnector, self).__init__(f_matrix, f_matrix.device_id, b_matrix)
+        self.views = views
+
+    def propagate_contexts(self):
+        """
+        Makes the parameters wait for the updates of the flat storage and
+        their gradients to be zeroed after the flat gradient is used.
+        """
+        f_matrix = self._f_matrices[self._fo_device_id]
+        b_matrix = self._b_matrices[self._bu_device_id]
+        for param, dL_dparam in self.views:
+            param.last_modif_context = f_matrix.last_modif_context
+            dL_dparam.last_usage_context = b_matrix.last_usage_context
+
+    def bprop(self):
+        b_matrix = self._b_matrices[self._bu_device_id]
+        context = self.context[self._bu_device_id]
+        # bprop of a parameter accumulates derivatives from other devices
+        # and sparse derivatives into its view
+        contexts = [param.backward_matrix.last_modif_context for param, _ in self.views]
+        context.wait(*[e for e in contexts if e is not None])
+        b_matrix.last_modif_context = context
+        return b_matrix
@@ -14,6 +14,7 @@
 # limitations under the License.
 # ----------------------------------------------------------------------------
 from quagga.utils import List
+from quagga.utils import ContiguousList
 from quagga.matrix import Matrix
 from quagga.context import Context
 from quagga.connector import Connector
@@ -34,12 +35,9 @@ class RowSlicingBlock(object):
             self.W = W.register_usage(device_id)
         self.row_indexes = row_indexes.register_usage(device_id)
         if row_indexes.ncols > 1:
-            self.output = []
-            for i in xrange(row_indexes.ncols):
-                output = Matrix.empty(row_indexes.nrows, W.ncols, device_id=device_id)
-                output = Connector(output, device_id if learning else None)
-                self.output.append(output)
-            self.output = List(self.output, row_indexes.ncols)
+            wrapper = lambda output: Connector(output, device_id if learning else None)
+            self.output = ContiguousList(int(row_indexes.ncols), row_indexes.nrows, W.ncols,
+                                         device_id=device_id, length=row_indexes.ncols, wrapper=wrapper)
         else:
             output = Matrix.empty(row_indexes.nrows, W.ncols, device_id=device_id)
             self.output = Connector(output, device_id if learning else None)
@@ -57,7 +55,4 @@ class RowSlicingBlock(object):
                 update_method = self.dL_dW.add_rows_batch_slice
             else:
                 update_method = self.dL_dW.add_rows_slice
-            if self.dense:
-                update_method(self.context, self.row_indexes, self.output.bprop())
-            else:
-                update_method(self.row_indexes, self.output.bprop())
\ No newline at end of file
+            update_method(self.context, self.row_indexes, self.output.bprop())
\ No newline at end of file
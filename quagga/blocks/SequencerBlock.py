@@ -13,9 +13,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ----------------------------------------------------------------------------
+import math
 from itertools import izip
+from itertools import groupby
 
 from quagga.utils import List
+from quagga.matrix import Matrix
 from quagga.context import Context
 
 
@@ -30,6 +33,16 @@ class SequencerBlock(object):
     prev_names
     paddings
     reverse
+    checkpoint_interval : int or 'sqrt' or None
+        Enables activation checkpointing. Blocks are split into segments of
+        ``checkpoint_interval`` consecutive time steps (``sqrt`` of the
+        maximum sequence length for 'sqrt'), blocks at the same position of
+        different segments share their intermediate matrices and states
+        (`prev_names`), except for the states of the last block of a
+        segment and states that are outputs. During `bprop` the
+        intermediate matrices and states of a segment are recalculated
+        right before its backward step. ``block_class`` must define
+        `recomputable_attributes`, `recompute` and `b_contexts`.
     device_id : int
         Defines the device's id on which the computation will take place
 
@@ -37,11 +50,22 @@ class SequencerBlock(object):
     Returns
     -------
     """
-    def __init__(self, block_class, params, sequences, output_names=None, prev_names=None, paddings=None, reverse=False, device_id=None):
+    def __init__(self, block_class, params, sequences, output_names=None, prev_names=None, paddings=None, reverse=False, checkpoint_interval=None, device_id=None):
         context = Context(device_id)
         device_id = context.device_id
         self.reverse = reverse
         self.prev_names = prev_names
+        if checkpoint_interval:
+            if not prev_names or not hasattr(block_class, 'recompute'):
+                raise ValueError('Checkpointing requires a recurrent block '
+                                 'that supports recomputation!')
+            if checkpoint_interval == 'sqrt':
+                max_length = len(getattr(sequences[0], 'elements', sequences[0]))
+                checkpoint_interval = int(math.ceil(math.sqrt(max_length)))
+            # matrices that receive recomputed states that are not shared,
+            # one set per position in a segment
+            self._recomputed_states = []
+        self.checkpoint_interval = checkpoint_interval
         if prev_names and reverse:
             self.temp_prev = []
             self.dL_dtemp_prev = []
@@ -64,6 +88,8 @@ class SequencerBlock(object):
                 self.blocks.append(block_class(*args, device_id=device_id))
             except TypeError:
                 self.blocks.append(block_class(*args))
+            if checkpoint_interval:
+                self._share_intermediates(len(self.blocks) - 1, output_names)
             for i, output_name in enumerate(output_names):
                 outputs[i].append(getattr(self.blocks[-1], output_name))
         for output_name, output in izip(output_names, outputs):
@@ -101,12 +127,63 @@ class SequencerBlock(object):
             generator = xrange(start_k, max_input_sequence_len)
         else:
             generator = xrange(self._length)
+        if self.checkpoint_interval:
+            # intermediate matrices hold values of the last processed segment
+            segments = [list(segment) for _, segment in groupby(generator, lambda k: k // self.checkpoint_interval)]
+            for i, segment in enumerate(reversed(segments)):
+                if i:
+                    self.recompute(segment)
+                for k in reversed(segment):
+                    self.blocks[k].bprop()
+            return
         # If there was no prev_names order is not important.
         # By not reversing it we can gain speed up.
         generator = reversed(generator) if self.prev_names else generator
         for k in generator:
             self.blocks[k].bprop()
 
+    def _share_intermediates(self, k, output_names):
+        block = self.blocks[k]
+        position = k % self.checkpoint_interval
+        if position == self.checkpoint_interval - 1:
+            # states of the last block of a segment are the checkpoint that
+            # the next segment is recomputed from
+            shared_names = []
+        else:
+            shared_names = [name for name in self.prev_names if name not in output_names]
+        if k == position:
+            states = {}
+            for name in self.prev_names:
+                if name not in shared_names:
+                    states[name] = Matrix.empty_like(getattr(block, name), block.f_context.device_id)
+            self._recomputed_states.append(states)
+        else:
+            first_segment_block = self.blocks[position]
+            for name in block.recomputable_attributes + shared_names:
+                if hasattr(block, name):
+                    setattr(block, name, getattr(first_segment_block, name))
+
+    def recompute(self, segment):
+        """
+        Recalculates intermediate matrices of the blocks from `segment`.
+        """
+        for k in segment:
+            block = self.blocks[k]
+            next_segment_k = k + self.checkpoint_interval
+            # matrices are shared with the blocks from the next segment, they
+            # can't be overwritten before their backward steps are done
+            for next_k in [next_segment_k, next_segment_k + 1]:
+                if next_k < len(self.blocks):
+                    block.f_context.wait(*self.blocks[next_k].b_contexts)
+            states = dict(self._recomputed_states[k % self.checkpoint_interval])
+            for name in self.prev_names:
+                if name not in states:
+                    # the shared state is recomputed in place and its
+                    # derivative is cleared as `fprop` of the block does
+                    states[name] = getattr(block, name)
+                    states[name].fprop()
+            block.recompute(**states)
+
     def connect_block_with_padding(self, k):
         for name in self.prev_names:
             name = 'prev_' + name
@@ -17,15 +17,20 @@ from itertools import izip
 from itertools import chain
 
 from quagga.utils import List
+from quagga.utils import ContiguousList
 from quagga.matrix import Matrix
 from quagga.context import Context
 from quagga.connector import Connector
 
 
 class SequentialHorizontalStackBlock(object):
-    def __init__(self, x_sequence, y_sequence, device_id=None):
+    def __init__(self, x_sequence, y_sequence, device_id=None, share_memory=False):
         """
         TODO
+
+        With ``share_memory`` memory of the input matrices and of their
+        gradients is moved into blocks of the output matrices the same way
+        as in :class:`~quagga.blocks.HorizontalStackBlock`.
         """
         # TODO add during hsplit otherwise wrong accumulation of gradients
         if all(e.bpropagable for e in chain(x_sequence, y_sequence)):
@@ -58,11 +63,18 @@ class SequentialHorizontalStackBlock(object):
             self.y_sequence = y_sequence.register_usage(device_id)
         self.x_sequence = List(self.x_sequence, x_sequence.length)
         self.y_sequence = List(self.y_sequence, y_sequence.length)
-        output = []
-        for _ in xrange(x_sequence.length):
-            matrix = Matrix.empty(x_sequence[0].nrows, x_ncols + y_ncols, dtype, device_id)
-            output.append(Connector(matrix, device_id))
-        self.output = List(output, x_sequence.length)
+        max_length = int(x_sequence.length)
+        b_matrices = iter([])
+        if share_memory and learning:
+            dL_doutput = ContiguousList(max_length, x_sequence[0].nrows, x_ncols + y_ncols, dtype, device_id)
+            for dL_dx, dL_dy, dL_dout in izip(self.dL_dx_sequences.elements, self.dL_dy_sequences.elements, dL_doutput.elements):
+                dL_dout.share_hstack([dL_dx, dL_dy])
+            b_matrices = iter(dL_doutput.elements)
+        self.output = ContiguousList(max_length, x_sequence[0].nrows, x_ncols + y_ncols, dtype, device_id,
+                                     x_sequence.length, lambda matrix: Connector(matrix, device_id, next(b_matrices, None)))
+        if share_memory:
+            for x, y, out in izip(self.x_sequence.elements, self.y_sequence.elements, self.output.elements):
+                out.share_hstack([x, y])
         if learning:
             self.dL_dx_sequences = List(self.dL_dx_sequences, x_sequence.length)
             self.dL_dy_sequences = List(self.dL_dy_sequences, x_sequence.length)
@@ -0,0 +1,228 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+from itertools import izip
+
+from quagga.utils import List
+from quagga.matrix import Matrix
+from quagga.context import Context
+from quagga.connector import Connector
+from quagga.blocks.SequencerBlock import SequencerBlock
+
+
+class SequentialLstmBlock(object):
+    """
+    A long short-term memory (LSTM) block that processes the whole sequence.
+
+    It computes the same as ``SequencerBlock(block_class=LstmBlock, ...)``,
+    but the input projection ``x[t] * W + b`` is calculated for all time
+    steps at once with one matrix multiplication of the vertically stacked
+    inputs, so only ``h[t-1] * R`` is left inside of the recurrence. During
+    `bprop` derivatives of ``W``, ``R`` and ``b`` are also accumulated for
+    the whole sequence at once.
+
+    Parameters
+    ----------
+    W
+    R
+    b
+    grad_clipping
+    x : List
+    mask : List or None
+    prev_c
+        Padding for the first ``c``
+    prev_h
+        Padding for the first ``h``
+    reverse : bool
+    device_id : int
+        Defines the device's id on which the computation will take place
+
+
+    Returns
+    -------
+    """
+    def __init__(self, W, R, b, grad_clipping, x, mask, prev_c, prev_h, reverse=False, device_id=None):
+        self.context = Context(device_id)
+        device_id = self.context.device_id
+        self.b_contexts = []
+        if W.bpropagable:
+            self.W, self.dL_dW = W.register_usage(device_id, device_id)
+            self.W_b_context = Context(device_id)
+            self.b_contexts.append(self.W_b_context)
+        else:
+            self.W = W.register_usage(device_id)
+        if R.bpropagable:
+            self.R, self.dL_dR = R.register_usage(device_id, device_id)
+            self.R_b_context = Context(device_id)
+            self.b_contexts.append(self.R_b_context)
+        else:
+            self.R = R.register_usage(device_id)
+        if b.bpropagable:
+            self.b, self.dL_db = b.register_usage(device_id, device_id)
+            self.b_b_context = Context(device_id)
+            self.b_contexts.append(self.b_b_context)
+        else:
+            self.b = b.register_usage(device_id)
+        self._length = x.length
+        self.x = []
+        self.dL_dx = []
+        for e in x:
+            if e.bpropagable:
+                e, dL_de = e.register_usage(device_id, device_id)
+            else:
+                e, dL_de = e.register_usage(device_id), None
+            self.x.append(e)
+            self.dL_dx.append(dL_de)
+        if any(e is not None for e in self.dL_dx):
+            self.x_b_context = Context(device_id)
+        self.learning = W.bpropagable or R.bpropagable or b.bpropagable or \
+                        hasattr(self, 'x_b_context') or \
+                        prev_c.bpropagable or prev_h.bpropagable
+
+        dim = self.R.nrows
+        batch_size = self.x[0].nrows
+        max_input_sequence_len = len(self.x)
+        # Rows of the stacked matrices follow the current sequence length
+        nrows = self._length * batch_size
+        self.x_stack = Matrix.empty(nrows, self.x[0].ncols, device_id=device_id)
+        self.zifo_stack = Matrix.empty(nrows, 4 * dim, device_id=device_id)
+        if hasattr(self, 'dL_dR'):
+            self.prev_h_stack = Matrix.empty(nrows, dim, device_id=device_id)
+        self.zifo = [Matrix.empty(batch_size, 4 * dim, device_id=device_id) for _ in xrange(max_input_sequence_len)]
+        mask = mask if mask is not None else [None] * max_input_sequence_len
+        self.sequencer = SequencerBlock(block_class=_LstmCell,
+                                        params=[self.R, grad_clipping, self.learning],
+                                        sequences=[List(self.zifo, self._length), mask],
+                                        output_names=['c', 'h'],
+                                        prev_names=['c', 'h'],
+                                        paddings=[prev_c, prev_h],
+                                        reverse=reverse,
+                                        device_id=device_id)
+        self.c = self.sequencer.c
+        self.h = self.sequencer.h
+        # cells in order of the input sequence
+        self.cells = self.sequencer.blocks[::-1] if reverse else self.sequencer.blocks
+
+    def fprop(self):
+        # stacked matrices can still be used by bprop of the previous batch
+        self.context.wait(*self.b_contexts)
+        n = self._length.value
+        # zifo[t] = x[t] * W + b, for all t at once
+        self.x_stack.assign_vstack(self.context, self.x[:n])
+        self.zifo_stack.assign_dot(self.context, self.x_stack, self.W)
+        self.zifo_stack.add(self.context, self.b)
+        self.zifo_stack.vsplit(self.context, self.zifo[:n])
+        self.sequencer.fprop()
+
+    def bprop(self):
+        if not self.learning:
+            return
+        self.sequencer.bprop()
+        n = self._length.value
+        cells = self.cells[:n]
+        if hasattr(self, 'dL_dW') or hasattr(self, 'dL_dR') or hasattr(self, 'dL_db'):
+            self.zifo_stack.assign_vstack(self.context, [cell.dL_dpre_zifo for cell in cells])
+            dL_dpre_zifo = self.zifo_stack
+        if hasattr(self, 'dL_dW'):
+            # dL_dW += sum(x[t].T * dL/dpre_zifo[t])
+            self.dL_dW.add_dot(self.W_b_context, self.x_stack, dL_dpre_zifo, 'T')
+        if hasattr(self, 'dL_dR'):
+            # dL_dR += sum(h[t-1].T * dL/dpre_zifo[t])
+            self.prev_h_stack.assign_vstack(self.R_b_context, [cell.prev_h for cell in cells])
+            self.dL_dR.add_dot(self.R_b_context, self.prev_h_stack, dL_dpre_zifo, 'T')
+        if hasattr(self, 'dL_db'):
+            # dL_db += sum(dL/dpre_zifo[t], axis=0)
+            self.dL_db.add_repeat_derivative(self.b_b_context, dL_dpre_zifo, dL_dpre_zifo.nrows, axis=0)
+        for cell, dL_dx in izip(cells, self.dL_dx):
+            if dL_dx is not None:
+                # dL/dx[t] = dL/dpre_zifo[t] * W.T
+                dL_dx.add_dot(self.x_b_context, cell.dL_dpre_zifo, self.W, 'N', 'T')
+
+
+class _LstmCell(object):
+    """
+    Recurrent part of the lstm block. ``zifo`` contains the input projection
+    ``x[t] * W + b`` calculated by :class:`SequentialLstmBlock`.
+    """
+    def __init__(self, R, grad_clipping, learning, zifo, mask, prev_c, prev_h, device_id=None):
+        self.f_context = Context(device_id)
+        device_id = self.f_context.device_id
+        self.R = R
+        self.grad_clipping = grad_clipping
+        self.learning = learning
+        if mask:
+            self.mask = mask.register_usage(device_id)
+        if prev_c.bpropagable:
+            self.prev_c, self.dL_dprev_c = prev_c.register_usage(device_id, device_id)
+        else:
+            self.prev_c = prev_c.register_usage(device_id)
+        if prev_h.bpropagable:
+            self.prev_h, self.dL_dprev_h = prev_h.register_usage(device_id, device_id)
+            self.prev_h_b_context = Context(device_id)
+        else:
+            self.prev_h = prev_h.register_usage(device_id)
+        if self.learning:
+            self.b_context = Context(device_id)
+
+        self.zifo = zifo
+        self.c = Matrix.empty_like(self.prev_c, device_id)
+        self.c = Connector(self.c, device_id if self.learning else None)
+        self.tanh_c = Matrix.empty_like(self.c, device_id)
+        self.h = Matrix.empty_like(self.c, device_id)
+        self.h = Connector(self.h, device_id if self.learning else None)
+
+        if self.learning:
+            # dL/dpre_zifo overwrites dzifo/dpre_zifo during the backward step
+            self._dzifo_dpre_zifo = Matrix.empty_like(self.zifo)
+            self.dL_dpre_zifo = self._dzifo_dpre_zifo
+            self._dtanh_c_dc = Matrix.empty_like(self.c)
+
+    @property
+    def dzifo_dpre_zifo(self):
+        if self.learning:
+            return self._dzifo_dpre_zifo
+
+    @property
+    def dtanh_c_dc(self):
+        if self.learning:
+            return self._dtanh_c_dc
+
+    def fprop(self):
+        # zifo = tanh_sigm(zifo + h[t-1] * R)
+        # c[t] = i[t] .* z[t] + f[t] .* c[t-1]
+        # h[t] = o[t] .* tanh(c[t])
+        # s[t] = mask .* s[t] + (1 - mask) .* s[t-1]
+        Matrix.lstm_fprop(self.f_context, self.zifo, None, self.prev_h, self.R,
+                          None, self.prev_c, getattr(self, 'mask', None),
+                          self.zifo, self.c, self.tanh_c, self.h,
+                          self.dzifo_dpre_zifo, self.dtanh_c_dc)
+        self.c.fprop()
+        self.h.fprop()
+
+    def bprop(self):
+        if not self.learning:
+            return
+        dL_dc = self.c.backward_matrix
+        dL_dh = self.h.backward_matrix
+        self.b_context.wait(self.f_context)
+        Matrix.lstm_bprop(self.b_context, self.zifo, self.dL_dpre_zifo,
+                          self.tanh_c, self.dtanh_c_dc, self.prev_c,
+                          dL_dc, dL_dh, getattr(self, 'mask', None),
+                          getattr(self, 'dL_dprev_c', None),
+                          getattr(self, 'dL_dprev_h', None),
+                          self.grad_clipping)
+        if hasattr(self, 'dL_dprev_h'):
+            # dL/dh[t-1] = dL/dpre_zifo[t] * R.T
+            self.dL_dprev_h.add_dot(self.prev_h_b_context, self.dL_dpre_zifo, self.R, 'N', 'T')
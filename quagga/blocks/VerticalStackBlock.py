@@ -29,6 +29,14 @@ class VerticalStackBlock(object):
         Input matrices that need to be concatenated.
     device_id: int
         Defines the device's id on which the computation will take place
+    share_memory : bool
+        Moves memory of the input matrices and of their gradients into
+        blocks of the output matrices, so stacking and splitting do not
+        copy anything and gradients of the inputs are accumulated. Forward
+        and backward matrices are shared independently and only if they
+        own memory of the right shape, views that were taken of them before
+        the block construction are not updated. Memory is never shared on
+        the GPU.
     """
 
     def __init__(self, *matrices, **kwargs):
@@ -51,18 +59,27 @@ class VerticalStackBlock(object):
         dtype = matrices[0].dtype
         bu_device_id = device_id if self.dL_dmatrices else None
         output = Matrix.empty(nrows, matrices[0].ncols, dtype, device_id)
-        self.output = Connector(output, bu_device_id)
+        dL_doutput = None
+        if kwargs.get('share_memory'):
+            output.share_vstack(self.matrices)
+            if self.dL_dmatrices:
+                dL_doutput = Matrix.empty_like(output, device_id)
+                dL_doutput.share_vstack(self.dL_dmatrices, self._get_row_slices())
+        self.output = Connector(output, bu_device_id, dL_doutput)
 
     def fprop(self):
         self.output.assign_vstack(self.context, self.matrices)
         self.output.fprop()
 
+    def _get_row_slices(self):
+        row_slices = []
+        nrows = [0]
+        for matrix, bpropagable in izip(self.matrices, self.bpropagable):
+            nrows.append(nrows[-1] + int(matrix.nrows))
+            if bpropagable:
+                row_slices.append((nrows[-2], nrows[-1]))
+        return row_slices
+
     def bprop(self):
         if self.dL_dmatrices:
-            row_slices = []
-            nrows = [0]
-            for matrix, bpropagable in izip(self.matrices, self.bpropagable):
-                nrows.append(nrows[-1] + int(matrix.nrows))
-                if bpropagable:
-                    row_slices.append((nrows[-2], nrows[-1]))
-            self.output.backward_matrix.vsplit(self.context, self.dL_dmatrices, row_slices)
\ No newline at end of file
+            self.output.backward_matrix.vsplit(self.context, self.dL_dmatrices, self._get_row_slices())
@@ -32,6 +32,7 @@ from quagga.blocks.RowSlicingBlock import RowSlicingBlock
 from quagga.blocks.ScheduledSamplingBlock import ScheduledSamplingBlock
 from quagga.blocks.SequencerBlock import SequencerBlock
 from quagga.blocks.SequentialHorizontalStackBlock import SequentialHorizontalStackBlock
+from quagga.blocks.SequentialLstmBlock import SequentialLstmBlock
 from quagga.blocks.SequentialMeanPoolingBlock import SequentialMeanPoolingBlock
 from quagga.blocks.SequentialSumPoolingBlock import SequentialSumPoolingBlock
 from quagga.blocks.SigmoidCeBlock import SigmoidCeBlock
@@ -13,9 +13,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ----------------------------------------------------------------------------
+import quagga
 from quagga.matrix import Matrix
 from quagga.context import Context
-from quagga.matrix import SparseMatrix
+from quagga.matrix import RowSparseMatrix
 
 
 class Connector(object):
@@ -51,13 +52,19 @@ class Connector(object):
                                 +----------------------+    +-----------------+
     """
 
-    def __init__(self, f_matrix, bu_device_id=None):
+    def __init__(self, f_matrix, bu_device_id=None, b_matrix=None):
         self._fo_device_id = f_matrix.device_id
         self._f_matrices = {self._fo_device_id: f_matrix}
         self.context = {self._fo_device_id: Context(self._fo_device_id)}
-        if bu_device_id is not None:
+        if bu_device_id is not None and not quagga.inference:
             self._bu_device_id = bu_device_id
             self._b_matrices = dict()
+            if b_matrix is not None:
+                # preallocated backward matrix, it must be on the
+                # `bu_device_id` device
+                self._b_matrices[bu_device_id] = b_matrix
+                if bu_device_id not in self.context:
+                    self.context[bu_device_id] = Context(bu_device_id)
             self._b_matrices_pool = dict()
             self._b_sparse_matrix = None
         # We need do this trick because instead we will add attribute
@@ -79,7 +86,7 @@ class Connector(object):
         fwd_matrix = self._f_matrices[self._fo_device_id]
         if self._b_sparse_matrix:
             return fwd_matrix, self._b_sparse_matrix
-        self._b_sparse_matrix = SparseMatrix()
+        self._b_sparse_matrix = RowSparseMatrix()
         return fwd_matrix, self._b_sparse_matrix
 
     def register_usage(self, fu_device_id, bo_device_id=None):
@@ -125,7 +132,8 @@ class Connector(object):
                     context = self.context[matrix.device_id]
                 matrix.fill(context, 0.0)
             if self._b_sparse_matrix:
-                self._b_sparse_matrix.clear()
+                matrix = self._b_sparse_matrix
+                matrix.clear(matrix.last_usage_context or self.context[self._bu_device_id])
 
     def bprop(self):
         if not self.bpropagable:
@@ -154,6 +162,18 @@ class Connector(object):
 
     backward_matrix = property(lambda self: self.bprop())
 
+    def get_backward_matrices(self):
+        """
+        Returns all matrices which hold derivatives of the connector without
+        summing them up as :meth:`bprop` does.
+        """
+        if not self.bpropagable:
+            return []
+        matrices = self._b_matrices.values() + self._b_matrices_pool.values()
+        if self._b_sparse_matrix:
+            matrices.append(self._b_sparse_matrix)
+        return matrices
+
     def __getattr__(self, name):
         attribute = getattr(self._f_matrices[self._fo_device_id], name)
         if hasattr(attribute, '__call__'):
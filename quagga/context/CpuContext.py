@@ -13,26 +13,171 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ----------------------------------------------------------------------------
+import sys
+import atexit
+import quagga
+import threading
+from Queue import Queue
+
+
+_worker_local = threading.local()
+
+
+class _Worker(threading.Thread):
+    """
+    Daemon thread that executes tasks from its FIFO queue one by one.
+    """
+    def __init__(self):
+        super(_Worker, self).__init__()
+        self.daemon = True
+        self.queue = Queue()
+        self.start()
+
+    def run(self):
+        _worker_local.is_worker = True
+        while True:
+            task = self.queue.get()
+            if task is None:
+                break
+            context, function, args, kwargs = task
+            try:
+                function(*args, **kwargs)
+            except Exception:
+                context._exc_info = sys.exc_info()
+
+
+def _stop_workers():
+    for worker in CpuContext._workers:
+        worker.queue.put(None)
+    for worker in CpuContext._workers:
+        worker.join()
+
+
+atexit.register(_stop_workers)
+
+
+def _reset_workers():
+    """
+    Forgets the worker threads in a forked process, where they do not run.
+    Contexts created afterwards get new workers.
+    """
+    CpuContext._workers = []
+    CpuContext._worker_counter = 0
+    CpuContext._lock = threading.Lock()
+
+
 class CpuContext(object):
     """
-    Mock class created for compatibility purposes in order to enable
-    quick switching between GPU and CPU implementations.
+    Computational context for the CPU backend.
+
+    By default it is a mock class created for compatibility purposes in order
+    to enable quick switching between GPU and CPU implementations: all work is
+    executed synchronously in the calling thread.
+
+    If ``quagga.cpu_context_workers`` is positive, the context becomes
+    asynchronous, similarly to a CUDA stream: work submitted to it is put into
+    the FIFO queue of a worker thread and executed in submission order, while
+    :meth:`wait` and :meth:`block` insert real dependencies between contexts.
+    Because blocks create a lot of contexts, contexts are pinned round-robin
+    to a pool of ``quagga.cpu_context_workers`` threads instead of owning a
+    thread each. NumPy releases the GIL inside BLAS calls and most ufuncs,
+    so independent contexts overlap on different cores.
+
+    Parameters
+    ----------
+    device_id : int
+        Defines with which device the computational context will be associated
     """
+    _workers = []
+    _worker_counter = 0
+    _lock = threading.Lock()
+
     def __init__(self, device_id=None):
         self.device_id = device_id if device_id else 0
+        self._worker = CpuContext._get_worker() if quagga.cpu_context_workers else None
+        self._exc_info = None
+
+    @classmethod
+    def _get_worker(cls):
+        with cls._lock:
+            k = cls._worker_counter % quagga.cpu_context_workers
+            cls._worker_counter += 1
+            if k == len(cls._workers):
+                cls._workers.append(_Worker())
+            return cls._workers[k]
+
+    @property
+    def deferred(self):
+        """
+        Whether work submitted to the context is queued rather than executed
+        immediately. Work that is submitted from a worker thread (i.e. from
+        within already queued work) is always executed immediately.
+        """
+        return self._worker is not None and \
+            not getattr(_worker_local, 'is_worker', False)
+
+    def enqueue(self, function, *args, **kwargs):
+        """
+        Executes ``function`` after all preceding work in the context has
+        completed.
+        """
+        if self.deferred:
+            self._worker.queue.put((self, function, args, kwargs))
+        else:
+            function(*args, **kwargs)
 
     def synchronize(self):
-        pass
+        """
+        Blocks the calling thread until all preceding work in the context
+        has completed. Reraises an exception if any of that work failed.
+        """
+        if self.deferred:
+            event = threading.Event()
+            self.enqueue(event.set)
+            event.wait()
+        if self._exc_info:
+            exc_info, self._exc_info = self._exc_info, None
+            raise exc_info[0], exc_info[1], exc_info[2]
 
     def wait(self, *args):
-        pass
+        """
+        Makes all future work submitted to the context wait until all
+        work already submitted to ``args`` contexts has finished.
+
+        Parameters
+        ----------
+        args : list of :class:`~quagga.context.CpuContext`
+        """
+        if not self.deferred:
+            return
+        for context in args:
+            if context is None or context is self:
+                continue
+            event = threading.Event()
+            context.enqueue(event.set)
+            self.enqueue(event.wait)
 
     def block(self, *args):
-        pass
+        """
+        Makes all future work submitted to the ``args`` contexts wait until
+        all work already submitted to the context has finished.
+
+        Parameters
+        ----------
+        args : list of :class:`~quagga.context.CpuContext`
+        """
+        if not self.deferred:
+            return
+        for context in args:
+            context.wait(self)
 
     def add_callback(self, callback, *args, **kwargs):
-        callback(*args, **kwargs)
+        """
+        Adds ``callback`` function to the context, which will be called
+        after all preceding work has completed.
+        """
+        self.enqueue(callback, *args, **kwargs)
 
     @staticmethod
     def callback(function):
-        return function
\ No newline at end of file
+        return function
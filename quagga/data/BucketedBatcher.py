@@ -0,0 +1,136 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import numpy as np
+from itertools import izip
+from collections import defaultdict
+
+
+class BucketedBatcher(object):
+    """
+    Iterates over batches of sequences of token indices. Sequences are
+    grouped into buckets by length and a batch is filled from one bucket,
+    when the bucket is exhausted the batch is completed from the bucket of
+    the closest length, so little of a batch is padding.
+
+    Every batch is a tuple of Fortran-ordered arrays:
+
+    * ``x`` -- int32 ``(batch_size, max_len)`` token indices, padded with
+      ``pad_value``
+    * ``lengths`` -- int32 ``(batch_size, 1)`` sequence lengths
+    * ``mask`` -- float32 ``(batch_size, max_len)``, 1 for tokens and 0 for
+      padding
+
+    where ``max_len`` is the length of the longest sequence of the batch.
+    The last batch of an epoch can have fewer rows.
+
+    Parameters
+    ----------
+    sequences : list of sequences of int or :class:`~quagga.data.Corpus`
+        A container with a ``lengths`` array (like a corpus) is bucketed
+        without touching the sequences, which are read only when a batch
+        is built
+    batch_size : int
+    max_len : int
+        Longer sequences are skipped, as well as empty ones
+    randomize : bool
+        Shuffle buckets every epoch and start batches from random buckets
+    infinite : bool
+        Iterate over epochs forever
+    seed : int
+    pad_value : int
+    """
+    def __init__(self, sequences, batch_size, max_len=None, randomize=False,
+                 infinite=False, seed=42, pad_value=0):
+        self.sequences = sequences
+        self.batch_size = batch_size
+        if hasattr(sequences, 'lengths'):
+            self.lengths = np.asarray(sequences.lengths)
+        else:
+            self.lengths = np.array([len(sequence) for sequence in sequences], np.int64)
+        selected = self.lengths > 0
+        if max_len is not None:
+            selected &= self.lengths <= max_len
+        indices = np.flatnonzero(selected)
+        indices = indices[np.argsort(self.lengths[indices], kind='mergesort')]
+        bucket_lengths, starts = np.unique(self.lengths[indices], return_index=True)
+        self.buckets = {}
+        for length, bucket in izip(bucket_lengths, np.split(indices, starts[1:])):
+            self.buckets[int(length)] = bucket.tolist()
+        if not self.buckets:
+            raise ValueError('There are no sequences to batch!')
+        self.max_len = max(self.buckets)
+        self.rng = np.random.RandomState(seed) if randomize else None
+        self.infinite = infinite
+        self.pad_value = pad_value
+
+    def __iter__(self):
+        while True:
+            for batch in self.iter_batch_indices():
+                yield self.get_arrays(batch)
+            if not self.infinite:
+                break
+
+    def iter_batch_indices(self):
+        """
+        Yields lists of indices of ``sequences`` that make up batches of
+        one epoch.
+        """
+        buckets = {}
+        for length, indices in self.buckets.iteritems():
+            buckets[length] = list(indices)
+            if self.rng:
+                self.rng.shuffle(buckets[length])
+        lengths = sorted(buckets)
+        progress = defaultdict(int)
+        batch = []
+        length = self._choose_length(lengths)
+        while True:
+            n = self.batch_size - len(batch)
+            batch.extend(buckets[length][progress[length]:progress[length] + n])
+            progress[length] += n
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+                length = self._choose_length(lengths)
+                continue
+            # the bucket is exhausted, continue with the closest length
+            i = lengths.index(length)
+            del lengths[i]
+            if not lengths:
+                break
+            if i == 0 or i == len(lengths) or not self.rng:
+                length = lengths[min(i, len(lengths) - 1)]
+            else:
+                length = lengths[i + self.rng.choice([-1, 0])]
+        if batch:
+            yield batch
+
+    def _choose_length(self, lengths):
+        return lengths[self.rng.randint(len(lengths))] if self.rng else lengths[0]
+
+    def get_arrays(self, batch):
+        """
+        Returns ``(x, lengths, mask)`` arrays for the sequences with
+        ``batch`` indices.
+        """
+        lengths = np.asfortranarray(self.lengths[batch, np.newaxis], np.int32)
+        max_len = int(lengths.max())
+        x = np.empty((len(batch), max_len), np.int32, order='F')
+        x.fill(self.pad_value)
+        for i, k in enumerate(batch):
+            x[i, :lengths[i, 0]] = self.sequences[k]
+        mask = np.asfortranarray(np.arange(max_len) < lengths, np.float32)
+        return x, lengths, mask
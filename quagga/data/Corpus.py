@@ -0,0 +1,136 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import os
+import json
+import numpy as np
+
+
+class Corpus(object):
+    """
+    Sequences of token indices stored on disk as a flat int32 array of
+    tokens, an int64 array of ``len(corpus) + 1`` sequence offsets and a
+    json vocabulary (the list of tokens), all in the ``path`` directory.
+
+    Token and offset arrays are memory-mapped, so opening a corpus of any
+    size takes constant time, sequences are read lazily and processes that
+    open the same corpus share its pages through the OS cache. Sequences
+    are zero-copy views of the mapped array.
+
+    Use :meth:`write` or :meth:`from_text` to create a corpus once.
+
+    Parameters
+    ----------
+    path : str
+        Directory of the corpus
+    """
+    TOKENS_FILE_NAME = 'tokens.int32'
+    OFFSETS_FILE_NAME = 'offsets.int64'
+    VOCAB_FILE_NAME = 'vocab.json'
+
+    def __init__(self, path):
+        self.path = path
+        self.tokens = np.memmap(os.path.join(path, Corpus.TOKENS_FILE_NAME), np.int32, 'r')
+        self.offsets = np.memmap(os.path.join(path, Corpus.OFFSETS_FILE_NAME), np.int64, 'r')
+        with open(os.path.join(path, Corpus.VOCAB_FILE_NAME)) as f:
+            self.vocab = json.load(f)
+        self._token_to_idx = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, k):
+        return self.tokens[self.offsets[k]:self.offsets[k + 1]]
+
+    def __iter__(self):
+        for k in xrange(len(self)):
+            yield self[k]
+
+    @property
+    def lengths(self):
+        """
+        Lengths of all sequences as an int64 array.
+        """
+        return np.diff(self.offsets)
+
+    @property
+    def token_to_idx(self):
+        if self._token_to_idx is None:
+            self._token_to_idx = dict((token, idx) for idx, token in enumerate(self.vocab))
+        return self._token_to_idx
+
+    @classmethod
+    def write(cls, path, sequences, vocab):
+        """
+        Writes sequences of token indices to a new corpus in the ``path``
+        directory. ``sequences`` can be a generator, only one sequence is
+        kept in memory at a time.
+
+        Returns
+        -------
+        Corpus
+            The written corpus opened for reading
+        """
+        if not os.path.exists(path):
+            os.makedirs(path)
+        offsets = [0]
+        with open(os.path.join(path, Corpus.TOKENS_FILE_NAME), 'wb') as f:
+            for sequence in sequences:
+                sequence = np.asarray(sequence, np.int32)
+                if sequence.ndim != 1:
+                    raise ValueError('Sequence must be a 1-d array of token indices!')
+                sequence.tofile(f)
+                offsets.append(offsets[-1] + len(sequence))
+        if offsets[-1] == 0:
+            raise ValueError('There are no tokens to write!')
+        np.array(offsets, np.int64).tofile(os.path.join(path, Corpus.OFFSETS_FILE_NAME))
+        with open(os.path.join(path, Corpus.VOCAB_FILE_NAME), 'w') as f:
+            json.dump(list(vocab), f)
+        return cls(path)
+
+    @classmethod
+    def from_text(cls, path, lines, tokenize=None, vocab=None, unk_token=None):
+        """
+        Converts lines of text to a corpus, one sequence per line.
+
+        Parameters
+        ----------
+        path : str
+        lines : iterable of unicode
+        tokenize : callable
+            Splits a line into a list of tokens, ``split()`` by default
+        vocab : list
+            Initial vocabulary, for instance the vocabulary of the training
+            corpus for the validation one
+        unk_token : unicode
+            If it is given, tokens that are not in ``vocab`` are replaced
+            with it, otherwise they are added to the vocabulary
+        """
+        tokenize = tokenize if tokenize else lambda line: line.split()
+        vocab = list(vocab) if vocab else []
+        token_to_idx = dict((token, idx) for idx, token in enumerate(vocab))
+        if unk_token is not None and unk_token not in token_to_idx:
+            raise ValueError('unk_token must be in the vocabulary!')
+
+        def get_idx(token):
+            idx = token_to_idx.get(token)
+            if idx is None:
+                if unk_token is not None:
+                    return token_to_idx[unk_token]
+                idx = token_to_idx[token] = len(vocab)
+                vocab.append(token)
+            return idx
+        sequences = ([get_idx(token) for token in tokenize(line)] for line in lines)
+        return cls.write(path, sequences, vocab)
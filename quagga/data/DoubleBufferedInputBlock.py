@@ -0,0 +1,98 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+from itertools import izip
+from quagga.matrix import Matrix
+from quagga.context import Context
+from quagga.matrix import ShapeElement
+
+
+class DoubleBufferedInputBlock(object):
+    """
+    Copies batches of numpy arrays into ``outputs`` through two sets of
+    buffer matrices. While the model works on a batch, the next one is
+    transferred into the inactive buffers in a dedicated transfer context,
+    ``fprop`` only makes its context wait for the transfer and copies the
+    active buffers into the outputs after the consumers of the previous
+    batch are done (``blocking_contexts``). With synchronous contexts the
+    work is done in place, asynchronous contexts overlap the transfer of a
+    batch with the computation on the previous one.
+
+    Parameters
+    ----------
+    batches : iterable of tuples of numpy arrays
+        An array for every output, at most of the output shape. It is
+        iterated again after the end of an epoch.
+    outputs : list of Connector
+        Connectors with their maximal shapes. Their shapes are set to the
+        shapes of the arrays of the current batch.
+    device_id : int
+    """
+    def __init__(self, batches, outputs, device_id=None):
+        self.context = Context(device_id)
+        device_id = self.context.device_id
+        self.transfer_context = Context(device_id)
+        self.blocking_contexts = []
+        self.batches = batches
+        self.outputs = outputs
+        self._buffers = [[Matrix.empty(int(output.nrows), int(output.ncols), output.dtype, device_id)
+                          for output in outputs] for _ in xrange(2)]
+        # shapes of arrays in the buffers, None if there is no batch
+        self._shapes = [None, None]
+        self._k = 0
+        self._iterator = iter(batches)
+        self._load(self._k)
+
+    def fprop(self):
+        """
+        Raises ``StopIteration`` at the end of an epoch, the next call
+        starts a new one.
+        """
+        k = self._k
+        if self._shapes[k] is None:
+            self._iterator = iter(self.batches)
+            self._load(k)
+            raise StopIteration
+        shapes = self._shapes[k]
+        # the context waits for the transfer of the active buffers only,
+        # and the next transfer waits for the previous reading of the
+        # inactive buffers
+        self.context.wait(self.transfer_context)
+        self.transfer_context.wait(self.context)
+        self._k = 1 - k
+        self._load(self._k)
+
+        if self.blocking_contexts:
+            self.context.wait(*self.blocking_contexts)
+        with ShapeElement.batch_update():
+            for output, (nrows, ncols) in izip(self.outputs, shapes):
+                output.nrows = nrows
+                output.ncols = ncols
+        for output, buffer in izip(self.outputs, self._buffers[k]):
+            output.assign(self.context, buffer)
+        self._shapes[k] = None
+        for output in self.outputs:
+            output.fprop()
+
+    def _load(self, k):
+        try:
+            arrays = next(self._iterator)
+        except StopIteration:
+            self._shapes[k] = None
+            return
+        self._shapes[k] = [a.shape for a in arrays]
+        for buffer, a in izip(self._buffers[k], arrays):
+            buffer.assign_npa(self.transfer_context, a)
+
@@ -0,0 +1,99 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import Queue
+import threading
+import traceback
+import multiprocessing
+
+
+_ITEM, _END, _ERROR = range(3)
+
+
+class PrefetchIterator(object):
+    """
+    Iterates over ``iterable`` that is consumed in a background thread (or
+    process), so items are prepared while the caller is busy. At most
+    ``prefetch`` items are kept ready.
+
+    Parameters
+    ----------
+    iterable : iterable
+    prefetch : int
+        Size of the queue of ready items
+    use_process : bool
+        Consume ``iterable`` in a forked process instead of a thread. Items
+        are pickled, but their preparation does not compete with the
+        caller for the GIL.
+    """
+    def __init__(self, iterable, prefetch=2, use_process=False):
+        if use_process:
+            self._queue = multiprocessing.Queue(prefetch)
+            self._stop = multiprocessing.Event()
+            self._worker = multiprocessing.Process(target=_fill, args=(iterable, self._queue, self._stop))
+        else:
+            self._queue = Queue.Queue(prefetch)
+            self._stop = threading.Event()
+            self._worker = threading.Thread(target=_fill, args=(iterable, self._queue, self._stop))
+        self._worker.daemon = True
+        self._worker.start()
+        self._finished = False
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self._finished:
+            raise StopIteration
+        kind, item = self._queue.get()
+        if kind == _ITEM:
+            return item
+        self._finished = True
+        self._worker.join()
+        if kind == _ERROR:
+            raise RuntimeError('Exception in the prefetching worker:\n{}'.format(item))
+        raise StopIteration
+
+    def close(self):
+        """
+        Stops the worker, items that are not consumed yet are discarded.
+        """
+        self._finished = True
+        self._stop.set()
+        if isinstance(self._worker, multiprocessing.Process):
+            self._worker.terminate()
+        self._worker.join()
+
+
+def _fill(iterable, queue, stop):
+    try:
+        for item in iterable:
+            if not _put(queue, stop, (_ITEM, item)):
+                return
+    except Exception:
+        _put(queue, stop, (_ERROR, traceback.format_exc()))
+        return
+    _put(queue, stop, (_END, None))
+
+
+def _put(queue, stop, item):
+    # waits for a free place in the queue until the consumer stops
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+            return True
+        except Queue.Full:
+            pass
+    return False
@@ -0,0 +1,144 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+from quagga.utils import List
+from quagga.matrix import Matrix
+from quagga.connector import Connector
+from quagga.data.PrefetchIterator import PrefetchIterator
+from quagga.data.DoubleBufferedInputBlock import DoubleBufferedInputBlock
+
+
+class SequenceDataBlock(object):
+    """
+    Feeds batches of :class:`~quagga.data.BucketedBatcher` to a model.
+    Batches are prepared in the background by
+    :class:`~quagga.data.PrefetchIterator` and transferred into the outputs
+    by :class:`~quagga.data.DoubleBufferedInputBlock`, so ``fprop`` only
+    sets shapes and schedules the copying.
+
+    Outputs
+    -------
+    x : Connector
+        int ``(batch_size, max_len)`` token indices
+    lengths : Connector
+        int ``(batch_size, 1)`` sequence lengths
+    mask : List of Connector
+        float ``(batch_size, 1)`` mask of every time step, the length of
+        the list is ``x.ncols``
+
+    Number of rows of all outputs is ``x.nrows``, so matrices built from
+    these ShapeElements follow the size of the current batch.
+
+    Parameters
+    ----------
+    train_batcher : BucketedBatcher
+    valid_batcher : BucketedBatcher
+        Batches of the testing mode
+    prefetch : int
+    use_process : bool
+        See :class:`~quagga.data.PrefetchIterator`
+    device_id : int
+    """
+    def __init__(self, train_batcher, valid_batcher=None, prefetch=2, use_process=False, device_id=None):
+        batchers = [train_batcher] + ([valid_batcher] if valid_batcher else [])
+        batch_size = max(batcher.batch_size for batcher in batchers)
+        max_len = max(batcher.max_len for batcher in batchers)
+        x = Matrix.empty(batch_size, max_len, 'int', device_id)
+        self.x = Connector(x)
+        self.lengths = Connector(Matrix.empty(x.nrows, 1, 'int', device_id))
+        self._mask = Connector(Matrix.empty(x.nrows, x.ncols, 'float', device_id))
+        self.mask = List([Connector(self._mask[:, i]) for i in xrange(max_len)], x.ncols)
+
+        outputs = [self.x, self.lengths, self._mask]
+        self._train_batches = _PrefetchedBatches(train_batcher, prefetch, use_process)
+        self._train_input = DoubleBufferedInputBlock(self._train_batches, outputs, device_id)
+        if valid_batcher:
+            self._valid_batches = _PrefetchedBatches(valid_batcher, prefetch, use_process)
+            self._valid_input = DoubleBufferedInputBlock(self._valid_batches, outputs, device_id)
+        self.training_mode = True
+
+    @property
+    def blocking_contexts(self):
+        return self._train_input.blocking_contexts
+
+    @blocking_contexts.setter
+    def blocking_contexts(self, value):
+        self._train_input.blocking_contexts = value
+        if hasattr(self, '_valid_input'):
+            self._valid_input.blocking_contexts = value
+
+    def set_training_mode(self):
+        self.training_mode = True
+
+    def set_testing_mode(self):
+        self.training_mode = False
+
+    def fprop(self):
+        """
+        Raises ``StopIteration`` at the end of an epoch of a finite batcher,
+        the next call starts a new epoch.
+        """
+        if self.training_mode:
+            input_block = self._train_input
+        elif hasattr(self, '_valid_input'):
+            input_block = self._valid_input
+        else:
+            raise ValueError('There is no batcher for the testing mode!')
+        input_block.fprop()
+        for e in self.mask:
+            e.last_modif_context = input_block.context
+        self.mask.fprop()
+
+    def close(self):
+        """
+        Stops background preparation of batches.
+        """
+        self._train_batches.close()
+        if hasattr(self, '_valid_batches'):
+            self._valid_batches.close()
+
+
+class _PrefetchedBatches(object):
+    # one long-lived prefetch iterator goes over all epochs of the batcher,
+    # so the first batches of an epoch are prepared during the previous one.
+    # Every iteration yields batches of one epoch
+    def __init__(self, batcher, prefetch, use_process):
+        self.batcher = batcher
+        self.prefetch = prefetch
+        self.use_process = use_process
+        self.iterator = None
+
+    def __iter__(self):
+        if self.iterator is None:
+            self.iterator = PrefetchIterator(_iter_epochs(self.batcher), self.prefetch, self.use_process)
+        return self._iter_epoch()
+
+    def _iter_epoch(self):
+        for batch in self.iterator:
+            if batch is None:
+                return
+            yield batch
+
+    def close(self):
+        if self.iterator:
+            self.iterator.close()
+
+
+def _iter_epochs(batcher):
+    # batches of all epochs, every epoch is followed by None
+    while True:
+        for batch in batcher:
+            yield batch
+        yield None
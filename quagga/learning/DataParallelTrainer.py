@@ -0,0 +1,251 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import mmap
+import quagga
+import traceback
+import numpy as np
+import multiprocessing
+from quagga.matrix import CpuMatrix
+from quagga.connector import Connector
+from quagga.matrix import RowSparseMatrix
+from quagga.context.CpuContext import _reset_workers
+
+
+class DataParallelTrainer(object):
+    """
+    Trains replicas of a model in ``n_workers`` processes, each replica
+    processes its own shard of every batch. This process is the worker 0,
+    the others are forked by :meth:`run`.
+
+    Parameters of all replicas are placed into one flat float32 buffer in
+    shared memory, gradients of every worker into their own part of another
+    one. An iteration of every worker is:
+
+    #. ``fprop`` and ``bprop`` of its replica
+    #. reduce-scatter: the worker averages gradients of all workers over its
+       shard of the flat buffer
+    #. steps made by ``build_steps`` update its shard of the parameters
+    #. all-gather: once all workers have updated their shards, every replica
+       sees all the new parameters, because they share the buffer
+
+    Steps are the usual :mod:`quagga.learning.steps` classes, they are
+    created for the worker's shard as a single ``(n, 1)`` parameter, so
+    their state is split between workers too. Parameters must have dense
+    gradients.
+
+    Replicas are independent processes, so set ``OMP_NUM_THREADS`` (or the
+    variable of your BLAS) to keep them from oversubscribing cores.
+
+    Parameters
+    ----------
+    build_model : callable
+        ``build_model(worker_id, n_workers)`` returns ``(model,
+        parameters)``, where ``parameters`` is a dict of trainable parameter
+        connectors (e.g. ``trainable_parameters`` of a
+        :class:`~quagga.blocks.ParameterContainer`). Blocks of the model
+        must feed the replica with the ``worker_id`` shard of every batch
+        (see :meth:`get_shard`). Initial values of the parameters are taken
+        from the replica of the worker 0.
+    build_steps : callable
+        ``build_steps(parameters)`` returns a list of learning steps (objects
+        with ``notify``) for the list of parameters
+    n_workers : int
+    """
+    def __init__(self, build_model, build_steps, n_workers):
+        if quagga.processor_type != 'cpu':
+            raise NotImplementedError('Data-parallel training is implemented '
+                                      'only for the cpu backend!')
+        self.build_steps = build_steps
+        self.n_workers = n_workers
+        self.model, self.parameters = build_model(0, n_workers)
+        parameters = _get_sorted_parameters(self.parameters)
+        self.shapes = [(int(p.nrows), int(p.ncols)) for p in parameters]
+        self.nelems = sum(nrows * ncols for nrows, ncols in self.shapes)
+        self._flat_parameters = _shared_empty(self.nelems)
+        self._flat_gradients = _shared_empty(n_workers * self.nelems).reshape(n_workers, self.nelems)
+        self._reduced_gradients = _shared_empty(self.nelems)
+        # the first elements of the shards
+        self.bounds = [self.nelems * k // n_workers for k in xrange(n_workers + 1)]
+        self._build_model = build_model
+        self._bind(0, parameters, True)
+
+    def _bind(self, worker_id, parameters, copy_values=False):
+        """
+        Replaces memory of the parameters and of their gradients with views
+        of the shared buffers.
+        """
+        offset = 0
+        for param, shape in zip(parameters, self.shapes):
+            if (int(param.nrows), int(param.ncols)) != shape:
+                raise ValueError('Parameters of the replicas must be the same!')
+            dL_dparam = param.backward_matrix
+            if isinstance(dL_dparam, RowSparseMatrix):
+                raise ValueError('Data-parallel training requires dense gradients!')
+            size = shape[0] * shape[1]
+            data = self._flat_parameters[offset:offset + size].reshape(shape)
+            if copy_values:
+                data[...] = param.to_host()
+            param.register_usage(param.device_id).data = data
+            dL_dparam.data = self._flat_gradients[worker_id, offset:offset + size].reshape(shape)
+            offset += size
+
+    def run(self, n_iterations, callback=None):
+        """
+        Makes ``n_iterations`` iterations of training in all workers.
+
+        Parameters
+        ----------
+        n_iterations : int
+        callback : callable
+            ``callback(iteration)`` is called in this process after every
+            iteration, when parameters are up to date. Other workers wait
+            for it to return.
+        """
+        barrier = _Barrier(self.n_workers)
+        errors = multiprocessing.Queue()
+        workers = []
+        for worker_id in xrange(1, self.n_workers):
+            worker = multiprocessing.Process(target=self._run_worker,
+                                             args=(worker_id, n_iterations, barrier, errors))
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+        try:
+            parameters = _get_sorted_parameters(self.parameters)
+            self._train(0, self.model, parameters, n_iterations, barrier, callback)
+        except _Aborted:
+            pass
+        except Exception:
+            barrier.abort()
+            for worker in workers:
+                worker.terminate()
+            raise
+        finally:
+            for worker in workers:
+                worker.join()
+        if not errors.empty():
+            raise RuntimeError('Exception in a data-parallel worker:\n{}'.format(errors.get()))
+
+    def _run_worker(self, worker_id, n_iterations, barrier, errors):
+        try:
+            _reset_workers()
+            model, parameters = self._build_model(worker_id, self.n_workers)
+            parameters = _get_sorted_parameters(parameters)
+            self._bind(worker_id, parameters)
+            self._train(worker_id, model, parameters, n_iterations, barrier)
+        except _Aborted:
+            pass
+        except Exception:
+            errors.put(traceback.format_exc())
+            barrier.abort()
+
+    def _train(self, worker_id, model, parameters, n_iterations, barrier, callback=None):
+        start, end = self.bounds[worker_id], self.bounds[worker_id + 1]
+        shard = _get_shard_connector(self._flat_parameters[start:end], self._reduced_gradients[start:end])
+        steps = self.build_steps([shard]) if end > start else []
+        gradients = self._flat_gradients[:, start:end]
+        reduced = self._reduced_gradients[start:end]
+        model.set_training_mode()
+        barrier.wait()
+        for iteration in xrange(n_iterations):
+            model.fprop()
+            model.bprop()
+            _synchronize(param.backward_matrix for param in parameters)
+            barrier.wait()
+            # reduce-scatter
+            np.sum(gradients, axis=0, out=reduced)
+            reduced *= 1.0 / self.n_workers
+            for step in steps:
+                step.notify()
+            _synchronize([shard])
+            # all-gather
+            barrier.wait()
+            if callback:
+                callback(iteration)
+
+    @staticmethod
+    def get_shard(arrays, worker_id, n_workers):
+        """
+        Returns rows of the ``worker_id`` shard of every array of the batch,
+        shards of all workers have the same number of rows up to one.
+        """
+        shard = []
+        for a in arrays:
+            nrows = a.shape[0]
+            start, end = nrows * worker_id // n_workers, nrows * (worker_id + 1) // n_workers
+            shard.append(np.asfortranarray(a[start:end]))
+        return tuple(shard)
+
+
+class _Aborted(Exception):
+    pass
+
+
+class _Barrier(object):
+    """
+    Barrier for processes, that can be aborted when one of them fails.
+    """
+    def __init__(self, n):
+        self.n = n
+        self.count = multiprocessing.Value('i', 0, lock=False)
+        self.generation = multiprocessing.Value('i', 0, lock=False)
+        self.aborted = multiprocessing.Value('b', 0, lock=False)
+        self.condition = multiprocessing.Condition()
+
+    def wait(self):
+        with self.condition:
+            if self.aborted.value:
+                raise _Aborted
+            generation = self.generation.value
+            self.count.value += 1
+            if self.count.value == self.n:
+                self.count.value = 0
+                self.generation.value += 1
+                self.condition.notify_all()
+                return
+            while generation == self.generation.value:
+                self.condition.wait()
+                if self.aborted.value:
+                    raise _Aborted
+
+    def abort(self):
+        with self.condition:
+            self.aborted.value = 1
+            self.condition.notify_all()
+
+
+def _shared_empty(nelems):
+    # anonymous mmap memory is shared with forked processes
+    buffer = mmap.mmap(-1, max(nelems, 1) * 4)
+    return np.frombuffer(buffer, np.float32, nelems)
+
+
+def _get_sorted_parameters(parameters):
+    return [parameters[name] for name in sorted(parameters)]
+
+
+def _get_shard_connector(parameters, gradients):
+    nelems = len(parameters)
+    matrix = CpuMatrix(parameters.reshape(nelems, 1), nelems, 1, 'float', 0)
+    dL_dmatrix = CpuMatrix(gradients.reshape(nelems, 1), nelems, 1, 'float', 0)
+    return Connector(matrix, 0, dL_dmatrix)
+
+
+def _synchronize(matrices):
+    contexts = set(m.last_modif_context for m in matrices)
+    contexts.discard(None)
+    for context in contexts:
+        context.synchronize()
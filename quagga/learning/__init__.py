@@ -13,4 +13,5 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ----------------------------------------------------------------------------
-from quagga.learning.RunLoop import RunLoop
\ No newline at end of file
+from quagga.learning.RunLoop import RunLoop
+from quagga.learning.DataParallelTrainer import DataParallelTrainer
\ No newline at end of file
@@ -0,0 +1,94 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import quagga
+import numpy as np
+from itertools import izip
+from quagga.matrix import Matrix
+from quagga.context import Context
+from quagga.matrix import RowSparseMatrix
+
+
+class SparseAdamStep(object):
+    """
+    Adam step for parameters with row-sparse derivatives (see
+    :class:`~quagga.matrix.RowSparseMatrix`). Only rows that are present in
+    the derivative are updated. The decaying first moment of the other rows
+    keeps moving them, these steps and the decay of the moment estimates
+    are applied when a row is updated again, so the updates are the same as
+    the ones of :class:`~quagga.learning.steps.AdamStep` up to float32
+    precision. Until then the row keeps its old value, call :meth:`flush`
+    to bring all rows up to date, for instance before saving the
+    parameters.
+    """
+    def __init__(self, parameters, learning_rate_policy, beta1=0.9, beta2=0.999, epsilon=1e-8):
+        if quagga.processor_type != 'cpu':
+            raise NotImplementedError('SparseAdamStep is implemented only for the cpu '
+                                      'backend, use AdamStep instead!')
+        self.parameters = parameters
+        self.m = []
+        self.v = []
+        self.contexts = []
+        for p in self.parameters:
+            m = Matrix.empty_like(p)
+            m.sync_fill(0.0)
+            self.m.append(m)
+            v = Matrix.empty_like(p)
+            v.sync_fill(0.0)
+            self.v.append(v)
+            self.contexts.append(Context(p.device_id))
+        self.learning_rate_policy = learning_rate_policy
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.epsilon = epsilon
+        self.blocking_contexts = []
+        self.last_updates = [None] * len(parameters)
+        self.iteration = 0
+        # step sizes of all iterations, the pending steps of a row are
+        # replayed with the step sizes of the iterations they belong to
+        self.learning_rates = np.zeros(1024)
+
+    def notify(self):
+        self.iteration += 1
+        del self.blocking_contexts[:]
+        learning_rate = -self.learning_rate_policy.value
+        learning_rate *= np.sqrt(1 - self.beta2**self.iteration) / (1 - self.beta1**self.iteration)
+        if self.iteration == len(self.learning_rates):
+            # queued updates keep reading the old array
+            self.learning_rates = np.concatenate((self.learning_rates, np.zeros_like(self.learning_rates)))
+        self.learning_rates[self.iteration] = learning_rate
+
+        for k, (p, m, v, context) in enumerate(izip(self.parameters, self.m, self.v, self.contexts)):
+            dL_dp = p.backward_matrix
+            if not isinstance(dL_dp, RowSparseMatrix):
+                raise ValueError('SparseAdamStep requires row-sparse derivatives!')
+            self.blocking_contexts.extend(dL_dp.last_modif_contexts)
+            if dL_dp.axis is None:
+                continue
+            if self.last_updates[k] is None:
+                n = p.ncols if dL_dp.axis else p.nrows
+                self.last_updates[k] = dL_dp.axis, np.zeros(int(n), np.int64)
+            axis, last_update = self.last_updates[k]
+            p.sparse_adam_update(context, self.learning_rates, self.beta1, self.beta2, self.epsilon, m, v, dL_dp, last_update, self.iteration, axis)
+
+    def flush(self):
+        """
+        Applies the pending steps and the pending decay of the moment
+        estimates to all rows.
+        """
+        for p, m, v, context, last_update in izip(self.parameters, self.m, self.v, self.contexts, self.last_updates):
+            if last_update:
+                axis, last_update = last_update
+                p.sparse_adam_update(context, self.learning_rates, self.beta1, self.beta2, self.epsilon, m, v, None, last_update, self.iteration, axis)
@@ -0,0 +1,81 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import quagga
+import numpy as np
+from itertools import izip
+from quagga.matrix import Matrix
+from quagga.context import Context
+from quagga.matrix import RowSparseMatrix
+
+
+class SparseMomentumStep(object):
+    """
+    Momentum step for parameters with row-sparse derivatives (see
+    :class:`~quagga.matrix.RowSparseMatrix`). Only rows that are present in
+    the derivative are updated, so the cost of an iteration depends on the
+    number of touched rows rather than on the size of the parameter.
+
+    The velocity of the other rows keeps moving them, these steps are
+    applied exactly when a row is updated again, provided the momentum does
+    not change. Until then the row keeps its old value, so the forward pass
+    that touches it sees the row without the pending steps. Call
+    :meth:`flush` to apply them to all rows, for instance before saving the
+    parameters.
+    """
+    def __init__(self, parameters, learning_rate_policy, momentum_policy):
+        if quagga.processor_type != 'cpu':
+            raise NotImplementedError('SparseMomentumStep is implemented only for the cpu '
+                                      'backend, use MomentumStep instead!')
+        self.parameters = parameters
+        self.velocity = []
+        for p in self.parameters:
+            v = Matrix.empty_like(p)
+            v.sync_fill(0.0)
+            self.velocity.append(v)
+        self.learning_rate_policy = learning_rate_policy
+        self.momentum_policy = momentum_policy
+        self.contexts = [Context(p.device_id) for p in parameters]
+        self.blocking_contexts = []
+        self.last_updates = [None] * len(parameters)
+        self.iteration = 0
+
+    def notify(self):
+        self.iteration += 1
+        del self.blocking_contexts[:]
+        learning_rate = -self.learning_rate_policy.value
+        momentum = self.momentum_policy.value
+        for k, (p, v, context) in enumerate(izip(self.parameters, self.velocity, self.contexts)):
+            dL_dp = p.backward_matrix
+            if not isinstance(dL_dp, RowSparseMatrix):
+                raise ValueError('SparseMomentumStep requires row-sparse derivatives!')
+            self.blocking_contexts.extend(dL_dp.last_modif_contexts)
+            if dL_dp.axis is None:
+                continue
+            if self.last_updates[k] is None:
+                n = p.ncols if dL_dp.axis else p.nrows
+                self.last_updates[k] = dL_dp.axis, np.zeros(int(n), np.int64)
+            axis, last_update = self.last_updates[k]
+            p.sparse_momentum_update(context, learning_rate, momentum, v, dL_dp, last_update, self.iteration, axis)
+
+    def flush(self):
+        """
+        Applies the pending steps to all rows.
+        """
+        momentum = self.momentum_policy.value
+        for p, v, context, last_update in izip(self.parameters, self.velocity, self.contexts, self.last_updates):
+            if last_update:
+                axis, last_update = last_update
+                p.sparse_momentum_update(context, 0.0, momentum, v, None, last_update, self.iteration, axis)
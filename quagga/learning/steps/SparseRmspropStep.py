@@ -0,0 +1,74 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import quagga
+import numpy as np
+from itertools import izip
+from quagga.matrix import Matrix
+from quagga.context import Context
+from quagga.matrix import RowSparseMatrix
+
+
+class SparseRmspropStep(object):
+    """
+    RMSprop step for parameters with row-sparse derivatives (see
+    :class:`~quagga.matrix.RowSparseMatrix`). Only rows that are present in
+    the derivative are updated, the decay of the mean squared derivative of
+    the other rows is applied when they are touched again, so the updates
+    are the same as the ones of :class:`~quagga.learning.steps.RmspropStep`.
+    """
+    def __init__(self, parameters, learning_rate_policy, ema_decay=0.9, epsilon=1e-6):
+        if quagga.processor_type != 'cpu':
+            raise NotImplementedError('SparseRmspropStep is implemented only for the cpu '
+                                      'backend, use RmspropStep instead!')
+        self.parameters = parameters
+        self.grad_sqr = []
+        for p in self.parameters:
+            grad_sqr = Matrix.empty_like(p)
+            grad_sqr.sync_fill(0.0)
+            self.grad_sqr.append(grad_sqr)
+        self.learning_rate_policy = learning_rate_policy
+        self.ema_decay = ema_decay
+        self.epsilon = epsilon
+        self.contexts = [Context(p.device_id) for p in parameters]
+        self.blocking_contexts = []
+        self.last_updates = [None] * len(parameters)
+        self.iteration = 0
+
+    def notify(self):
+        self.iteration += 1
+        del self.blocking_contexts[:]
+        learning_rate = -self.learning_rate_policy.value
+        for k, (p, gsqr, context) in enumerate(izip(self.parameters, self.grad_sqr, self.contexts)):
+            dL_dp = p.backward_matrix
+            if not isinstance(dL_dp, RowSparseMatrix):
+                raise ValueError('SparseRmspropStep requires row-sparse derivatives!')
+            self.blocking_contexts.extend(dL_dp.last_modif_contexts)
+            if dL_dp.axis is None:
+                continue
+            if self.last_updates[k] is None:
+                n = p.ncols if dL_dp.axis else p.nrows
+                self.last_updates[k] = dL_dp.axis, np.zeros(int(n), np.int64)
+            axis, last_update = self.last_updates[k]
+            p.sparse_rmsprop_update(context, learning_rate, self.ema_decay, self.epsilon, gsqr, dL_dp, last_update, self.iteration, axis)
+
+    def flush(self):
+        """
+        Applies the pending decay to the mean squared derivatives of all rows.
+        """
+        for p, gsqr, context, last_update in izip(self.parameters, self.grad_sqr, self.contexts, self.last_updates):
+            if last_update:
+                axis, last_update = last_update
+                p.sparse_rmsprop_update(context, 0.0, self.ema_decay, self.epsilon, gsqr, None, last_update, self.iteration, axis)
@@ -19,4 +19,7 @@ from quagga.learning.steps.AdamStep import AdamStep
 from quagga.learning.steps.RmspropStep import RmspropStep
 from quagga.learning.steps.MomentumStep import MomentumStep
 from quagga.learning.steps.SparceSgdStep import SparseSgdStep
+from quagga.learning.steps.SparseAdamStep import SparseAdamStep
+from quagga.learning.steps.SparseRmspropStep import SparseRmspropStep
+from quagga.learning.steps.SparseMomentumStep import SparseMomentumStep
 from quagga.learning.steps.RmspropNagStep import RmspropNagStep
@@ -13,14 +13,114 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ----------------------------------------------------------------------------
+import copy
 import quagga
+import inspect
 import weakref
+import threading
 import numpy as np
 from itertools import izip
+from itertools import chain
+from functools import wraps
 from quagga.matrix import ShapeElement
 
 
+def _async_operation(*outputs):
+    """
+    Makes a ``CpuMatrix`` method respect asynchronous
+    :class:`~quagga.context.CpuContext`. If the ``context`` argument defers
+    its work, the decorated method waits for the last modification contexts
+    of all matrices it touches (as ``GpuMatrix.wait_matrices`` does), marks
+    arguments named in ``outputs`` as modified in the context and enqueues
+    itself into the context. Otherwise the method is called immediately.
+
+    The enqueued method gets frozen copies of the matrices (see
+    :meth:`CpuMatrix._frozen`), so it works on the shapes the matrices have
+    when it is called, not on the shapes they have when the worker gets to
+    it (the next batch may already be of another size by then).
+
+    If ``CpuMatrix.tracer`` is set, it is called with the method name and
+    the lists of modified and used matrices before the method is executed.
+    """
+    def decorator(method):
+        arg_names = inspect.getargspec(method).args
+        context_position = arg_names.index('context')
+
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            if len(args) > context_position:
+                context = args[context_position]
+            else:
+                context = kwargs.get('context')
+            synchronous = not getattr(context, 'deferred', False)
+            if synchronous and CpuMatrix.tracer is None:
+                return method(*args, **kwargs)
+            modified_matrices = []
+            used_matrices = []
+            for name, value in inspect.getcallargs(method, *args, **kwargs).iteritems():
+                if name == 'context':
+                    continue
+                matrices = modified_matrices if name in outputs else used_matrices
+                matrices.extend(_get_matrices(value))
+            if CpuMatrix.tracer is not None:
+                CpuMatrix.tracer(method.__name__, modified_matrices, used_matrices)
+            if synchronous:
+                return method(*args, **kwargs)
+            _wait_matrices(context, modified_matrices, used_matrices)
+            callargs = inspect.getcallargs(method, *args, **kwargs)
+            args = [callargs[name] if name == 'context' else _freeze(callargs[name])
+                    for name in arg_names]
+            context.enqueue(method, *args)
+        return wrapper
+    return decorator
+
+
+def _freeze(value):
+    if value is None or isinstance(value, (np.ndarray, basestring)):
+        return value
+    if isinstance(value, ShapeElement):
+        return ShapeElement(value.value)
+    if hasattr(value, 'last_modif_context'):
+        # connectors delegate `_frozen` to their forward matrices, other
+        # matrices (like RowSparseMatrix) have no shapes to freeze
+        frozen = getattr(value, '_frozen', None)
+        return frozen() if frozen else value
+    if isinstance(value, tuple):
+        return tuple(_freeze(e) for e in value)
+    if hasattr(value, '__iter__'):
+        return [_freeze(e) for e in value]
+    return value
+
+
+def _get_matrices(value):
+    if value is None or isinstance(value, (np.ndarray, ShapeElement, basestring)):
+        return []
+    if hasattr(value, 'last_modif_context'):
+        return [value]
+    if hasattr(value, '__iter__'):
+        return list(chain(*(_get_matrices(e) for e in value)))
+    return []
+
+
+def _wait_matrices(context, modified_matrices, used_matrices):
+    contexts = set(e.last_modif_context for e in chain(modified_matrices, used_matrices))
+    contexts.discard(None)
+    contexts.discard(context)
+    context.wait(*contexts)
+    for e in used_matrices:
+        e.last_usage_context = context
+    for e in modified_matrices:
+        e.last_modif_context = context
+
+
 class CpuMatrix(object):
+    # callable that observes matrix operations, see :func:`_async_operation`
+    tracer = None
+    # (buffer, index) of elements of a ContiguousList, see :func:`_get_buffer_view`
+    sequence_position = None
+    # (matrices, slices) that are views of the matrix, see :meth:`share_hstack`
+    shared_blocks = None
+
     def __init__(self, data, nrows, ncols, dtype, device_id):
         self.data = data
         self._nrows = nrows if isinstance(nrows, ShapeElement) else ShapeElement(nrows)
@@ -32,7 +132,7 @@ class CpuMatrix(object):
 
     @staticmethod
     def get_setable_attributes():
-        return ['nrows', 'ncols', 'npa']
+        return ['nrows', 'ncols', 'npa', 'last_modif_context']
 
     @property
     def npa(self):
@@ -46,14 +146,34 @@ class CpuMatrix(object):
     def nelems(self):
         return self._nrows.value * self._ncols.value
 
+    def _frozen(self):
+        """
+        Returns a copy of the matrix that shares its memory but has a fixed
+        shape, it is not changed with the shape of the matrix.
+        """
+        frozen = copy.copy(self)
+        frozen._nrows = ShapeElement(self._nrows.value)
+        frozen._ncols = ShapeElement(self._ncols.value)
+        return frozen
+
+    def _get_allocated_shape(self):
+        # row and column views can grow up to the shape of their base, while
+        # memory planned matrices and contiguous views are backed by flat
+        # memory of any shape
+        base = self.data.base
+        if getattr(base, 'ndim', None) == 2 and \
+                base.shape[0] >= self.data.shape[0] and \
+                base.shape[1] >= self.data.shape[1]:
+            return base.shape
+        return self.data.shape
+
     @property
     def nrows(self):
         return self._nrows
 
     @nrows.setter
     def nrows(self, value):
-        data = self.data.base if self.data.base is not None else self.data
-        if value > data.shape[0]:
+        if value > self._get_allocated_shape()[0]:
             raise ValueError('There is no so many preallocated memory! '
                              'Maximum for `nrows` is {}'.format(self.data.shape[0]))
         self._nrows[:] = value
@@ -64,8 +184,7 @@ class CpuMatrix(object):
 
     @ncols.setter
     def ncols(self, value):
-        data = self.data.base if self.data.base is not None else self.data
-        if value > data.shape[1]:
+        if value > self._get_allocated_shape()[1]:
             raise ValueError('There is no so many preallocated memory! '
                              'Maximum for `ncols` is {}'.format(self.data.shape[1]))
         self._ncols[:] = value
@@ -79,17 +198,17 @@ class CpuMatrix(object):
             a_proxy = weakref.proxy(a)
             if isinstance(self.ncols, ShapeElement):
                 modif_handler = lambda: setattr(a_proxy, 'data', self_proxy.data[key, np.newaxis])
-                self.ncols.add_modification_handler(modif_handler)
+                self.ncols.add_modification_handler(modif_handler, a)
             return a
         if isinstance(key, ShapeElement):
             data = self.npa[key.value, np.newaxis]
             a = CpuMatrix(data, 1, self.ncols, self.dtype, self.device_id)
             a_proxy = weakref.proxy(a)
-            modif_handler = lambda: setattr(a, 'data', self_proxy.data[key.value, np.newaxis])
-            key.add_modification_handler(modif_handler)
+            modif_handler = lambda: setattr(a_proxy, 'data', self_proxy.data[key.value, np.newaxis])
+            key.add_modification_handler(modif_handler, a)
             if isinstance(self.ncols, ShapeElement):
                 modif_handler = lambda: setattr(a_proxy, 'data', self_proxy.data[key.value, np.newaxis])
-                self.ncols.add_modification_handler(modif_handler)
+                self.ncols.add_modification_handler(modif_handler, a)
             return a
         if isinstance(key, slice) and self.ncols == 1:
             key = (key, 0)
@@ -104,29 +223,29 @@ class CpuMatrix(object):
                 if isinstance(nrows, ShapeElement):
                     a_proxy = weakref.proxy(a)
                     modif_handler = lambda: setattr(a_proxy, 'data', self_proxy.data[start:, key[1], np.newaxis])
-                    nrows.add_modification_handler(modif_handler)
+                    nrows.add_modification_handler(modif_handler, a)
                 return a
             elif isinstance(start, int) and isinstance(key[1], ShapeElement):
                 data = self.npa[start:, key[1].value, np.newaxis]
                 a = CpuMatrix(data, nrows, 1, self.dtype, self.device_id)
                 a_proxy = weakref.proxy(a)
                 modif_handler = lambda: setattr(a_proxy, 'data', self_proxy.data[start:, key[1].value, np.newaxis])
-                key[1].add_modification_handler(modif_handler)
+                key[1].add_modification_handler(modif_handler, a)
                 return a
             elif isinstance(start, ShapeElement) and isinstance(key[1], int):
                 data = self.npa[start.value:, key[1], np.newaxis]
                 a = CpuMatrix(data, nrows, 1, self.dtype, self.device_id)
                 a_proxy = weakref.proxy(a)
                 modif_handler = lambda: setattr(a_proxy, 'data', self_proxy.data[start.value:, key[1], np.newaxis])
-                start.add_modification_handler(modif_handler)
+                start.add_modification_handler(modif_handler, a)
                 return a
             elif isinstance(start, ShapeElement) and isinstance(key[1], ShapeElement):
                 data = self.npa[start.value:, key[1].value, np.newaxis]
                 a = CpuMatrix(data, nrows, 1, self.dtype, self.device_id)
                 a_proxy = weakref.proxy(a)
                 modif_handler = lambda: setattr(a_proxy, 'data', self_proxy.data[start.value:, key[1].value, np.newaxis])
-                key[1].add_modification_handler(modif_handler)
-                start.add_modification_handler(modif_handler)
+                key[1].add_modification_handler(modif_handler, a)
+                start.add_modification_handler(modif_handler, a)
                 return a
         # get column slice
         if key[0] == slice(None) and isinstance(key[1], slice) and not key[1].step:
@@ -139,17 +258,17 @@ class CpuMatrix(object):
                 a_proxy = weakref.proxy(a)
                 if isinstance(self.nrows, ShapeElement):
                     modif_handler = lambda: setattr(a_proxy, 'data', self_proxy.data[:, start:])
-                    self.nrows.add_modification_handler(modif_handler)
+                    self.nrows.add_modification_handler(modif_handler, a)
                 return a
             elif isinstance(start, ShapeElement):
                 data = self.npa[:, start.value:]
                 a = CpuMatrix(data, self.nrows, ncols, self.dtype, self.device_id)
                 a_proxy = weakref.proxy(a)
                 modif_handler = lambda: setattr(a_proxy, 'data', self_proxy.data[:, start.value:])
-                start.add_modification_handler(modif_handler)
+                start.add_modification_handler(modif_handler, a)
                 if isinstance(self.nrows, ShapeElement):
                     modif_handler = lambda: setattr(a_proxy, 'data', self_proxy.data[:, start.value:])
-                    self.nrows.add_modification_handler(modif_handler)
+                    self.nrows.add_modification_handler(modif_handler, a)
                 return a
         raise ValueError('This slice: {} is unsupported!'.format(key))
 
@@ -198,12 +317,88 @@ class CpuMatrix(object):
     def empty_like(cls, other, device_id=None):
         return cls.empty(other.nrows, other.ncols, other.dtype, device_id)
 
+    def contiguous_view(self, offset, nrows, ncols):
+        """
+        Returns a matrix that shares ``nrows * ncols`` contiguous elements
+        of the matrix memory starting from the ``offset`` element.
+        """
+        size = int(nrows) * int(ncols)
+        data = self.data.reshape(-1)[offset:offset + size]
+        return CpuMatrix(data.reshape(int(nrows), int(ncols)), nrows, ncols, self.dtype, self.device_id)
+
+    def share_hstack(self, matrices, col_slices=None):
+        """
+        Moves the memory of ``matrices`` into column blocks of the matrix,
+        so ``assign_hstack`` and ``hsplit`` with the same matrices do not
+        copy anything as long as the blocks keep their places. The values
+        of ``matrices`` are preserved, while views that were taken of them
+        before are not updated.
+
+        Memory is shared only if every matrix owns memory of exactly the
+        shape of its block, otherwise nothing is changed.
+
+        Returns
+        -------
+        bool
+            Whether the memory is shared
+        """
+        return self._share(matrices, col_slices, 1)
+
+    def share_vstack(self, matrices, row_slices=None):
+        """
+        The same as :meth:`share_hstack` for row blocks, ``assign_vstack``
+        and ``vsplit``.
+        """
+        return self._share(matrices, row_slices, 0)
+
+    def _share(self, matrices, slices, axis):
+        if self.shared_blocks is not None or len(set(id(m) for m in matrices)) != len(matrices):
+            return False
+        slices = _get_stack_slices(matrices, axis, slices)
+        blocks = []
+        for m, (start, stop) in izip(matrices, slices):
+            block = self.data[:, start:stop] if axis else self.data[start:stop]
+            if m.data.base is not None or m.data.shape != block.shape or \
+                    m.data.dtype != block.dtype or m.shared_blocks is not None:
+                return False
+            blocks.append(block)
+        for m, block in izip(matrices, blocks):
+            block[...] = m.data
+            m.data = block
+        self.shared_blocks = list(matrices), slices
+        return True
+
+    def _is_sharing(self, matrices, slices, axis):
+        # whether `matrices` are views of the matrix blocks at `slices`
+        if self.shared_blocks is None:
+            return False
+        shared_matrices, shared_slices = self.shared_blocks
+        if len(matrices) != len(shared_matrices) or \
+                any(a is not b for a, b in izip(matrices, shared_matrices)):
+            return False
+        if _get_stack_slices(matrices, axis, slices) != shared_slices:
+            raise ValueError('Shared matrices can not be stacked, '
+                             'their blocks have been moved!')
+        return True
+
     def to_host(self, context=None):
+        if CpuMatrix.tracer is not None:
+            CpuMatrix.tracer('to_host', [], [self])
+        context = context if context else self.last_modif_context
+        if context and context.deferred:
+            _wait_matrices(context, [], [self])
+            context.synchronize()
         return np.copy(self.npa)
 
     def assign(self, context, a):
-        self.nrows, self.ncols = a.nrows, a.ncols
-        self.npa = np.copy(a.npa)
+        # shapes are copied by value, like the values, so later changes of
+        # `a` are not propagated
+        self.nrows, self.ncols = a.nrows.value, a.ncols.value
+        self._assign(context, a)
+
+    @_async_operation('self')
+    def _assign(self, context, a):
+        self.npa = a.npa
 
     def assign_npa(self, context, a, nrows=None, ncols=None):
         # TODO(sergii): add support for ctypes pointer
@@ -214,27 +409,32 @@ class CpuMatrix(object):
         if a.ndim != 2:
             raise ValueError('CpuMatrix works only with 2-d numpy arrays!')
         self.nrows, self.ncols = a.shape
-        self.npa = np.copy(a)
+        self._assign_npa(context, np.copy(a))
 
+    @_async_operation('self')
+    def _assign_npa(self, context, a):
+        self.npa = a
+
+    @_async_operation('self')
     def fill(self, context, value, mask=None, true_value=1.0):
         if mask:
-            self.npa = (mask.npa == true_value) * value + \
-                       (mask.npa != true_value) * self.npa
+            np.copyto(self.npa, value, where=(mask.npa == true_value))
         else:
             self.npa = value
 
     def sync_fill(self, value):
         self.npa = value
 
+    @_async_operation('out')
     def slice_columns(self, context, column_indxs, out):
-        out.npa = self.npa[:, column_indxs.npa.flatten()]
+        _take(self.npa, column_indxs.npa.ravel(), 1, out.npa)
 
+    @_async_operation('self')
     def add_scaled_columns_slice(self, context, column_indxs, alpha, a):
         """
         self[:, column_indxs] += alpha * a
         """
-        for i, idx in enumerate(column_indxs.npa.flatten()):
-            self.npa[:, idx] += alpha * a.npa[:, i]
+        _scatter_add_rows(self.npa.T, column_indxs.npa.flatten(), alpha, a.npa.T)
 
     def add_columns_slice(self, context, column_indxs, a):
         """
@@ -242,18 +442,20 @@ class CpuMatrix(object):
         """
         self.add_scaled_columns_slice(context, column_indxs, 1.0, a)
 
+    @_async_operation('out')
     def slice_columns_and_transpose(self, context, column_indxs, out):
-        out.npa = self.npa[:, column_indxs.npa.flatten()].T
+        _take(self.npa.T, column_indxs.npa.ravel(), 0, out.npa)
 
+    @_async_operation('out')
     def slice_rows(self, context, row_indxs, out):
-        out.npa = self.npa[row_indxs.npa.flatten()]
+        _take(self.npa, row_indxs.npa.ravel(), 0, out.npa)
 
+    @_async_operation('self')
     def add_scaled_rows_slice(self, context, row_indxs, alpha, a):
         """
         self[row_indxs] += alpha * a
         """
-        for i, idx in enumerate(row_indxs.npa.flatten()):
-            self.npa[idx] += alpha * a.npa[i]
+        _scatter_add_rows(self.npa, row_indxs.npa.flatten(), alpha, a.npa)
 
     def add_rows_slice(self, context, row_indxs, a):
         """
@@ -261,27 +463,41 @@ class CpuMatrix(object):
         """
         self.add_scaled_rows_slice(context, row_indxs, 1.0, a)
 
+    @_async_operation('dense_matrices')
     def slice_rows_batch(self, context, rows_indxs, dense_matrices):
         """
         for k in range(K):
             dense_matrices[k] = self[rows_indxs[:, k]]
         """
-        n = rows_indxs.ncols
+        n = int(rows_indxs.ncols)
+        out = _get_buffer_view(dense_matrices[:n])
+        if out is not None:
+            _take(self.npa, rows_indxs.npa[:, :n].T, 0, out)
+            return
         for i in xrange(n):
-            dense_matrices[i].npa = self.npa[rows_indxs.npa[:, i]]
+            _take(self.npa, rows_indxs.npa[:, i], 0, dense_matrices[i].npa)
 
+    @_async_operation('self')
     def add_scaled_rows_batch_slice(self, context, rows_indxs, alpha, dense_matrices):
         """
         for k in range(K):
             self[rows_indxs[:, k]] += alpha * dense_matrices[k]
         """
-        for k, m in enumerate(dense_matrices):
-            for i, idx in enumerate(rows_indxs.npa[:, k]):
-                self.npa[idx] += alpha * m.npa[i]
+        n = len(dense_matrices)
+        if n == 0:
+            return
+        indxs = rows_indxs.npa[:, :n].flatten(order='F')
+        values = _get_buffer_view(dense_matrices)
+        if values is None:
+            values = np.vstack([m.npa for m in dense_matrices])
+        else:
+            values = values.reshape(-1, values.shape[2])
+        _scatter_add_rows(self.npa, indxs, alpha, values)
 
     def add_rows_batch_slice(self, context, rows_indxs, dense_matrices):
         self.add_scaled_rows_batch_slice(context, rows_indxs, 1.0, dense_matrices)
 
+    @_async_operation('self')
     def assign_hstack(self, context, matrices):
         ncols = 0
         for matrix in matrices:
@@ -292,9 +508,19 @@ class CpuMatrix(object):
         if ncols != self.ncols:
             raise ValueError("The number of columns in the assigning matrix differs"
                              "from the summed numbers of columns in buffers!")
-        self.npa = np.hstack(m.npa for m in matrices)
+        if self._is_sharing(matrices, None, 1):
+            return
+        npa = self.npa
+        j = 0
+        for m in matrices:
+            m = m.npa
+            npa[:, j:j+m.shape[1]] = m
+            j += m.shape[1]
 
+    @_async_operation('matrices')
     def hsplit(self, context, matrices, col_slices=None):
+        if self._is_sharing(matrices, col_slices, 1):
+            return
         if col_slices:
             for i, col_slice in enumerate(col_slices):
                 matrices[i].npa = self.npa[:, col_slice[0]:col_slice[1]]
@@ -316,17 +542,39 @@ class CpuMatrix(object):
                 m.npa = _m
 
     @staticmethod
+    @_async_operation('output_sequence')
     def batch_hstack(context, x_sequence, y_sequence, output_sequence):
+        x, y, out = _get_buffer_views(x_sequence, y_sequence, output_sequence)
+        if out is not None:
+            x_ncols = x.shape[2]
+            out[:, :, :x_ncols] = x
+            out[:, :, x_ncols:] = y
+            return
         for x, y, out in izip(x_sequence, y_sequence, output_sequence):
-            out.npa = np.hstack((x.npa, y.npa))
+            if out._is_sharing((x, y), None, 1):
+                continue
+            x_ncols = x.npa.shape[1]
+            out_npa = out.npa
+            out_npa[:, :x_ncols] = x.npa
+            out_npa[:, x_ncols:] = y.npa
 
     @staticmethod
+    @_async_operation('x_sequence', 'y_sequence')
     def batch_hsplit(context, input_sequence, x_sequence, y_sequence):
+        a, x, y = _get_buffer_views(input_sequence, x_sequence, y_sequence)
+        if a is not None:
+            x_ncols = x.shape[2]
+            x[...] = a[:, :, :x_ncols]
+            y[...] = a[:, :, x_ncols:]
+            return
         x_ncols = x_sequence[0].npa.shape[1]
         for in_matrix, x, y in izip(input_sequence, x_sequence, y_sequence):
+            if in_matrix._is_sharing((x, y), None, 1):
+                continue
             x.npa = in_matrix.npa[:, :x_ncols]
             y.npa = in_matrix.npa[:, x_ncols:]
 
+    @_async_operation('self')
     def assign_vstack(self, context, matrices):
         nrows = 0
         for matrix in matrices:
@@ -337,9 +585,19 @@ class CpuMatrix(object):
         if nrows != self.nrows:
             raise ValueError("The number of rows in the assigning matrix differs"
                              "from the summed numbers of rows in buffers!")
-        self.npa = np.vstack(m.npa for m in matrices)
+        if self._is_sharing(matrices, None, 0):
+            return
+        npa = self.npa
+        i = 0
+        for m in matrices:
+            m = m.npa
+            npa[i:i+m.shape[0]] = m
+            i += m.shape[0]
 
+    @_async_operation('matrices')
     def vsplit(self, context, matrices, row_slices=None):
+        if self._is_sharing(matrices, row_slices, 0):
+            return
         if row_slices:
             for i, row_slice in enumerate(row_slices):
                 matrices[i].npa = self.npa[row_slice[0]:row_slice[1], :]
@@ -360,128 +618,230 @@ class CpuMatrix(object):
             for _m, m in izip(_matrices, matrices):
                 m.npa = _m
 
+    @_async_operation('self')
     def assign_sequential_mean_pooling(self, context, matrices):
-        for i in xrange(matrices[0].nrows):
-            self.npa[i] = np.mean([matrix.npa[i] for matrix in matrices], axis=0)
+        self.assign_sequential_sum_pooling(context, matrices)
+        self.npa /= len(matrices)
 
+    @_async_operation('self')
     def assign_sequential_sum_pooling(self, context, matrices):
-        self.npa = np.sum(m.npa for m in matrices)
-
+        sequence = _get_buffer_view(matrices)
+        if sequence is not None:
+            np.sum(sequence, axis=0, out=self.npa)
+            return
+        npa = self.npa
+        npa[...] = matrices[0].npa
+        for m in matrices[1:]:
+            npa += m.npa
+
+    @_async_operation('self')
     def assign_sequential_weighted_sum(self, context, w, matrices):
-        self.npa = np.sum(w.npa[:, i, np.newaxis] * m.npa
-                          for i, m in enumerate(matrices))
+        """
+        self = sum_i w[:, i] .* matrices[i]
+        """
+        h = _get_sequence(matrices)[0]
+        np.einsum('bt,tbd->bd', w.npa[:, :len(matrices)], h, out=self.npa)
+
+    @_async_operation('self')
+    def assign_sequential_dot(self, context, matrices, u):
+        """
+        self[:, i] = matrices[i] * u
+        """
+        n = len(matrices)
+        h, scores = _get_sequence(matrices, (n, self.npa.shape[0]))
+        np.einsum('tbd,d->tb', h, u.npa[:, 0], out=scores)
+        self.npa[:, :n] = scores.T
+        self.npa[:, n:] = 0.0
 
     @staticmethod
+    @_async_operation('matrices')
     def sequentially_tile(context, a, matrices):
+        sequence = _get_buffer_view(matrices)
+        if sequence is not None:
+            sequence[...] = a.npa
+            return
         for m in matrices:
             m.npa = a.npa
 
+    @_async_operation('self')
     def assign_dL_dpre_a(self, context, derivative, a, matrices):
-        self.fill(context, 0.0)
-        for i in xrange(len(matrices)):
-            for j, m_j in enumerate(matrices):
-                if i == j:
-                    _a = (1.0 - a.npa[:, i, np.newaxis]) * \
-                         a.npa[:, i, np.newaxis]
-                else:
-                    _a = - a.npa[:, i, np.newaxis] * a.npa[:, j, np.newaxis]
-                self.npa[:, i] += np.sum(_a * m_j.npa * derivative.npa, axis=1)
+        """
+        Derivative of the attention output w.r.t. pre-softmax scores:
 
+        g[:, i] = sum(matrices[i] .* derivative, axis=1)
+        self = a .* (g - sum(a .* g, axis=1))
+        """
+        n = len(matrices)
+        nrows = self.npa.shape[0]
+        h, g, a_g, sum_a_g = _get_sequence(matrices, (nrows, n), (nrows, n), (nrows, 1))
+        a_npa = a.npa[:, :n]
+        np.einsum('tbd,bd->bt', h, derivative.npa, out=g)
+        np.multiply(a_npa, g, a_g)
+        np.sum(a_g, axis=1, keepdims=True, out=sum_a_g)
+        np.multiply(a_npa, sum_a_g, g)
+        np.subtract(a_g, g, self.npa[:, :n])
+        self.npa[:, n:] = 0.0
+
+    @_async_operation('self')
     def add_attention_derivative(self, context, dL_dpre_a, matrices):
-        for i in xrange(len(matrices)):
-            _a = dL_dpre_a.npa[:, i, np.newaxis]
-            self.npa += np.sum(_a * matrices[i].npa, axis=0, keepdims=True).T
+        """
+        self += sum_i matrices[i].T * dL_dpre_a[:, i]
+        """
+        n = len(matrices)
+        h, scratch = _get_sequence(matrices, self.npa.shape)
+        np.einsum('bt,tbd->d', dL_dpre_a.npa[:, :n], h, out=scratch[:, 0])
+        self.npa += scratch
 
     @staticmethod
+    @_async_operation('matrices_derivs')
     def add_attention_tile(context, derivative, a, dL_dpre_a, u, matrices_derivs):
-        for i, m_d in enumerate(matrices_derivs):
-            m_d.npa += a.npa[:, i, np.newaxis] * derivative.npa + \
-                       dL_dpre_a.npa[:, i, np.newaxis] * u.npa.T
+        """
+        matrices_derivs[i] += a[:, i] .* derivative + dL_dpre_a[:, i] * u.T
+        """
+        n = len(matrices_derivs)
+        if n == 0:
+            return
+        shape = (n, ) + derivative.npa.shape
+        dL_dh = _get_sequence_view(matrices_derivs, writable=True)
+        if dL_dh is None:
+            increment, scratch = _get_scratch(shape, shape)
+        else:
+            scratch = _get_scratch(shape)
+        np.multiply(a.npa[:, :n].T[:, :, np.newaxis], derivative.npa, scratch)
+        if dL_dh is None:
+            np.multiply(dL_dpre_a.npa[:, :n].T[:, :, np.newaxis], u.npa[:, 0], increment)
+            increment += scratch
+            for k, m in enumerate(matrices_derivs):
+                m.npa += increment[k]
+        else:
+            dL_dh += scratch
+            np.multiply(dL_dpre_a.npa[:, :n].T[:, :, np.newaxis], u.npa[:, 0], scratch)
+            dL_dh += scratch
 
+    @_async_operation('self')
     def tile(self, context, axis, a):
-        n = int(self.nrows if axis == 0 else self.ncols)
-        self.npa = np.repeat(a.npa, n, axis)
+        if a.npa.shape[axis] == 1:
+            # broadcasting assignment repeats the only row or column
+            self.npa = a.npa
+        else:
+            n = int(self.nrows if axis == 0 else self.ncols)
+            self.npa = np.repeat(a.npa, n, axis)
 
+    @_async_operation('self')
     def assign_repeat(self, context, a, repeats, axis):
-        reps = [1, 1]
-        reps[axis] = int(repeats)
-        self.npa = np.tile(a.npa, reps)
-
+        npa, a = self.npa, a.npa
+        n = a.shape[axis]
+        for k in xrange(int(repeats)):
+            if axis == 0:
+                npa[k*n:(k+1)*n] = a
+            else:
+                npa[:, k*n:(k+1)*n] = a
+
+    @_async_operation('self')
     def add_repeat_derivative(self, context, a, repeats, axis):
-        n = self.npa.shape[axis]
+        repeats = int(repeats)
+        npa = self.npa
+        nrows, ncols = npa.shape
+        scratch = _get_scratch(npa.shape)
         if axis == 0:
-            for i in xrange(repeats):
-                self.npa += a.npa[i*n:(i+1)*n]
+            np.sum(a.npa[:repeats*nrows].reshape(repeats, nrows, ncols), axis=0, out=scratch)
         elif axis == 1:
-            for i in xrange(repeats):
-                self.npa += a.npa[:, i*n:(i+1)*n]
+            np.sum(a.npa[:, :repeats*ncols].reshape(nrows, repeats, ncols), axis=1, out=scratch)
         else:
             raise ValueError('TODO')
+        npa += scratch
 
     @staticmethod
     def get_random_generator(seed):
         return np.random.RandomState(seed)
 
+    @_async_operation('out')
     def dropout(self, context, generator, dropout_prob, out):
-        out.npa = generator.binomial(n=1, p=1-dropout_prob, size=self.npa.shape).astype(np.float32) * self.npa
+        mask = generator.binomial(n=1, p=1-dropout_prob, size=self.npa.shape)
+        np.multiply(self.npa, mask, out.npa, casting='unsafe')
 
+    @_async_operation('out')
     def add_gaussian_noise(self, context, generator, mean, std, out):
-        out.npa = generator.normal(loc=mean, scale=std, size=self.npa.shape).astype(np.float32) + self.npa
+        noise = generator.normal(loc=mean, scale=std, size=self.npa.shape)
+        np.add(self.npa, noise, out.npa, casting='unsafe')
 
     def assign_gaussian_noise(self, context, generator, mean, std):
         # TODO(sergii)
         raise NotImplemented()
 
+    @_async_operation('self')
     def assign_mask_zeros(self, context, a, b):
         """
         self = a .* (b != 0)
         """
 
-        self.npa = a.npa * (b.npa != 0)
+        scratch = _get_scratch(b.npa.shape)
+        np.not_equal(b.npa, 0, scratch)
+        np.multiply(a.npa, scratch, self.npa)
 
+    @_async_operation('self')
     def add_mask_zeros(self, context, a, b):
         """
         self += a .* (b != 0)
         """
 
-        self.npa += a.npa * (b.npa != 0)
+        npa = self.npa
+        scratch, b_nonzero = _get_scratch(npa.shape, b.npa.shape)
+        np.not_equal(b.npa, 0, b_nonzero)
+        np.multiply(a.npa, b_nonzero, scratch)
+        npa += scratch
 
+    @_async_operation('self')
     def assign_masked_addition(self, context, mask, a, b):
         """
         self = mask .* a + (1 - mask) .* b
         """
 
-        self.npa = mask.npa * a.npa + (1 - mask.npa) * b.npa
+        npa = self.npa
+        mask_a, one_minus_mask = _get_scratch(npa.shape, mask.npa.shape)
+        np.multiply(mask.npa, a.npa, mask_a)
+        np.subtract(1, mask.npa, one_minus_mask)
+        np.multiply(one_minus_mask, b.npa, npa)
+        npa += mask_a
 
+    @_async_operation('self')
     def add_hprod_one_minus_mask(self, context, mask, a):
         """
         self += (1 - mask) .* a
         """
 
-        self.npa += (1 - mask.npa) * a.npa
+        npa = self.npa
+        scratch, one_minus_mask = _get_scratch(npa.shape, mask.npa.shape)
+        np.subtract(1, mask.npa, one_minus_mask)
+        np.multiply(one_minus_mask, a.npa, scratch)
+        npa += scratch
 
+    @_async_operation('self')
     def mask_column_numbers_row_wise(self, context, numbers):
         """
         self[i, j] = j < numbers[i]
         """
-        for i in xrange(numbers.npa.shape[0]):
-            self.npa[i] = np.arange(self.npa.shape[1]) < numbers.npa[i]
+        np.less(np.arange(self.npa.shape[1]), numbers.npa, self.npa)
 
+    @_async_operation('self', 'out')
     def clip(self, context, min_value, max_value, out=None):
         if out is None:
             out = self
-        out.npa = np.clip(self.npa, min_value, max_value)
+        np.clip(self.npa, min_value, max_value, out.npa)
 
+    @_async_operation('tanh_matrix', 'derivative_matrix')
     def tanh(self, context, tanh_matrix, derivative_matrix=None):
         np.tanh(self.npa, tanh_matrix.npa)
         if derivative_matrix:
-            derivative_matrix.npa = 1.0 - tanh_matrix.npa ** 2
+            _tanh_derivative(tanh_matrix.npa, derivative_matrix.npa)
 
+    @_async_operation('sigmoid_matrix', 'derivative_matrix')
     def sigmoid(self, context, sigmoid_matrix, derivative_matrix=None):
-        sigmoid_matrix.npa = 1.0 / (1.0 + np.exp(-self.npa))
+        _sigmoid(self.npa, sigmoid_matrix.npa)
         if derivative_matrix:
-            derivative_matrix.npa = sigmoid_matrix.npa * (1.0 - sigmoid_matrix.npa)
+            _sigmoid_derivative(sigmoid_matrix.npa, derivative_matrix.npa)
 
+    @_async_operation('tanh_sigm_matrix', 'derivative_matrix')
     def tanh_sigm(self, context, tanh_sigm_matrix, derivative_matrix=None, axis=0):
         """
         This is a fancy function that is used during forward propagation into
@@ -491,94 +851,246 @@ class CpuMatrix(object):
 
         n = self.npa.shape[axis] / 4
         if axis == 0:
-            tanh_npa = np.tanh(self.npa[:n])
-            sigmoid_npa = 1.0 / (1.0 + np.exp(-self.npa[n:]))
-            tanh_sigm_matrix.npa = np.vstack((tanh_npa, sigmoid_npa))
+            split = lambda a: (a[:n], a[n:])
         elif axis == 1:
-            tanh_npa = np.tanh(self.npa[:, :n])
-            sigmoid_npa = 1.0 / (1.0 + np.exp(-self.npa[:, n:]))
-            tanh_sigm_matrix.npa = np.hstack((tanh_npa, sigmoid_npa))
+            split = lambda a: (a[:, :n], a[:, n:])
         else:
             raise ValueError('TODO')
+        pre_tanh, pre_sigmoid = split(self.npa)
+        tanh_npa, sigmoid_npa = split(tanh_sigm_matrix.npa)
+        np.tanh(pre_tanh, tanh_npa)
+        _sigmoid(pre_sigmoid, sigmoid_npa)
         if derivative_matrix:
-            tanh_der_npa = 1.0 - tanh_npa ** 2
-            sigmoid_der_npa = sigmoid_npa * (1.0 - sigmoid_npa)
-            f = np.hstack if axis else np.vstack
-            derivative_matrix.npa = f((tanh_der_npa, sigmoid_der_npa))
+            tanh_der_npa, sigmoid_der_npa = split(derivative_matrix.npa)
+            _tanh_derivative(tanh_npa, tanh_der_npa)
+            _sigmoid_derivative(sigmoid_npa, sigmoid_der_npa)
 
+    @staticmethod
+    @_async_operation('zifo', 'c', 'tanh_c', 'h', 'dzifo_dpre_zifo', 'dtanh_c_dc')
+    def lstm_fprop(context, x, W, prev_h, R, b, prev_c, mask, zifo, c, tanh_c, h, dzifo_dpre_zifo=None, dtanh_c_dc=None):
+        """
+        Fused forward step of the lstm cell:
+
+        zifo = tanh_sigm(x * W + prev_h * R + b)
+        c = i .* z + f .* prev_c
+        h = o .* tanh(c)
+        c = mask .* c + (1 - mask) .* prev_c
+        h = mask .* h + (1 - mask) .* prev_h
+
+        If ``W`` is None, ``x`` is the already projected input (it can be
+        ``zifo`` itself) or None for the inputless cell; ``b`` can be None.
+        Every intermediate result is computed in place in the output matrices
+        or in the per-thread scratch buffer, so the step does not allocate
+        memory.
+        """
+        zifo_npa = zifo.npa
+        n = zifo_npa.shape[1] / 4
+        scratch = _get_scratch(zifo_npa.shape)
+        if x is None:
+            _dot(prev_h.npa, R.npa, zifo_npa)
+        elif W is None:
+            _dot(prev_h.npa, R.npa, scratch)
+            np.add(x.npa, scratch, zifo_npa)
+        else:
+            _dot(x.npa, W.npa, zifo_npa)
+            _dot(prev_h.npa, R.npa, scratch)
+            zifo_npa += scratch
+        if b is not None:
+            zifo_npa += b.npa
+
+        z, ifo = zifo_npa[:, :n], zifo_npa[:, n:]
+        np.tanh(z, z)
+        np.negative(ifo, ifo)
+        np.exp(ifo, ifo)
+        ifo += 1.0
+        np.reciprocal(ifo, ifo)
+        if dzifo_dpre_zifo is not None:
+            dz_dpre_z = dzifo_dpre_zifo.npa[:, :n]
+            difo_dpre_ifo = dzifo_dpre_zifo.npa[:, n:]
+            np.multiply(z, z, dz_dpre_z)
+            np.subtract(1.0, dz_dpre_z, dz_dpre_z)
+            np.subtract(1.0, ifo, difo_dpre_ifo)
+            difo_dpre_ifo *= ifo
+
+        i, f, o = zifo_npa[:, n:2*n], zifo_npa[:, 2*n:3*n], zifo_npa[:, 3*n:]
+        c_npa, tanh_c_npa, h_npa = c.npa, tanh_c.npa, h.npa
+        f_prev_c = scratch[:, :n]
+        np.multiply(i, z, c_npa)
+        np.multiply(f, prev_c.npa, f_prev_c)
+        c_npa += f_prev_c
+        np.tanh(c_npa, tanh_c_npa)
+        if dtanh_c_dc is not None:
+            dtanh_c_dc_npa = dtanh_c_dc.npa
+            np.multiply(tanh_c_npa, tanh_c_npa, dtanh_c_dc_npa)
+            np.subtract(1.0, dtanh_c_dc_npa, dtanh_c_dc_npa)
+        np.multiply(o, tanh_c_npa, h_npa)
+        if mask is not None:
+            for s, prev_s in [(c_npa, prev_c.npa), (h_npa, prev_h.npa)]:
+                # s = prev_s + mask .* (s - prev_s)
+                s -= prev_s
+                s *= mask.npa
+                s += prev_s
+
+    @staticmethod
+    @_async_operation('dzifo_dpre_zifo', 'dL_dc', 'dL_dh', 'dL_dprev_c', 'dL_dprev_h')
+    def lstm_bprop(context, zifo, dzifo_dpre_zifo, tanh_c, dtanh_c_dc, prev_c, dL_dc, dL_dh, mask=None, dL_dprev_c=None, dL_dprev_h=None, grad_clipping=None):
+        """
+        Fused elementwise part of the backward step of the lstm cell.
+        ``dzifo_dpre_zifo`` is overwritten with dL/dpre_zifo:
+
+        dL/dprev_c += (1 - mask) .* dL/dc
+        dL/dprev_h += (1 - mask) .* dL/dh
+        dL/dc = mask .* dL/dc
+        dL/dh = mask .* dL/dh
+        dL/dc += dL/dh .* o .* dtanh(c)/dc
+        dL/dpre_zifo = [dL/dc .* i .* dz/dpre_z,
+                        dL/dc .* z .* di/dpre_i,
+                        dL/dc .* prev_c .* df/dpre_f,
+                        dL/dh .* tanh(c) .* do/dpre_o]
+        dL/dprev_c += f .* dL/dc
+        """
+        dL_dc_npa, dL_dh_npa = dL_dc.npa, dL_dh.npa
+        n = dL_dc_npa.shape[1]
+        scratch = _get_scratch(dL_dc_npa.shape)
+        if mask is not None:
+            for dL_ds, dL_dprev_s in [(dL_dc_npa, dL_dprev_c), (dL_dh_npa, dL_dprev_h)]:
+                np.multiply(mask.npa, dL_ds, scratch)
+                if dL_dprev_s is not None:
+                    dL_dprev_s_npa = dL_dprev_s.npa
+                    dL_dprev_s_npa += dL_ds
+                    dL_dprev_s_npa -= scratch
+                dL_ds[...] = scratch
+
+        zifo_npa = zifo.npa
+        z, i, f, o = [zifo_npa[:, k*n:(k+1)*n] for k in xrange(4)]
+        dL_dpre_zifo = dzifo_dpre_zifo.npa
+        dL_dpre_z, dL_dpre_i, dL_dpre_f, dL_dpre_o = [dL_dpre_zifo[:, k*n:(k+1)*n] for k in xrange(4)]
+        np.multiply(dL_dh_npa, o, scratch)
+        scratch *= dtanh_c_dc.npa
+        dL_dc_npa += scratch
+        dL_dpre_z *= dL_dc_npa
+        dL_dpre_z *= i
+        dL_dpre_i *= dL_dc_npa
+        dL_dpre_i *= z
+        dL_dpre_f *= dL_dc_npa
+        dL_dpre_f *= prev_c.npa
+        dL_dpre_o *= dL_dh_npa
+        dL_dpre_o *= tanh_c.npa
+        if grad_clipping:
+            np.clip(dL_dpre_zifo, -grad_clipping, grad_clipping, dL_dpre_zifo)
+        if dL_dprev_c is not None:
+            np.multiply(f, dL_dc_npa, scratch)
+            dL_dprev_c.npa += scratch
+
+    @_async_operation('relu_matrix', 'derivative_matrix')
     def relu(self, context, relu_matrix, derivative_matrix=None):
-        relu_matrix.npa = np.maximum(self.npa, 0.0)
         if derivative_matrix:
-            derivative_matrix.npa = (self.npa > 0).astype(np.float32)
+            np.greater(self.npa, 0, derivative_matrix.npa)
+        np.maximum(self.npa, 0.0, relu_matrix.npa)
 
+    @_async_operation('softmax_matrix')
     def softmax(self, context, softmax_matrix):
-        maximums = np.max(self.npa, axis=1, keepdims=True)
-        softmax_matrix.npa = self.npa - maximums
-        np.exp(softmax_matrix.npa, softmax_matrix.npa)
-        z = np.sum(softmax_matrix.npa, axis=1, keepdims=True)
-        softmax_matrix.npa /= z
-
+        npa = self.npa
+        softmax_npa = softmax_matrix.npa
+        row_scratch = _get_scratch((npa.shape[0], 1))
+        np.max(npa, axis=1, out=row_scratch, keepdims=True)
+        np.subtract(npa, row_scratch, softmax_npa)
+        np.exp(softmax_npa, softmax_npa)
+        np.sum(softmax_npa, axis=1, out=row_scratch, keepdims=True)
+        softmax_npa /= row_scratch
+
+    @_async_operation('self')
     def add_softmax_derivative(self, context, softmax_matrix, deriv_matrix, beta=1.0):
-        grad_x = softmax_matrix.npa * deriv_matrix.npa
-        grad_x -= softmax_matrix.npa * grad_x.sum(axis=1, keepdims=True)
-        self.npa = grad_x + beta * self.npa
+        npa = self.npa
+        softmax_npa = softmax_matrix.npa
+        grad_x, scratch, row_scratch = _get_scratch(npa.shape, npa.shape, (npa.shape[0], 1))
+        np.multiply(softmax_npa, deriv_matrix.npa, grad_x)
+        np.sum(grad_x, axis=1, out=row_scratch, keepdims=True)
+        np.multiply(softmax_npa, row_scratch, scratch)
+        grad_x -= scratch
+        if beta == 0.0:
+            npa[...] = grad_x
+        else:
+            npa *= beta
+            npa += grad_x
 
+    @_async_operation('self')
     def assign_softmax_derivative(self, context, softmax_matrix, deriv_matrix):
         self.add_softmax_derivative(context, softmax_matrix, deriv_matrix, 0.0)
 
+    @_async_operation('self')
     def assign_softmax_ce_derivative(self, context, probs, target_classes):
-        self.npa = probs.npa / probs.npa.shape[0]
-        self.npa[range(probs.nrows), target_classes.npa.flatten()] -= 1.0 / probs.npa.shape[0]
+        npa, probs = self.npa, probs.npa
+        np.divide(probs, probs.shape[0], npa)
+        npa[np.arange(probs.shape[0]), target_classes.npa.ravel()] -= 1.0 / probs.shape[0]
 
+    @_async_operation('self')
     def add_softmax_ce_derivative(self, context, probs, target_classes):
-        temp = probs.npa / probs.npa.shape[0]
-        temp[range(probs.nrows), target_classes.npa.flatten()] -= 1.0 / probs.npa.shape[0]
-        self.npa += temp
+        npa, probs = self.npa, probs.npa
+        scratch = _get_scratch(npa.shape)
+        np.divide(probs, probs.shape[0], scratch)
+        scratch[np.arange(probs.shape[0]), target_classes.npa.ravel()] -= 1.0 / probs.shape[0]
+        npa += scratch
 
+    @_async_operation('self', 'out')
     def scale(self, context, alpha, out=None):
         if out:
-            out.npa = (self.npa * alpha)
+            np.multiply(self.npa, alpha, out.npa)
         else:
             self.npa *= alpha
 
+    @_async_operation('self')
     def assign_scaled_addition(self, context, alpha, a, b):
         """
         self = alpha * (a + b)
         """
-        self.npa = alpha * (a.npa + b.npa)
+        npa = self.npa
+        np.add(a.npa, b.npa, npa)
+        npa *= alpha
 
     def assign_add(self, context, a, b):
         self.assign_scaled_addition(context, 1.0, a, b)
 
+    @_async_operation('self')
     def assign_scaled_subtraction(self, context, alpha, a, b):
         """
         self = alpha * (a - b)
         """
-        self.npa = alpha * (a.npa - b.npa)
+        npa = self.npa
+        np.subtract(a.npa, b.npa, npa)
+        npa *= alpha
 
+    @_async_operation('self')
     def add_scaled_subtraction(self, context, alpha, a, b):
-        self.npa += alpha * (a.npa - b.npa)
+        npa = self.npa
+        scratch = _get_scratch(npa.shape)
+        np.subtract(a.npa, b.npa, scratch)
+        scratch *= alpha
+        npa += scratch
 
     def assign_sub(self, context, a, b):
         self.assign_scaled_addition(context, 1.0, a, b)
 
+    @_async_operation('self')
     def add_scaled(self, context, alpha, a):
         """
         self += alpha * a
         """
 
         if isinstance(a, CpuMatrix):
-            self.npa += alpha * a.npa
-        elif isinstance(a, quagga.matrix.SparseMatrix):
-            for column_indxs, v in a.columns.iteritems():
-                for dense_matrix in v:
-                    self.add_scaled_columns_slice(context, column_indxs, alpha, dense_matrix)
-            for row_indxs, v in a.rows.iteritems():
-                for dense_matrix in v:
-                    self.add_scaled_rows_slice(context, row_indxs, alpha, dense_matrix)
-            for rows_indxs, v in a.rows_batch.iteritems():
-                for dense_matrices in v:
-                    self.add_scaled_rows_batch_slice(context, rows_indxs, alpha, dense_matrices)
+            npa = self.npa
+            if alpha == 1.0:
+                npa += a.npa
+            else:
+                scratch = _get_scratch(a.npa.shape)
+                np.multiply(a.npa, alpha, scratch)
+                npa += scratch
+        elif isinstance(a, quagga.matrix.RowSparseMatrix):
+            if a.axis is not None and len(a.ids):
+                npa = self.npa.T if a.axis else self.npa
+                scratch = _get_scratch(a.values.shape)
+                np.multiply(a.values, alpha, scratch)
+                npa[a.ids] += scratch
         else:
             raise ValueError('TODO')
 
@@ -588,10 +1100,12 @@ class CpuMatrix(object):
     def sub(self, context, a):
         self.add_scaled(context, -1.0, a)
 
+    @_async_operation('self')
     def assign_sum(self, context, matrices):
         self.npa = 0.0
         self.add_sum(context, matrices)
 
+    @_async_operation('self')
     def add_sum(self, context, matrices):
         for m in matrices:
             self.npa += m.npa
@@ -602,22 +1116,38 @@ class CpuMatrix(object):
         """
         self.add_hprod(context, self, a, alpha=0.0)
 
+    @_async_operation('self')
     def add_hprod(self, context, a, b, c=None, alpha=1.0):
         """
         self = a .* b + alpha * self        or
         self = a .* b .* c + alpha * self
         """
-        if not c:
-            self.npa = a.npa * b.npa + alpha * self.npa
-        else:
-            self.npa = a.npa * b.npa * c.npa + alpha * self.npa
-
+        npa = self.npa
+        if alpha == 0.0:
+            np.multiply(a.npa, b.npa, npa)
+            if c:
+                npa *= c.npa
+            return
+        scratch = _get_scratch(npa.shape)
+        np.multiply(a.npa, b.npa, scratch)
+        if c:
+            scratch *= c.npa
+        npa *= alpha
+        npa += scratch
+
+    @_async_operation('self')
     def add_scaled_hprod(self, context, a, b, alpha, beta):
         """
         self = alpha * self + beta * a .* b
         """
-        self.npa = alpha * self.npa + beta * a.npa * b.npa
-
+        npa = self.npa
+        scratch = _get_scratch(npa.shape)
+        np.multiply(a.npa, beta, scratch)
+        scratch *= b.npa
+        npa *= alpha
+        npa += scratch
+
+    @_async_operation('self')
     def assign_hprod(self, context, a, b, c=None):
         """
         self = a .* b
@@ -626,50 +1156,414 @@ class CpuMatrix(object):
         if not c:
             np.multiply(a.npa, b.npa, self.npa)
         else:
-            self.npa = a.npa * b.npa * c.npa
+            scratch = _get_scratch(self.npa.shape)
+            np.multiply(a.npa, b.npa, scratch)
+            np.multiply(scratch, c.npa, self.npa)
 
+    @_async_operation('self')
     def assign_sum_hprod(self, context, a, b, c, d, e=None, f=None, g=None, h=None, i=None, j=None, k=None):
         """
         self = a .* b + c .* d                                   or
         self = a .* b .* c + d .* e                              or
         self = a .* b .* c + d .* e + f .* g + h .* i + j .* k
         """
-        np.multiply(a.npa, b.npa, self.npa)
-        if k is not None:
-            self.npa *= c.npa
-            self.npa += d.npa * e.npa
-            self.npa += f.npa * g.npa
-            self.npa += h.npa * i.npa
-            self.npa += j.npa * k.npa
-        elif e is not None:
-            self.npa *= c.npa
-            self.npa += d.npa * e.npa
+        npa = self.npa
+        scratch = _get_scratch(npa.shape)
+        np.multiply(a.npa, b.npa, npa)
+        if e is not None:
+            npa *= c.npa
+            pairs = [(d, e), (f, g), (h, i), (j, k)] if k is not None else [(d, e)]
         else:
-            self.npa += c.npa * d.npa
+            pairs = [(c, d)]
+        for x, y in pairs:
+            np.multiply(x.npa, y.npa, scratch)
+            npa += scratch
 
+    @_async_operation('self')
     def assign_hprod_sum(self, context, a, b):
         """
         self = sum(a .* b, axis=1)
         """
-        np.sum(a.npa * b.npa, axis=1, out=self.npa, keepdims=True)
+        scratch = _get_scratch(a.npa.shape)
+        np.multiply(a.npa, b.npa, scratch)
+        np.sum(scratch, axis=1, out=self.npa, keepdims=True)
 
+    @_async_operation('self')
     def add_scaled_div_sqrt(self, context, alpha, a, b, epsilon):
         """
         self += alpha * a ./ sqrt(b + epsilon)
         """
-        self.npa += alpha * a.npa / np.sqrt(b.npa + epsilon)
+        npa = self.npa
+        scratch, sqrt_b = _get_scratch(npa.shape, npa.shape)
+        np.add(b.npa, epsilon, sqrt_b)
+        np.sqrt(sqrt_b, sqrt_b)
+        np.multiply(a.npa, alpha, scratch)
+        scratch /= sqrt_b
+        npa += scratch
+
+    @_async_operation('self', 'velocity')
+    def sparse_momentum_update(self, context, learning_rate, momentum, velocity, dL_dself, last_update, iteration, axis=0):
+        """
+        Lazy momentum step for the rows (columns if ``axis`` is 1) of
+        ``self`` that are present in the row-sparse ``dL_dself``:
+
+        velocity[ids] = momentum * velocity[ids] + learning_rate * dL_dself
+        self[ids] += velocity[ids]
 
+        Before the step the rows are brought up to date: the steps of the
+        iterations after ``last_update[ids]``, when their derivatives were
+        zero, are applied in closed form. ``last_update`` is set to
+        ``iteration`` for the updated rows. If ``dL_dself`` is None, all rows
+        are brought up to ``iteration`` and no new step is made.
+        """
+        npa, velocity, ids, dL_dself, skipped = _get_lazy_rows(self, velocity, dL_dself, last_update, iteration, axis)
+        decay = np.power(momentum, skipped)
+        if momentum == 1.0:
+            pending = skipped
+        else:
+            pending = momentum * (1.0 - decay) / (1.0 - momentum)
+        v = velocity[ids]
+        p = npa[ids]
+        p += v * pending.astype(np.float32)
+        v *= decay.astype(np.float32)
+        if dL_dself is not None:
+            v *= momentum
+            v += learning_rate * dL_dself
+            p += v
+        velocity[ids] = v
+        npa[ids] = p
+
+    @_async_operation('self', 'grad_sqr')
+    def sparse_rmsprop_update(self, context, learning_rate, ema_decay, epsilon, grad_sqr, dL_dself, last_update, iteration, axis=0):
+        """
+        Lazy RMSprop step for the rows (columns if ``axis`` is 1) of
+        ``self`` that are present in the row-sparse ``dL_dself``:
+
+        grad_sqr[ids] = ema_decay * grad_sqr[ids] + (1 - ema_decay) * dL_dself^2
+        self[ids] += learning_rate * dL_dself ./ sqrt(grad_sqr[ids] + epsilon)
+
+        The decay of ``grad_sqr`` during the iterations after
+        ``last_update[ids]`` is applied before the step, see
+        :meth:`sparse_momentum_update`.
+        """
+        npa, grad_sqr, ids, dL_dself, skipped = _get_lazy_rows(self, grad_sqr, dL_dself, last_update, iteration, axis)
+        g_sqr = grad_sqr[ids]
+        g_sqr *= np.power(ema_decay, skipped).astype(np.float32)
+        if dL_dself is not None:
+            g_sqr *= ema_decay
+            g_sqr += (1.0 - ema_decay) * np.square(dL_dself)
+            npa[ids] += learning_rate * dL_dself / np.sqrt(g_sqr + epsilon)
+        grad_sqr[ids] = g_sqr
+
+    @_async_operation('self', 'm', 'v')
+    def sparse_adam_update(self, context, learning_rates, beta1, beta2, epsilon, m, v, dL_dself, last_update, iteration, axis=0):
+        """
+        Lazy Adam step for the rows (columns if ``axis`` is 1) of ``self``
+        that are present in the row-sparse ``dL_dself``:
+
+        m[ids] = beta1 * m[ids] + (1 - beta1) * dL_dself
+        v[ids] = beta2 * v[ids] + (1 - beta2) * dL_dself^2
+        self[ids] += learning_rates[iteration] * m[ids] ./ sqrt(v[ids] + epsilon)
+
+        ``learning_rates[t]`` is the step size of iteration ``t``. Before
+        the step the rows are brought up to date, see
+        :meth:`sparse_momentum_update`: the steps that the decaying ``m``
+        made during the iterations after ``last_update[ids]`` are replayed
+        until they no longer change float32 values, and ``m`` and ``v``
+        are decayed.
+        """
+        npa, m, v, ids, dL_dself, skipped = _get_lazy_rows(self, m, v, dL_dself, last_update, iteration, axis)
+        m_rows = m[ids]
+        v_rows = v[ids]
+        n_replayed = int(skipped.max()) if len(skipped) else 0
+        ratio = beta1 / np.sqrt(beta2)
+        if ratio == 0.0:
+            n_replayed = 0
+        elif ratio < 1.0:
+            # the j-th step is at most ratio^j of the first one
+            n_replayed = min(n_replayed, int(np.log(np.finfo(np.float32).eps) / np.log(ratio)) + 1)
+        if n_replayed:
+            # rows sorted by the number of skipped iterations, so rows that
+            # skipped at least j iterations are a prefix
+            order = np.argsort(-skipped[:, 0], kind='mergesort')
+            sorted_skipped = skipped[order, 0]
+            first_skipped = iteration - sorted_skipped.astype(np.int64) + (1 if dL_dself is None else 0)
+            m_sorted = m_rows[order]
+            v_sorted = v_rows[order]
+            steps = np.zeros_like(m_sorted)
+            for j in xrange(1, n_replayed + 1):
+                n = np.searchsorted(-sorted_skipped, -j, side='right')
+                step = beta1 ** j * m_sorted[:n]
+                step /= np.sqrt(beta2 ** j * v_sorted[:n] + epsilon)
+                step *= learning_rates[first_skipped[:n] + j - 1, np.newaxis]
+                steps[:n] += step
+            p_rows = npa[ids]
+            p_rows[order] += steps
+            npa[ids] = p_rows
+        m_rows *= np.power(beta1, skipped).astype(np.float32)
+        v_rows *= np.power(beta2, skipped).astype(np.float32)
+        if dL_dself is not None:
+            m_rows *= beta1
+            m_rows += (1.0 - beta1) * dL_dself
+            v_rows *= beta2
+            v_rows += (1.0 - beta2) * np.square(dL_dself)
+            npa[ids] += learning_rates[iteration] * m_rows / np.sqrt(v_rows + epsilon)
+        m[ids] = m_rows
+        v[ids] = v_rows
+
+    @_async_operation('self')
     def assign_dot(self, context, a, b, matrix_operation_a='N', matrix_operation_b='N'):
         self.add_dot(context, a, b, matrix_operation_a, matrix_operation_b, beta=0.0)
 
+    @_async_operation('self')
     def add_dot(self, context, a, b, matrix_operation_a='N', matrix_operation_b='N', alpha=1.0, beta=1.0):
         """
         self = alpha * op(a) * b + beta * self
         """
-        self.npa *= beta
+        npa = self.npa
         a = a.npa if matrix_operation_a == 'N' else a.npa.T
         b = b.npa if matrix_operation_b == 'N' else b.npa.T
-        self.npa += alpha * np.dot(a, b)
+        if beta == 0.0 and alpha == 1.0:
+            _dot(a, b, npa)
+            return
+        scratch = _get_scratch(npa.shape)
+        _dot(a, b, scratch)
+        if alpha != 1.0:
+            scratch *= alpha
+        if beta == 0.0:
+            npa[...] = scratch
+        else:
+            if beta != 1.0:
+                npa *= beta
+            npa += scratch
 
+    @_async_operation('out')
     def argmax(self, context, out, axis=1):
-        out.npa[:, 0] = np.argmax(self.npa, axis=axis)
\ No newline at end of file
+        out.npa[:, 0] = np.argmax(self.npa, axis=axis)
+
+
+def _get_lazy_rows(*args):
+    """
+    _get_lazy_rows(matrix_1, ..., matrix_n, a, last_update, iteration, axis)
+
+    Returns arrays of the matrices (transposed if ``axis`` is 1), ids of
+    the rows of the row-sparse ``a`` (all rows if ``a`` is None) with
+    their values and the number of iterations in which the rows were not
+    updated, as a float64 column. ``last_update`` is set to ``iteration``
+    for the rows.
+    """
+    matrices, (a, last_update, iteration, axis) = args[:-4], args[-4:]
+    npas = [m.npa.T if axis else m.npa for m in matrices]
+    if a is None:
+        ids = np.arange(len(last_update))
+        values = None
+        skipped = iteration - last_update
+    else:
+        if a.axis is not None and a.axis != axis:
+            raise ValueError('Derivative slices have a different axis!')
+        ids = a.ids
+        values = a.values
+        skipped = iteration - 1 - last_update[ids]
+    last_update[ids] = iteration
+    skipped = skipped[:, np.newaxis].astype(np.float64)
+    return npas + [ids, values, skipped]
+
+
+def _take(a, indxs, axis, out):
+    """
+    out = a.take(indxs, axis)
+
+    Indices are validated up front, so that ``np.take`` can write straight
+    into ``out`` in its ``'clip'`` mode instead of buffering the result.
+    """
+    if indxs.size and (indxs.min() < 0 or indxs.max() >= a.shape[axis]):
+        raise IndexError('Index is out of bounds for axis {} with size {}!'.format(axis, a.shape[axis]))
+    np.take(a, indxs, axis=axis, out=out, mode='clip')
+
+
+def _scatter_add_rows(target, indxs, alpha, values):
+    """
+    target[indxs] += alpha * values
+
+    Duplicate indices are accumulated: rows of ``values`` are sorted by their
+    target index, rows that share an index are summed with a single
+    ``np.add.reduceat`` call and the sums are added to ``target`` with one
+    fancy-indexing update, so the cost does not depend on interpreter
+    overhead per index.
+    """
+    if indxs.size == 0:
+        return
+    order = np.argsort(indxs, kind='mergesort')
+    sorted_indxs = indxs[order]
+    starts = np.flatnonzero(np.diff(sorted_indxs)) + 1
+    starts = np.concatenate(([0], starts))
+    sums = np.add.reduceat(values[order], starts, axis=0)
+    sums *= alpha
+    target[sorted_indxs[starts]] += sums
+
+
+def _get_scratch(*shapes):
+    """
+    Returns C-contiguous float32 arrays of the given shapes (one array if
+    only one shape is given) that live in a buffer owned by the calling
+    thread. The buffer only grows, so kernels that call it on every step do
+    not allocate memory. The content is undefined and it must not be kept
+    between calls.
+    """
+    sizes = [int(np.prod(shape)) for shape in shapes]
+    buffer = getattr(_scratch_local, 'buffer', None)
+    if buffer is None or buffer.size < sum(sizes):
+        buffer = np.empty(sum(sizes), dtype=np.float32)
+        _scratch_local.buffer = buffer
+    arrays = []
+    offset = 0
+    for shape, size in izip(shapes, sizes):
+        arrays.append(buffer[offset:offset+size].reshape(shape))
+        offset += size
+    return arrays[0] if len(arrays) == 1 else arrays
+
+
+def _get_stack_slices(matrices, axis, slices=None):
+    # (start, stop) of every matrix in the stack along `axis`
+    if slices:
+        return [(int(start), int(stop)) for start, stop in slices]
+    slices = []
+    start = 0
+    for m in matrices:
+        stop = start + int(m.ncols if axis else m.nrows)
+        slices.append((start, stop))
+        start = stop
+    return slices
+
+
+def _get_buffer_view(matrices):
+    """
+    Returns a ``(len(matrices), nrows, ncols)`` view of the buffer of a
+    :class:`~quagga.utils.ContiguousList` if ``matrices`` are its
+    consecutive elements, None otherwise. It is cheap enough to be tried
+    before every python loop over a sequence: other matrices are rejected by
+    looking at the first one only.
+    """
+    if not len(matrices):
+        return None
+    buffer, start = matrices[0].sequence_position or (None, None)
+    if buffer is None:
+        return None
+    for k, m in enumerate(matrices):
+        position = m.sequence_position
+        if position is None or position[0] is not buffer or position[1] != start + k:
+            return None
+    # elements share nrows and ncols, so the first one has the shape of all
+    first = matrices[0]
+    nrows, ncols = first.npa.shape
+    sequence = buffer.data.reshape((-1, ) + first.data.shape)
+    return sequence[start:start + len(matrices), :nrows, :ncols]
+
+
+def _get_sequence_view(matrices, writable=False):
+    """
+    Returns a ``(len(matrices), nrows, ncols)`` view of arrays of
+    ``matrices`` if they are equally spaced in memory (like column blocks of
+    one matrix or elements of a :class:`~quagga.utils.ContiguousList`), None
+    otherwise. Every element of the view belongs to one of the arrays, so
+    they need not share a base. A writable view is returned only if the
+    arrays do not overlap.
+    """
+    sequence = _get_buffer_view(matrices)
+    if sequence is not None:
+        return sequence
+    npas = [m.npa for m in matrices]
+    if not npas:
+        return None
+    first = npas[0]
+    address = first.__array_interface__['data'][0]
+    step = npas[1].__array_interface__['data'][0] - address if len(npas) > 1 else 0
+    for k, npa in enumerate(npas):
+        if npa.shape != first.shape or npa.strides != first.strides or npa.dtype != first.dtype or \
+                npa.__array_interface__['data'][0] != address + k * step:
+            return None
+    shape = (len(npas), ) + first.shape
+    strides = (step, ) + first.strides
+    if writable:
+        # every stride must step over the extent of the smaller ones
+        extent = first.itemsize
+        for stride, n in sorted((abs(stride), n) for stride, n in izip(strides, shape) if n > 1):
+            if stride < extent:
+                return None
+            extent += stride * (n - 1)
+    return np.lib.stride_tricks.as_strided(first, shape, strides)
+
+
+def _get_buffer_views(*sequences):
+    """
+    Returns buffer views (see :func:`_get_buffer_view`) of all
+    ``sequences`` if every one of them has it and they have the same
+    length, a list of Nones otherwise.
+    """
+    views = []
+    for matrices in sequences:
+        view = _get_buffer_view(matrices)
+        if view is None or views and view.shape[0] != views[0].shape[0]:
+            return [None] * len(sequences)
+        views.append(view)
+    return views
+
+
+def _get_sequence(matrices, *shapes):
+    """
+    Returns a ``(len(matrices), nrows, ncols)`` array of ``matrices``
+    followed by scratch arrays of ``shapes``. The array is a view of the
+    matrices if possible (see :func:`_get_sequence_view`), otherwise it is
+    their copy in the scratch buffer, so it must not be written.
+    """
+    sequence = _get_sequence_view(matrices)
+    if sequence is None:
+        shape = (len(matrices), ) + matrices[0].npa.shape
+        arrays = _get_scratch(shape, *shapes) if shapes else [_get_scratch(shape)]
+        sequence = arrays[0]
+        for k, m in enumerate(matrices):
+            sequence[k] = m.npa
+        return arrays
+    if not shapes:
+        return [sequence]
+    arrays = _get_scratch(*shapes)
+    return [sequence] + (arrays if len(shapes) > 1 else [arrays])
+
+
+def _sigmoid(x, out):
+    """
+    out = 1 / (1 + exp(-x))
+    """
+    np.negative(x, out)
+    np.exp(out, out)
+    out += 1.0
+    np.reciprocal(out, out)
+
+
+def _sigmoid_derivative(sigmoid_x, out):
+    """
+    out = sigmoid(x) .* (1 - sigmoid(x))
+    """
+    np.subtract(1.0, sigmoid_x, out)
+    out *= sigmoid_x
+
+
+def _tanh_derivative(tanh_x, out):
+    """
+    out = 1 - tanh(x) .* tanh(x)
+    """
+    np.multiply(tanh_x, tanh_x, out)
+    np.subtract(1.0, out, out)
+
+
+def _dot(a, b, out):
+    """
+    out = a * b without a temporary array when ``out`` allows it.
+    """
+    if out.flags.c_contiguous and out.dtype == np.result_type(a, b):
+        np.dot(a, b, out)
+    else:
+        out[...] = np.dot(a, b)
+
+
+_scratch_local = threading.local()
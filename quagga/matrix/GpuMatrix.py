@@ -67,8 +67,8 @@ class GpuMatrix(object):
             if self_proxy._cudnn_tensor_descriptor:
                 cudnn.destroy_tensor_descriptor(self_proxy._cudnn_tensor_descriptor)
                 self_proxy._cudnn_tensor_descriptor = None
-        self.nrows.add_modification_handler(change_cudnn_tensor_descriptor)
-        self.ncols.add_modification_handler(change_cudnn_tensor_descriptor)
+        self.nrows.add_modification_handler(change_cudnn_tensor_descriptor, self)
+        self.ncols.add_modification_handler(change_cudnn_tensor_descriptor, self)
 
     @staticmethod
     def get_setable_attributes():
@@ -127,7 +127,7 @@ class GpuMatrix(object):
             a = GpuMatrix(data, 1, self.ncols, self.dtype, self.device_id, False, self.strides, self)
             a_proxy = weakref.proxy(a)
             modif_handler = lambda: setattr(a_proxy, 'data', self_proxy._get_pointer_to_element(key.value, 0))
-            key.add_modification_handler(modif_handler)
+            key.add_modification_handler(modif_handler, a)
             return a
         if isinstance(key, slice) and self.ncols == 1:
             key = (key, 0)
@@ -142,29 +142,29 @@ class GpuMatrix(object):
                 if isinstance(nrows, ShapeElement):
                     a_proxy = weakref.proxy(a)
                     modif_handler = lambda: setattr(a_proxy, 'data', self_proxy._get_pointer_to_element(start, key[1]))
-                    nrows.add_modification_handler(modif_handler)
+                    nrows.add_modification_handler(modif_handler, a)
                 return a
             elif isinstance(start, int) and isinstance(key[1], ShapeElement):
                 data = self._get_pointer_to_element(start, key[1].value)
                 a = GpuMatrix(data, nrows, 1, self.dtype, self.device_id, False, self.strides, self)
                 a_proxy = weakref.proxy(a)
                 modif_handler = lambda: setattr(a_proxy, 'data', self_proxy._get_pointer_to_element(start, key[1].value))
-                key[1].add_modification_handler(modif_handler)
+                key[1].add_modification_handler(modif_handler, a)
                 return a
             elif isinstance(start, ShapeElement) and isinstance(key[1], int):
                 data = self._get_pointer_to_element(start.value, key[1])
                 a = GpuMatrix(data, nrows, 1, self.dtype, self.device_id, False, self.strides, self)
                 a_proxy = weakref.proxy(a)
                 modif_handler = lambda: setattr(a_proxy, 'data', self_proxy._get_pointer_to_element(start.value, key[1]))
-                start.add_modification_handler(modif_handler)
+                start.add_modification_handler(modif_handler, a)
                 return a
             elif isinstance(start, ShapeElement) and isinstance(key[1], ShapeElement):
                 data = self._get_pointer_to_element(start.value, key[1].value)
                 a = GpuMatrix(data, nrows, 1, self.dtype, self.device_id, False, self.strides, self)
                 a_proxy = weakref.proxy(a)
                 modif_handler = lambda: setattr(a_proxy, 'data', self_proxy._get_pointer_to_element(start.value, key[1].value))
-                key[1].add_modification_handler(modif_handler)
-                start.add_modification_handler(modif_handler)
+                key[1].add_modification_handler(modif_handler, a)
+                start.add_modification_handler(modif_handler, a)
                 return a
         # get column slice
         if key[0] == slice(None) and isinstance(key[1], slice) and not key[1].step:
@@ -176,15 +176,15 @@ class GpuMatrix(object):
                 a = GpuMatrix(data, self.nrows, ncols, self.dtype, self.device_id, False, base=self)
                 a_proxy = weakref.proxy(a)
                 modif_handler = lambda: setattr(a_proxy, 'data', self_proxy._get_pointer_to_column(start))
-                self.nrows.add_modification_handler(modif_handler)
+                self.nrows.add_modification_handler(modif_handler, a)
                 return a
             elif isinstance(start, ShapeElement):
                 data = self._get_pointer_to_column(start.value)
                 a = GpuMatrix(data, self.nrows, ncols, self.dtype, self.device_id, False, base=self)
                 a_proxy = weakref.proxy(a)
                 modif_handler = lambda: setattr(a_proxy, 'data', self_proxy._get_pointer_to_column(start.value))
-                start.add_modification_handler(modif_handler)
-                self.nrows.add_modification_handler(modif_handler)
+                start.add_modification_handler(modif_handler, a)
+                self.nrows.add_modification_handler(modif_handler, a)
                 return a
         raise ValueError('This slice: {} is unsupported!'.format(key))
 
@@ -260,6 +260,26 @@ class GpuMatrix(object):
         device_id = other.device_id if device_id is None else device_id
         return cls.empty(other.nrows, other.ncols, other.dtype, device_id)
 
+    def contiguous_view(self, offset, nrows, ncols):
+        """
+        Returns a matrix that shares ``nrows * ncols`` contiguous elements
+        of the matrix memory starting from the ``offset`` element.
+        """
+        void_p = ct.cast(self.data, ct.c_void_p).value + offset * ct.sizeof(self.c_dtype)
+        data = ct.cast(void_p, ct.POINTER(self.c_dtype))
+        return GpuMatrix(data, nrows, ncols, self.dtype, self.device_id, False, base=self)
+
+    def share_hstack(self, matrices, col_slices=None):
+        """
+        Memory is never shared on the GPU: elements are stored in the
+        column-major order with the leading dimension equal to the current
+        number of rows, so blocks move when ``nrows`` changes.
+        """
+        return False
+
+    def share_vstack(self, matrices, row_slices=None):
+        return False
+
     def to_host(self, context=None):
         if context:
             GpuMatrix.wait_matrices(context, self)
@@ -690,6 +710,14 @@ class GpuMatrix(object):
         self.fill(context, 0.0)
         gpu_matrix_kernels.assign_sequential_weighted_sum(context.cuda_stream, self.nrows, self.ncols, device_pointer, w.data, n, self.data)
 
+    def assign_sequential_dot(self, context, matrices, u):
+        """
+        self[:, i] = matrices[i] * u
+        """
+        for i, matrix in enumerate(matrices):
+            self[:, i].assign_dot(context, matrix, u)
+        self.last_modif_context = context
+
     @staticmethod
     def sequentially_tile(context, a, matrices):
         for matrix in matrices:
@@ -940,6 +968,93 @@ class GpuMatrix(object):
         else:
             nonlinearities.tanh_sigm(context.cuda_stream, axis, self.nrows, self.ncols, self.data, tanh_sigm_matrix.data)
 
+    @staticmethod
+    def lstm_fprop(context, x, W, prev_h, R, b, prev_c, mask, zifo, c, tanh_c, h, dzifo_dpre_zifo=None, dtanh_c_dc=None):
+        """
+        Fused forward step of the lstm cell:
+
+        zifo = tanh_sigm(x * W + prev_h * R + b)
+        c = i .* z + f .* prev_c
+        h = o .* tanh(c)
+        c = mask .* c + (1 - mask) .* prev_c
+        h = mask .* h + (1 - mask) .* prev_h
+
+        If ``W`` is None, ``x`` is the already projected input (it can be
+        ``zifo`` itself) or None for the inputless cell; ``b`` can be None.
+        """
+
+        if x is None:
+            zifo.assign_dot(context, prev_h, R)
+        elif W is None:
+            if x is not zifo:
+                zifo.assign(context, x)
+            zifo.add_dot(context, prev_h, R)
+        else:
+            zifo.assign_dot(context, x, W)
+            zifo.add_dot(context, prev_h, R)
+        if b is not None:
+            zifo.add(context, b)
+        zifo.tanh_sigm(context, zifo, dzifo_dpre_zifo, axis=1)
+
+        dim = c.ncols.value
+        z, i, f, o = [zifo._get_pointer_to_column(k * dim) for k in xrange(4)]
+        GpuMatrix.wait_matrices(context, prev_c)
+        c.last_modif_context = context
+        context.activate()
+        gpu_matrix_kernels.sum_hprod_4(context.cuda_stream, c.nelems, i, z, f, prev_c.data, c.data)
+        c.tanh(context, tanh_c, dtanh_c_dc)
+        h.last_modif_context = context
+        gpu_matrix_kernels.hadamard_product_2(context.cuda_stream, h.nelems, o, tanh_c.data, h.data)
+        if mask is not None:
+            c.assign_masked_addition(context, mask, c, prev_c)
+            h.assign_masked_addition(context, mask, h, prev_h)
+
+    @staticmethod
+    def lstm_bprop(context, zifo, dzifo_dpre_zifo, tanh_c, dtanh_c_dc, prev_c, dL_dc, dL_dh, mask=None, dL_dprev_c=None, dL_dprev_h=None, grad_clipping=None):
+        """
+        Fused elementwise part of the backward step of the lstm cell.
+        ``dzifo_dpre_zifo`` is overwritten with dL/dpre_zifo:
+
+        dL/dprev_c += (1 - mask) .* dL/dc
+        dL/dprev_h += (1 - mask) .* dL/dh
+        dL/dc = mask .* dL/dc
+        dL/dh = mask .* dL/dh
+        dL/dc += dL/dh .* o .* dtanh(c)/dc
+        dL/dpre_zifo = [dL/dc .* i .* dz/dpre_z,
+                        dL/dc .* z .* di/dpre_i,
+                        dL/dc .* prev_c .* df/dpre_f,
+                        dL/dh .* tanh(c) .* do/dpre_o]
+        dL/dprev_c += f .* dL/dc
+        """
+
+        if mask is not None:
+            if dL_dprev_c is not None:
+                dL_dprev_c.add_hprod_one_minus_mask(context, mask, dL_dc)
+            dL_dc.hprod(context, mask)
+            if dL_dprev_h is not None:
+                dL_dprev_h.add_hprod_one_minus_mask(context, mask, dL_dh)
+            dL_dh.hprod(context, mask)
+
+        GpuMatrix.wait_matrices(context, zifo, dzifo_dpre_zifo, tanh_c, dtanh_c_dc, prev_c, dL_dc, dL_dh)
+        dL_dc.last_modif_context = context
+        dzifo_dpre_zifo.last_modif_context = context
+        context.activate()
+        dim = dL_dc.ncols.value
+        nelems = dL_dc.nelems
+        z, i, f, o = [zifo._get_pointer_to_column(k * dim) for k in xrange(4)]
+        dz, di, df, do = [dzifo_dpre_zifo._get_pointer_to_column(k * dim) for k in xrange(4)]
+        gpu_matrix_kernels.add_hadamard_product_3(context.cuda_stream, nelems, dL_dh.data, o, dtanh_c_dc.data, 1.0, dL_dc.data)
+        gpu_matrix_kernels.hadamard_product_3(context.cuda_stream, nelems, dL_dc.data, i, dz, dz)
+        gpu_matrix_kernels.hadamard_product_3(context.cuda_stream, nelems, dL_dc.data, z, di, di)
+        gpu_matrix_kernels.hadamard_product_3(context.cuda_stream, nelems, dL_dc.data, prev_c.data, df, df)
+        gpu_matrix_kernels.hadamard_product_3(context.cuda_stream, nelems, dL_dh.data, tanh_c.data, do, do)
+        if grad_clipping:
+            dzifo_dpre_zifo.clip(context, -grad_clipping, grad_clipping)
+        if dL_dprev_c is not None:
+            GpuMatrix.wait_matrices(context, dL_dprev_c)
+            dL_dprev_c.last_modif_context = context
+            gpu_matrix_kernels.add_hadamard_product_2(context.cuda_stream, nelems, f, dL_dc.data, 1.0, dL_dprev_c.data)
+
     def relu(self, context, relu_matrix, derivative_matrix=None):
         GpuMatrix.wait_matrices(context, self)
         relu_matrix.last_modif_context = context
@@ -1065,16 +1180,15 @@ class GpuMatrix(object):
                 gpu_matrix_kernels.matrix_vector_row_addition(context.cuda_stream, self.nrows, self.ncols, self.data, alpha, a.data, self.data)
             else:
                 cublas.s_axpy(context.cublas_handle, self.nelems, alpha, a.data, 1, self.data, 1)
-        elif isinstance(a, quagga.matrix.SparseMatrix):
-            for column_indxs, v in a.columns.iteritems():
-                for dense_matrix in v:
-                    self.add_scaled_columns_slice(context, column_indxs, alpha, dense_matrix)
-            for row_indxs, v in a.rows.iteritems():
-                for dense_matrix in v:
-                    self.add_scaled_rows_slice(context, row_indxs, alpha, dense_matrix)
-            for rows_indxs, v in a.rows_batch.iteritems():
-                for dense_matrices in v:
-                    self.add_scaled_rows_batch_slice(context, rows_indxs, alpha, dense_matrices)
+        elif isinstance(a, quagga.matrix.RowSparseMatrix):
+            if a.axis is not None and len(a.ids):
+                # the coalesced block lives on the host
+                if a.axis:
+                    indxs = GpuMatrix.from_npa(a.ids[np.newaxis], 'int', self.device_id)
+                    self.add_scaled_columns_slice(context, indxs, alpha, GpuMatrix.from_npa(a.values.T, 'float', self.device_id))
+                else:
+                    indxs = GpuMatrix.from_npa(a.ids[:, np.newaxis], 'int', self.device_id)
+                    self.add_scaled_rows_slice(context, indxs, alpha, GpuMatrix.from_npa(a.values, 'float', self.device_id))
         else:
             raise ValueError('TODO')
 
@@ -1203,6 +1317,15 @@ class GpuMatrix(object):
         context.activate()
         gpu_matrix_kernels.add_scaled_div_sqrt(context.cuda_stream, self.nelems, alpha, a.data, b.data, epsilon, self.data)
 
+    def sparse_momentum_update(self, context, learning_rate, momentum, velocity, dL_dself, last_update, iteration, axis=0):
+        raise NotImplementedError('Lazy sparse updates are implemented only for the cpu backend!')
+
+    def sparse_rmsprop_update(self, context, learning_rate, ema_decay, epsilon, grad_sqr, dL_dself, last_update, iteration, axis=0):
+        raise NotImplementedError('Lazy sparse updates are implemented only for the cpu backend!')
+
+    def sparse_adam_update(self, context, learning_rates, beta1, beta2, epsilon, m, v, dL_dself, last_update, iteration, axis=0):
+        raise NotImplementedError('Lazy sparse updates are implemented only for the cpu backend!')
+
     def assign_dot(self, context, a, b, matrix_operation_a='N', matrix_operation_b='N'):
         self.add_dot(context, a, b, matrix_operation_a, matrix_operation_b, beta=ct.c_float(0.0))
 
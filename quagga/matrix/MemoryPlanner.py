@@ -0,0 +1,231 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import gc
+import quagga
+import numpy as np
+from quagga.matrix.CpuMatrix import CpuMatrix
+from quagga.matrix.CpuMatrix import _get_matrices
+from quagga.matrix.RowSparseMatrix import RowSparseMatrix
+
+
+# Operations that assign every element of their outputs without reading
+# previous values of them
+_OVERWRITING_OPERATIONS = frozenset([
+    '_assign', '_assign_npa', 'fill', 'slice_columns',
+    'slice_columns_and_transpose', 'slice_rows', 'slice_rows_batch',
+    'assign_hstack', 'hsplit', 'batch_hstack', 'batch_hsplit',
+    'assign_vstack', 'vsplit', 'assign_sequential_mean_pooling',
+    'assign_sequential_sum_pooling', 'assign_sequential_weighted_sum',
+    'assign_sequential_dot', 'sequentially_tile', 'assign_dL_dpre_a', 'tile',
+    'assign_repeat', 'dropout', 'add_gaussian_noise', 'assign_mask_zeros',
+    'assign_masked_addition', 'mask_column_numbers_row_wise', 'tanh',
+    'sigmoid', 'tanh_sigm', 'lstm_fprop', 'relu', 'softmax',
+    'assign_softmax_derivative', 'assign_softmax_ce_derivative',
+    'assign_scaled_addition', 'assign_scaled_subtraction', 'assign_sum',
+    'assign_hprod', 'assign_sum_hprod', 'assign_hprod_sum', 'assign_dot',
+    'argmax'])
+
+
+def _get_storage(array):
+    while isinstance(array.base, np.ndarray):
+        array = array.base
+    return array
+
+
+def _covers(storage, ranges):
+    # whether the (address, nbytes) ranges of the modified matrices tile the
+    # whole storage, like all elements of a ContiguousList do
+    if None in ranges:
+        return False
+    end = storage.ctypes.data
+    for address, nbytes in sorted(set(ranges)):
+        if address != end:
+            return False
+        end += nbytes
+    return end == storage.ctypes.data + storage.nbytes
+
+
+class _Buffer(object):
+    def __init__(self, storage, operation_idx, access):
+        self.storage = storage
+        self.first = operation_idx
+        self.last = operation_idx
+        self.first_access = access
+        self.last_access = access
+
+
+class MemoryPlanner(object):
+    """
+    Static memory planner for the CPU backend.
+
+    The planner traces matrix operations of one iteration of a program
+    (e.g. ``fprop`` and ``bprop`` of a :class:`~quagga.Model`), computes
+    the lifetime of every buffer that backs a :class:`CpuMatrix` and places
+    buffers with non-overlapping lifetimes at the same offset of one arena.
+
+    Only buffers that are fully overwritten before being read are placed into
+    the arena, so parameters and other values that live across iterations
+    are left untouched. Buffers that are assigned but never read during the
+    iteration are left untouched as well, and so are buffers that are
+    allocated during the traced iteration, because lazily created matrices
+    can be used differently in the following iterations. Other buffers which
+    are read outside of the traced iteration (e.g. gradients) must be listed
+    in ``preserved_matrices`` of :meth:`plan`.
+
+    Parameters
+    ----------
+    alignment : int
+        Alignment in bytes of buffers inside of the arena
+    """
+    def __init__(self, alignment=64):
+        self.alignment = alignment
+        self.buffers = {}
+        self.n_operations = 0
+        self.storages = {}
+        self.arena = None
+
+    def trace(self, step):
+        """
+        Calls ``step`` and records all matrix operations done by it.
+        """
+        if quagga.cpu_context_workers:
+            raise ValueError('Memory planning requires synchronous '
+                             'contexts, set `quagga.cpu_context_workers` to 0!')
+        for obj in gc.get_objects():
+            if type(obj) is CpuMatrix:
+                storage = _get_storage(obj.data)
+                self.storages[id(storage)] = storage
+        CpuMatrix.tracer = self._record
+        try:
+            step()
+        finally:
+            CpuMatrix.tracer = None
+
+    def _record(self, operation_name, modified_matrices, used_matrices):
+        operation_idx = self.n_operations
+        self.n_operations += 1
+        used_storages = {}
+        # row-sparse matrices manage their own buffers
+        used_matrices = [e for e in used_matrices if not isinstance(e, RowSparseMatrix)]
+        modified_matrices = [e for e in modified_matrices if not isinstance(e, RowSparseMatrix)]
+        for matrix in used_matrices:
+            storage = _get_storage(matrix.data)
+            used_storages[id(storage)] = storage
+            self._access(storage, operation_idx, 'read')
+        overwriting = operation_name in _OVERWRITING_OPERATIONS
+        modified_storages = {}
+        for matrix in modified_matrices:
+            storage = _get_storage(matrix.data)
+            storage, ranges = modified_storages.setdefault(id(storage), (storage, []))
+            npa = matrix.npa
+            if npa.flags.c_contiguous or npa.flags.f_contiguous:
+                ranges.append((npa.ctypes.data, npa.nbytes))
+            else:
+                ranges.append(None)
+        for storage_id, (storage, ranges) in modified_storages.iteritems():
+            if overwriting and storage_id not in used_storages and \
+                    _covers(storage, ranges):
+                self._access(storage, operation_idx, 'write')
+            else:
+                self._access(storage, operation_idx, 'modify')
+
+    def _access(self, storage, operation_idx, access):
+        buffer = self.buffers.get(id(storage))
+        if buffer is None:
+            self.buffers[id(storage)] = _Buffer(storage, operation_idx, access)
+            return
+        if buffer.last == operation_idx and buffer.last_access != access:
+            # the same operation reads and modifies the buffer
+            access = 'modify'
+            if buffer.first == operation_idx:
+                buffer.first_access = access
+        buffer.last = operation_idx
+        buffer.last_access = access
+
+    def plan(self, preserved_matrices=()):
+        """
+        Moves traced buffers into the shared arena. Must be called once.
+
+        Parameters
+        ----------
+        preserved_matrices : list of matrices
+            Matrices (sparse ones included) which values are used outside of
+            the traced iteration
+
+        Returns
+        -------
+        (int, int)
+            Peak number of bytes of traced buffers that are live during the
+            iteration before and after planning. Before planning every buffer
+            holds its memory during the whole iteration, after planning
+            buffers of the arena hold it only between their first and last
+            access.
+        """
+        if self.arena is not None:
+            raise ValueError('Memory has already been planned!')
+        preserved = set(id(_get_storage(m.data)) for m in _get_matrices(preserved_matrices)
+                        if not isinstance(m, RowSparseMatrix))
+        plannable = []
+        for storage_id, buffer in self.buffers.iteritems():
+            if buffer.first_access == 'write' and \
+                    buffer.last_access != 'write' and \
+                    self.storages.get(storage_id) is buffer.storage and \
+                    storage_id not in preserved and buffer.storage.nbytes:
+                plannable.append(buffer)
+
+        # first-fit placement in the order of lifetime starts: a buffer takes
+        # the lowest offset that is not used by buffers which are still live
+        plannable.sort(key=lambda b: (b.first, -b.storage.nbytes))
+        placed = []
+        arena_nbytes = 0
+        for buffer in plannable:
+            nbytes = -(-buffer.storage.nbytes // self.alignment) * self.alignment
+            placed = [e for e in placed if e[2] >= buffer.first]
+            offset = 0
+            for start, end, _ in sorted(placed):
+                if start - offset >= nbytes:
+                    break
+                offset = max(offset, end)
+            buffer.offset = offset
+            placed.append((offset, offset + nbytes, buffer.last))
+            arena_nbytes = max(arena_nbytes, offset + nbytes)
+
+        self.arena = np.empty(arena_nbytes + self.alignment, dtype=np.uint8)
+        shift = -self.arena.ctypes.data % self.alignment
+        offsets = dict((id(b.storage), (b.storage, shift + b.offset)) for b in plannable)
+        for obj in gc.get_objects():
+            if type(obj) is not CpuMatrix:
+                continue
+            storage = _get_storage(obj.data)
+            storage, offset = offsets.get(id(storage), (None, None))
+            if storage is None or storage is not _get_storage(obj.data):
+                continue
+            data = obj.data
+            offset += data.ctypes.data - storage.ctypes.data
+            obj.data = np.ndarray(data.shape, data.dtype, self.arena, offset, data.strides)
+
+        nbytes_before = sum(b.storage.nbytes for b in self.buffers.itervalues())
+        # sweep over lifetime boundaries of the arena buffers
+        events = sorted([(b.first, b.storage.nbytes) for b in plannable] +
+                        [(b.last + 1, -b.storage.nbytes) for b in plannable])
+        live_nbytes = peak_nbytes = 0
+        for _, nbytes in events:
+            live_nbytes += nbytes
+            peak_nbytes = max(peak_nbytes, live_nbytes)
+        nbytes_after = nbytes_before - sum(b.storage.nbytes for b in plannable) + peak_nbytes
+        self.buffers = {}
+        self.storages = {}
+        return nbytes_before, nbytes_after
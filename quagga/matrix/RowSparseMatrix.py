@@ -0,0 +1,193 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import numpy as np
+from quagga.matrix import CpuMatrix
+from quagga.matrix.CpuMatrix import _wait_matrices
+from quagga.matrix.CpuMatrix import _async_operation
+
+
+class RowSparseMatrix(object):
+    """
+    Derivative of a matrix that is non-zero only in a few of its rows (or
+    columns), like the derivative of an embedding matrix. It is stored as
+    unique ``ids`` of the rows and a ``values`` block with a row per id.
+    For columns (``axis == 1``) the block holds transposed columns.
+
+    Slices added with :meth:`add_rows_slice`, :meth:`add_rows_batch_slice`
+    or :meth:`add_columns_slice` are copied and coalesced immediately: rows
+    with the same index are summed into one row of the block, so the
+    derivative never keeps references to the added dense matrices and
+    :meth:`~quagga.matrix.CpuMatrix.add_scaled` applies it to a dense
+    matrix with a single update. Memory is kept between :meth:`clear` calls,
+    so once warmed up the matrix does not allocate its buffers.
+
+    The block lives on the host. Slices of
+    :class:`~quagga.matrix.GpuMatrix` instances are copied to the host
+    synchronously.
+    """
+    def __init__(self):
+        self.axis = None
+        self.last_modif_context = None
+        self.last_usage_context = None
+        self._nids = 0
+        self._ids = np.empty(0, np.int32)
+        self._values = np.empty((0, 0), np.float32)
+        # index of every row in the block, -1 for absent rows
+        self._positions = np.empty(0, np.int64)
+
+    @property
+    def ids(self):
+        return self._ids[:self._nids]
+
+    @property
+    def values(self):
+        return self._values[:self._nids]
+
+    @property
+    def last_modif_contexts(self):
+        return [self.last_modif_context] if self.last_modif_context else []
+
+    def add_rows_slice(self, context, row_indxs, a):
+        """
+        self[row_indxs] += a
+        """
+        self._add_slices(context, 0, row_indxs, a)
+
+    def add_rows_batch_slice(self, context, rows_indxs, dense_matrices):
+        """
+        for k in range(K):
+            self[rows_indxs[:, k]] += dense_matrices[k]
+        """
+        self._add_slices(context, 0, rows_indxs, dense_matrices)
+
+    def add_columns_slice(self, context, column_indxs, a):
+        """
+        self[:, column_indxs] += a
+        """
+        self._add_slices(context, 1, column_indxs, a)
+
+    def _add_slices(self, context, axis, indxs, a):
+        if self.axis is None:
+            self.axis = axis
+        elif self.axis != axis:
+            raise ValueError('RowSparseMatrix can not accumulate both '
+                             'rows and columns slices!')
+        if isinstance(indxs, CpuMatrix):
+            self._add_cpu_slices(context, indxs, a)
+        else:
+            indxs = indxs.to_host(context)
+            if isinstance(a, list):
+                a = [m.to_host(context) for m in a]
+            else:
+                a = a.to_host(context)
+            context.synchronize()
+            self._coalesce(*_get_slices(axis, indxs, a))
+
+    @_async_operation('self')
+    def _add_cpu_slices(self, context, indxs, a):
+        a = [m.npa for m in a] if isinstance(a, list) else a.npa
+        self._coalesce(*_get_slices(self.axis, indxs.npa, a))
+
+    def add(self, context, a):
+        """
+        Merges ``a`` into the matrix, self += a
+        """
+        if a.axis is None:
+            return
+        if self.axis is None:
+            self.axis = a.axis
+        elif self.axis != a.axis:
+            raise ValueError('RowSparseMatrix can not accumulate both '
+                             'rows and columns slices!')
+        self._add(context, a)
+
+    @_async_operation('self')
+    def _add(self, context, a):
+        self._coalesce(a.ids, a.values)
+
+    @_async_operation('self')
+    def scale(self, context, alpha):
+        self.values[...] *= alpha
+
+    @_async_operation('self')
+    def clear(self, context=None):
+        self._positions[self.ids] = -1
+        self._nids = 0
+
+    def get_norm(self, context=None):
+        """
+        Returns the Frobenius norm of the matrix, it waits for the
+        modifications of the matrix to complete.
+        """
+        context = context if context else self.last_modif_context
+        if context and getattr(context, 'deferred', False):
+            _wait_matrices(context, [], [self])
+            context.synchronize()
+        return float(np.sqrt(np.sum(np.square(self.values, dtype=np.float64))))
+
+    def _coalesce(self, ids, values):
+        """
+        self[ids] += values
+        """
+        if ids.size == 0:
+            return
+        order = np.argsort(ids, kind='mergesort')
+        sorted_ids = ids[order]
+        starts = np.flatnonzero(np.diff(sorted_ids)) + 1
+        starts = np.concatenate(([0], starts))
+        sums = np.add.reduceat(values[order], starts, axis=0)
+        ids = sorted_ids[starts]
+
+        if ids[-1] >= len(self._positions):
+            positions = np.empty(max(2 * len(self._positions), ids[-1] + 1), np.int64)
+            positions[:len(self._positions)] = self._positions
+            positions[len(self._positions):] = -1
+            self._positions = positions
+        positions = self._positions[ids]
+        new = positions == -1
+        n_new = int(np.count_nonzero(new))
+        if n_new:
+            self._reserve(self._nids + n_new, sums.shape[1])
+            positions[new] = np.arange(self._nids, self._nids + n_new)
+            self._positions[ids[new]] = positions[new]
+            self._ids[self._nids:self._nids + n_new] = ids[new]
+            self._values[self._nids:self._nids + n_new] = 0.0
+            self._nids += n_new
+        self._values[positions] += sums
+
+    def _reserve(self, nids, width):
+        if self._values.shape[1] != width:
+            if self._nids:
+                raise ValueError('Slices have a different number of elements '
+                                 'than the accumulated ones!')
+            self._values = np.empty((len(self._ids), width), np.float32)
+        if len(self._ids) < nids:
+            capacity = max(2 * len(self._ids), nids)
+            ids = np.empty(capacity, np.int32)
+            ids[:self._nids] = self.ids
+            values = np.empty((capacity, width), np.float32)
+            values[:self._nids] = self.values
+            self._ids, self._values = ids, values
+
+
+def _get_slices(axis, indxs, a):
+    """
+    Returns indices and the block of rows (transposed columns for
+    ``axis == 1``) of the slice ``a`` or of the list of row slices.
+    """
+    if isinstance(a, list):
+        return indxs[:, :len(a)].ravel(order='F'), np.vstack(a)
+    return indxs.ravel(), a.T if axis else a
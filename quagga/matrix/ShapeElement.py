@@ -15,7 +15,16 @@
 # ----------------------------------------------------------------------------
 import weakref
 import operator
+import threading
 from numbers import Number
+from itertools import chain
+from contextlib import contextmanager
+
+
+# `pending` holds elements changed inside of `batch_update` of the thread
+# with their values before the changes, so blocks that run concurrently
+# (see BlockScheduler) do not defer changes of each other
+_local = threading.local()
 
 
 class ShapeElement(object):
@@ -23,44 +32,181 @@ class ShapeElement(object):
     Instances of this class are used in order to specify the shape of matrices.
     It is used for shape inference and shape propagation.
 
+    Elements form a dependency graph: an element that is the result of an
+    arithmetic operation on other elements (or that was assigned another
+    element) is recomputed when they change. A change is propagated in a
+    topological order of the graph, so every dependent element is recomputed
+    once, and after all values are updated the modification handlers of the
+    changed elements are called (each handler once). Elements refer to their
+    dependents weakly and forget them as soon as they are garbage collected.
+
     Parameters
     ----------
     value : int
         Value of the ShapeElement instance
     """
+    # is incremented on every change of the dependency graph
+    _graph_version = 0
+
     def __init__(self, value):
         self.value = value
-        self.modif_handlers = set()
+        # (parents, function) pairs, the element is set to ``function()``
+        # (or to the value of the only parent if function is None) when one
+        # of the parents changes
+        self._sources = []
+        self._dependents = {}
+        self._handlers = {}
+        self._order = None, None
 
     def __setitem__(self, key, value):
         if key != slice(None):
             raise ValueError("key argument must be ':'")
         if isinstance(value, ShapeElement):
-            value = weakref.proxy(value)
-            self_proxy = weakref.proxy(self)
-            modif_handler = lambda: self_proxy.__setitem__(slice(None),
-                                                           value.value)
-            value.add_modification_handler(modif_handler)
+            if value is not self and not any(function is None and parents[0] is value
+                                             for parents, function in self._sources):
+                self._add_source((value, ), None)
             self[:] = value.value
         elif isinstance(value, int):
             if self.value != value:
-                self.value = value
-                needless_handlers = []
-                for modif_handler in self.modif_handlers:
-                    try:
-                        modif_handler()
-                    except ReferenceError:
-                        needless_handlers.append(modif_handler)
-                self.modif_handlers.difference_update(needless_handlers)
+                pending = getattr(_local, 'pending', None)
+                if pending is None:
+                    self.value = value
+                    ShapeElement._propagate([self])
+                else:
+                    if id(self) not in pending:
+                        pending[id(self)] = (self, self.value)
+                    self.value = value
         else:
             raise TypeError("'value' argument must be int or ShapeElement")
 
+    @staticmethod
+    @contextmanager
+    def batch_update():
+        """
+        Defers propagation of changes made inside of the ``with`` block
+        until the block exits, so elements that depend on several changed
+        ones are recomputed and their handlers are called only once. Values
+        assigned explicitly inside of the block are not overwritten by the
+        propagation. Changes made by other threads are not deferred.
+        """
+        if getattr(_local, 'pending', None) is not None:
+            yield
+            return
+        _local.pending = {}
+        try:
+            yield
+        finally:
+            pending = _local.pending
+            _local.pending = None
+            roots = [element for element, value in pending.itervalues() if element.value != value]
+            if roots:
+                ShapeElement._propagate(roots)
+
+    @staticmethod
+    def _propagate(roots):
+        # elements without dependents only need their handlers to be called
+        inner_roots = [element for element in roots if element._dependents]
+        if len(inner_roots) == 1:
+            order = inner_roots[0]._get_order()
+        else:
+            order = ShapeElement._get_topological_order(inner_roots)
+        root_ids = set(id(element) for element in roots)
+        changed = set(root_ids)
+        for element in order:
+            if id(element) in root_ids:
+                continue
+            sources = element._sources
+            if len(sources) == 1:
+                parents, function = sources[0]
+                value = function() if function else parents[0].value
+            else:
+                value = element.value
+                for parents, function in sources:
+                    for parent in parents:
+                        if id(parent) in changed:
+                            value = function() if function else parents[0].value
+                            break
+            if element.value != value:
+                element.value = value
+                changed.add(id(element))
+
+        called_handlers = set()
+        for element in chain(order, roots):
+            if not element._handlers or id(element) not in changed:
+                continue
+            for handler in element._handlers.keys():
+                if handler in called_handlers:
+                    continue
+                called_handlers.add(handler)
+                try:
+                    handler()
+                except ReferenceError:
+                    element._handlers.pop(handler, None)
+
+    def _get_order(self):
+        # the topological order of the element and its dependents is cached
+        # until the next change of the graph
+        version, order = self._order
+        if version != ShapeElement._graph_version:
+            order = ShapeElement._get_topological_order([self])
+            self._order = ShapeElement._graph_version, [weakref.ref(element) for element in order]
+            return order
+        return [element for element in (element_ref() for element_ref in order) if element is not None]
+
+    @staticmethod
+    def _get_topological_order(roots):
+        # reversed post-order of an iterative depth-first search
+        order = []
+        visited = set()
+        for root in roots:
+            if id(root) in visited:
+                continue
+            visited.add(id(root))
+            stack = [(root, root._iter_dependents())]
+            while stack:
+                element, dependents = stack[-1]
+                for dependent in dependents:
+                    if id(dependent) not in visited:
+                        visited.add(id(dependent))
+                        stack.append((dependent, dependent._iter_dependents()))
+                        break
+                else:
+                    stack.pop()
+                    order.append(element)
+        order.reverse()
+        return order
+
+    def _iter_dependents(self):
+        for element_ref in self._dependents.values():
+            element = element_ref()
+            if element is not None:
+                yield element
+
+    def _add_source(self, parents, function):
+        self._sources.append((parents, function))
+        for parent in parents:
+            parent._add_dependent(self)
+
+    def _add_dependent(self, element):
+        key = id(element)
+        if key in self._dependents:
+            return
+        self_ref = weakref.ref(self)
+
+        def discard(_):
+            ShapeElement._graph_version += 1
+            parent = self_ref()
+            if parent is not None:
+                parent._dependents.pop(key, None)
+        self._dependents[key] = weakref.ref(element, discard)
+        ShapeElement._graph_version += 1
+
     def operation(self, other, op):
         """
-        Performs corresponding operations on ``self`` and ``other``. Also,
-        this method adds to ``self`` and ``other`` a corresponding modification
-        handler that is used for shape propagation in case one of the elements
-        (``self`` or ``other``) is changed.
+        Performs corresponding operations on ``self`` and ``other``. The
+        result depends on ``self`` and ``other`` in the shape dependency
+        graph, so it is recomputed in case one of the elements (``self`` or
+        ``other``) is changed.
 
         Parameters
         ----------
@@ -75,23 +221,12 @@ class ShapeElement(object):
         """
         if isinstance(other, ShapeElement):
             element = ShapeElement(op(self.value, other.value))
-            element_proxy = weakref.proxy(element)
-            self_proxy = weakref.proxy(self)
-            other = weakref.proxy(other)
-            handler = lambda: element_proxy.__setitem__(slice(None),
-                                                        op(self_proxy.value,
-                                                           other.value))
-            other.add_modification_handler(handler)
+            element._add_source((self, other), lambda: op(self.value, other.value))
         elif isinstance(other, int):
             element = ShapeElement(op(self.value, other))
-            element_proxy = weakref.proxy(element)
-            self_proxy = weakref.proxy(self)
-            handler = lambda: element_proxy.__setitem__(slice(None),
-                                                        op(self_proxy.value,
-                                                           other))
+            element._add_source((self, ), lambda: op(self.value, other))
         else:
             raise TypeError("'other' argument must be int or ShapeElement")
-        self.add_modification_handler(handler)
         return element
 
     def __add__(self, other):
@@ -156,18 +291,29 @@ class ShapeElement(object):
             raise ValueError('Value of ShapeElement is not int!')
         return self.value
 
-    def add_modification_handler(self, handler):
+    def add_modification_handler(self, handler, owner=None):
         """
-        Adds a modification handler ``handler`` to a set of modification
-        handlers of the instance. This function will be called in case of
-        the instance's value is changed.
+        Adds a modification handler ``handler`` to the instance. This
+        function will be called in case of the instance's value is changed.
 
         Parameters
         ----------
         handler : python function
-
+        owner : object
+            If it is given, the handler is removed as soon as ``owner`` is
+            garbage collected, otherwise it is removed when it raises
+            ``ReferenceError``
         """
-        self.modif_handlers.add(handler)
+        if owner is None:
+            self._handlers[handler] = None
+            return
+        self_ref = weakref.ref(self)
+
+        def discard(_):
+            element = self_ref()
+            if element is not None:
+                element._handlers.pop(handler, None)
+        self._handlers[handler] = weakref.ref(owner, discard)
 
     @staticmethod
     def _get_reflected_op(op):
@@ -14,7 +14,8 @@
 # limitations under the License.
 # ----------------------------------------------------------------------------
 from quagga.matrix.ShapeElement import ShapeElement
-from quagga.matrix.SparseMatrix import SparseMatrix
 from quagga.matrix.CpuMatrix import CpuMatrix
 from quagga.matrix.GpuMatrix import GpuMatrix
-from quagga.matrix.Matrix import Matrix
\ No newline at end of file
+from quagga.matrix.RowSparseMatrix import RowSparseMatrix
+from quagga.matrix.Matrix import Matrix
+from quagga.matrix.MemoryPlanner import MemoryPlanner
@@ -0,0 +1,70 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import threading
+import ctypes as ct
+import numpy as np
+
+
+# numpy reports every allocation of array data to the event hook
+# (PyDataMem_SetEventHook, index 291 of the numpy C-API table)
+_event_hook_type = ct.CFUNCTYPE(None, ct.c_void_p, ct.c_void_p, ct.c_size_t, ct.c_void_p)
+_set_event_hook_type = ct.CFUNCTYPE(ct.c_void_p, _event_hook_type, ct.c_void_p, ct.POINTER(ct.c_void_p))
+_set_event_hook = None
+_active_counters = []
+_lock = threading.Lock()
+
+
+def _on_event(in_ptr, out_ptr, size, user_data):
+    if out_ptr and not in_ptr:
+        for counter in _active_counters:
+            counter.sizes.append(size)
+_hook = _event_hook_type(_on_event)
+
+
+def _get_set_event_hook():
+    global _set_event_hook
+    if _set_event_hook is None:
+        ct.pythonapi.PyCObject_AsVoidPtr.restype = ct.c_void_p
+        ct.pythonapi.PyCObject_AsVoidPtr.argtypes = [ct.py_object]
+        api = ct.pythonapi.PyCObject_AsVoidPtr(np.core.multiarray._ARRAY_API)
+        _set_event_hook = _set_event_hook_type(ct.cast(api, ct.POINTER(ct.c_void_p))[291])
+    return _set_event_hook
+
+
+class AllocationCounter(object):
+    """
+    Collects sizes of numpy array data allocations made inside of the
+    ``with`` block (by any thread). Counters can be nested.
+    """
+    def __init__(self):
+        self.sizes = []
+
+    @property
+    def nbytes(self):
+        return sum(self.sizes)
+
+    def __enter__(self):
+        with _lock:
+            if not _active_counters:
+                _get_set_event_hook()(_hook, None, ct.byref(ct.c_void_p()))
+            _active_counters.append(self)
+        return self
+
+    def __exit__(self, *args):
+        with _lock:
+            _active_counters.remove(self)
+            if not _active_counters:
+                _get_set_event_hook()(_event_hook_type(), None, ct.byref(ct.c_void_p()))
@@ -0,0 +1,59 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+from quagga.utils import List
+from quagga.matrix import Matrix
+from quagga.matrix import ShapeElement
+
+
+class ContiguousList(List):
+    """
+    :class:`List` of ``max_length`` matrices of the same shape that are
+    views of consecutive blocks of one buffer, so the sequence is stored as
+    one contiguous ``(max_length x nrows x ncols)`` tensor. Sequence
+    operations of :class:`~quagga.matrix.CpuMatrix` recognize consecutive
+    elements by their ``sequence_position`` and process all time steps with
+    a single numpy call instead of a python loop. Elements share ``nrows``
+    and ``ncols``, so changing the shape of one of them changes all.
+
+    Parameters
+    ----------
+    max_length : int
+    nrows : int or ShapeElement
+        The buffer is allocated for the current value, the elements can
+        shrink below it
+    ncols : int or ShapeElement
+    dtype : str
+    device_id : int
+    length : int or ShapeElement
+        Defaults to ``max_length``
+    wrapper : callable
+        Applied to every matrix to get the element of the list, for example
+        ``lambda matrix: Connector(matrix, device_id)``
+    """
+    def __init__(self, max_length, nrows, ncols, dtype=None, device_id=None, length=None, wrapper=None):
+        # all elements share shape elements, so they always have one shape
+        nrows = nrows if isinstance(nrows, ShapeElement) else ShapeElement(nrows)
+        ncols = ncols if isinstance(ncols, ShapeElement) else ShapeElement(ncols)
+        size = int(nrows) * int(ncols)
+        self.buffer = Matrix.empty(max_length * int(nrows), int(ncols), dtype, device_id)
+        elements = []
+        for k in xrange(max_length):
+            element = self.buffer.contiguous_view(k * size, nrows, ncols)
+            element.sequence_position = self.buffer, k
+            elements.append(element)
+        if wrapper:
+            elements = [wrapper(e) for e in elements]
+        super(ContiguousList, self).__init__(elements, length)
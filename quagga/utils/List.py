@@ -13,6 +13,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ----------------------------------------------------------------------------
+import operator
+from itertools import islice
 from quagga.matrix import ShapeElement
 
 
@@ -31,10 +33,21 @@ class List(object):
         self._length[:] = value
 
     def __getitem__(self, k):
-        return self.elements[:self.length][k]
+        # indexes the elements in place instead of copying the first
+        # `length` of them on every access
+        length = self.length.value
+        if isinstance(k, slice):
+            start, stop, step = k.indices(length)
+            return self.elements[start:stop if stop >= 0 else None:step]
+        k = operator.index(k)
+        if k < 0:
+            k += length
+        if not 0 <= k < length:
+            raise IndexError('list index out of range')
+        return self.elements[k]
 
     def __iter__(self):
-        return iter(self.elements[:self.length])
+        return islice(self.elements, self.length.value)
 
     def __len__(self):
         # TODO(sergii): fix everreting related to calling builtin len() function because it returns int instead of ShapeElement
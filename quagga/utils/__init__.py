@@ -16,4 +16,6 @@
 from quagga.utils.List import List
 from NoGradientWrapper import NoGradientWrapper
 from NoGradientWrapper import get_non_bprobagable
-from quagga.utils.CustomDefaultDict import CustomDefaultDict
\ No newline at end of file
+from quagga.utils.CustomDefaultDict import CustomDefaultDict
+from quagga.utils.AllocationCounter import AllocationCounter
+from quagga.utils.ContiguousList import ContiguousList
\ No newline at end of file
@@ -0,0 +1,76 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import quagga
+import numpy as np
+from unittest import TestCase
+from quagga.benchmarks import run
+from quagga.benchmarks import compare
+from quagga.benchmarks import get_block_benchmarks
+from quagga.benchmarks import get_matrix_benchmarks
+from quagga.benchmarks import get_model_benchmarks
+from quagga.benchmarks import get_decoding_benchmarks
+from quagga.benchmarks import get_scatter_add_benchmarks
+
+
+class TestRunner(TestCase):
+    def test_run(self):
+        """
+        check that every matrix operation, block and model benchmark can be
+        run
+        """
+        processor_type = quagga.processor_type
+        benchmarks = get_matrix_benchmarks([(4, 8)], 3) + get_block_benchmarks([(4, 8)], 3) + \
+                     get_model_benchmarks([(4, 8)], 3, vocab_size=10)
+        results = run(benchmarks, min_run_time=1e-3, repeats=1, verbose=False)
+        self.assertEqual(len(results['results']) + len(results['errors']), len(benchmarks))
+        self.assertTrue(all(e['min'] > 0.0 for e in results['results'].itervalues()))
+        self.assertEqual(quagga.processor_type, processor_type)
+
+    def test_throughput(self):
+        """
+        check that benchmarks with ``n_items`` report their throughput
+        """
+        benchmarks = get_decoding_benchmarks([1, 3], dim=8, vocab_size=10, n_steps=3) + \
+                     get_scatter_add_benchmarks([10, 100], [(4, 3)], dim=8)
+        results = run(benchmarks, min_run_time=1e-3, repeats=1, verbose=False)
+        self.assertEqual(len(results['results']), len(benchmarks))
+        self.assertTrue(all(e['items_per_second'] > 0.0 for e in results['results'].itervalues()))
+
+    def test_reference(self):
+        """
+        check that the reference scatter_add run can be compared with the
+        vectorized one benchmark by benchmark
+        """
+        runs = []
+        for reference in [True, False]:
+            benchmarks = get_scatter_add_benchmarks([10, 100], [(4, 3)], dim=8, reference=reference)
+            runs.append(run(benchmarks, min_run_time=1e-3, repeats=1, verbose=False))
+        comparison = compare(*runs)
+        self.assertEqual(len(comparison), len(benchmarks))
+        self.assertTrue(all(base_time > 0.0 and new_time > 0.0 for _, base_time, new_time, _, _ in comparison))
+
+    def test_compare(self):
+        """
+        check that slowdowns and speedups beyond the threshold are flagged
+        """
+        times = {'a': 1.0, 'b': 1.0, 'c': 1.0, 'd': 1.0}
+        new_times = {'a': 1.05, 'b': 1.5, 'c': 0.5, 'e': 1.0}
+        to_results = lambda times: {'results': dict((name, {'min': t}) for name, t in times.iteritems())}
+        comparison = compare(to_results(times), to_results(new_times), threshold=0.1)
+        flags = dict((name, flag) for name, _, _, _, flag in comparison)
+        self.assertEqual(flags, {'a': '', 'b': 'regression', 'c': 'improvement'})
+        ratios = [ratio for _, _, _, ratio, _ in comparison]
+        self.assertTrue(np.allclose(ratios, [1.05, 1.5, 0.5]))
@@ -121,3 +121,38 @@ class TestHorizontalStackBlock(TestCase):
             else:
                 r.append(True)
         self.assertEqual(sum(r), self.N)
+
+    def test_share_memory(self):
+        quagga.processor_type = 'cpu'
+        r = []
+        for i in xrange(self.N):
+            matrices = []
+            device_ids = []
+            nrows = self.rng.random_integers(1, 300)
+            for _ in xrange(self.rng.random_integers(1, 10)):
+                ncols = self.rng.random_integers(1, 200)
+                device_ids.append(self.rng.choice([0, None]))
+                matrices.append(self.rng.rand(nrows, ncols).astype(np.float32))
+            true_labels = self.rng.randint(sum(m.shape[1] for m in matrices), size=(nrows, 1)).astype(np.int32)
+
+            output = {}
+            for share_memory in [False, True]:
+                qmatrices = [Connector(Matrix.from_npa(m), d_id) for m, d_id in izip(matrices, device_ids)]
+                qtrue_labels = Connector(Matrix.from_npa(true_labels))
+                hstack_block = HorizontalStackBlock(*qmatrices, share_memory=share_memory)
+                sce_block = SoftmaxCeBlock(hstack_block.output, qtrue_labels)
+
+                for m in qmatrices:
+                    m.fprop()
+                qtrue_labels.fprop()
+                hstack_block.fprop()
+                sce_block.fprop()
+                sce_block.bprop()
+                hstack_block.bprop()
+
+                output[share_memory] = [hstack_block.output.to_host()] + \
+                                       [m.backward_matrix.to_host() for m in qmatrices if m.bpropagable]
+
+            r.append(all(np.allclose(a, b) for a, b in izip(output[False], output[True])))
+            r[-1] &= hstack_block.matrices[0].data.base is not None
+        self.assertEqual(sum(r), self.N)
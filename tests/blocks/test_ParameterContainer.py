@@ -0,0 +1,66 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import quagga
+import numpy as np
+from itertools import izip
+from unittest import TestCase
+from quagga.matrix import Matrix
+from quagga.context import Context
+from quagga.blocks import ParameterContainer
+from quagga.learning.steps import AdamStep
+from quagga.learning.policies import FixedValuePolicy
+
+
+class TestParameterContainer(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+        cls.N = 10
+
+    def setUp(self):
+        quagga.processor_type = 'cpu'
+
+    def test_flat_parameters(self):
+        """
+        compare updates of flat and separate parameters
+        """
+        r = []
+        for i in xrange(self.N):
+            n = self.rng.random_integers(20)
+            shapes = [tuple(self.rng.random_integers(100, size=2)) for _ in xrange(n)]
+            inits = [self.rng.randn(*shape).astype(np.float32) for shape in shapes]
+            gradients = [[self.rng.randn(*shape).astype(np.float32) for shape in shapes] for _ in xrange(3)]
+
+            results = []
+            for flat in [False, True]:
+                context = Context()
+                definitions = {}
+                for k, a in enumerate(inits):
+                    definitions['p{}'.format(k)] = {'init': lambda a=a: a, 'device_id': 0, 'flat': flat}
+                p = ParameterContainer(**definitions)
+                params = [p['p{}'.format(k)] for k in xrange(n)]
+                dL_dparams = [param.register_usage(0, 0)[1] for param in params]
+                step = AdamStep(p.flat_parameters.values() if flat else params, FixedValuePolicy(0.01))
+                for iteration_gradients in gradients:
+                    p.fprop()
+                    for dL_dparam, dL_dp in izip(dL_dparams, iteration_gradients):
+                        dL_dparam.add(context, Matrix.from_npa(dL_dp))
+                    step.notify()
+                results.append([param.to_host() for param in params])
+            for separate, flat in izip(*results):
+                r.append(np.allclose(separate, flat))
+
+        self.assertEqual(sum(r), len(r))
@@ -0,0 +1,135 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import quagga
+import numpy as np
+from itertools import izip
+from unittest import TestCase
+from quagga.utils import List
+from quagga.matrix import Matrix
+from quagga.context import Context
+from quagga.blocks import LstmBlock
+from quagga.connector import Connector
+from quagga.blocks import SequencerBlock
+
+
+class TestSequencerBlock(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+        cls.N = 10
+
+    def test_checkpointing(self):
+        """
+        compare `fprop` and `bprop` results of SequencerBlock with LstmBlock
+        with and without activation checkpointing
+        """
+        r = []
+        for i in xrange(self.N):
+            max_input_sequence_len = self.rng.random_integers(100)
+            sequence_lens = [max_input_sequence_len, self.rng.random_integers(max_input_sequence_len)]
+            batch_size = self.rng.random_integers(128)
+            input_dim, hidden_dim = self.rng.random_integers(300, size=2)
+            x = [self.rng.randn(batch_size, input_dim).astype(np.float32) for _ in xrange(max_input_sequence_len)]
+            dL_dh = [self.rng.randn(batch_size, hidden_dim).astype(np.float32) for _ in xrange(max_input_sequence_len)]
+            mask = (self.rng.rand(batch_size, max_input_sequence_len) < 0.8).astype(np.float32)
+            h_0 = self.rng.randn(batch_size, hidden_dim).astype(np.float32)
+            c_0 = self.rng.randn(batch_size, hidden_dim).astype(np.float32)
+            W = self.rng.randn(input_dim, 4 * hidden_dim).astype(np.float32) / np.sqrt(input_dim)
+            R = self.rng.randn(hidden_dim, 4 * hidden_dim).astype(np.float32) / np.sqrt(hidden_dim)
+            b = self.rng.rand(1, 4 * hidden_dim).astype(np.float32)
+            checkpoint_interval = self.rng.random_integers(max_input_sequence_len)
+            device_id = 0
+
+            for processor_type in ['gpu', 'cpu']:
+                quagga.processor_type = processor_type
+                for reverse in [False, True]:
+                    for with_mask in [False, True]:
+                        results = []
+                        for interval in [None, 'sqrt', checkpoint_interval]:
+                            context = Context()
+                            qx = List([Connector(Matrix.from_npa(e), device_id) for e in x])
+                            qh_0 = Connector(Matrix.from_npa(h_0), device_id)
+                            qc_0 = Connector(Matrix.from_npa(c_0), device_id)
+                            qW = Connector(Matrix.from_npa(W), device_id)
+                            qR = Connector(Matrix.from_npa(R), device_id)
+                            qb = Connector(Matrix.from_npa(b), device_id)
+                            qmask = None
+                            if with_mask:
+                                qmask = List([Connector(Matrix.from_npa(mask[:, i:i+1])) for i in xrange(max_input_sequence_len)])
+                            lstm = SequencerBlock(block_class=LstmBlock,
+                                                  params=[qW, qR, qb, 5.0],
+                                                  sequences=[qx, qmask if qmask else [None] * len(qx)],
+                                                  output_names=['h'],
+                                                  prev_names=['c', 'h'],
+                                                  paddings=[qc_0, qh_0],
+                                                  reverse=reverse,
+                                                  checkpoint_interval=interval)
+                            dL_dh_matrices = [h.register_usage(device_id, device_id)[1] for h in lstm.h]
+                            result = []
+                            for sequence_len in sequence_lens:
+                                qx.length = sequence_len
+                                if with_mask:
+                                    qmask.length = sequence_len
+                                    qmask.fprop()
+                                qx.fprop()
+                                for e in [qh_0, qc_0, qW, qR, qb]:
+                                    e.fprop()
+                                lstm.fprop()
+                                for dL_dh_matrix, e in izip(dL_dh_matrices, dL_dh[:sequence_len]):
+                                    dL_dh_matrix.assign_npa(context, e)
+                                lstm.bprop()
+                                result.extend([h.to_host() for h in lstm.h] +
+                                              [e.backward_matrix.to_host() for e in [qW, qR, qb, qc_0, qh_0]] +
+                                              [e.backward_matrix.to_host() for e in qx])
+                            results.append(result)
+
+                        for checkpointed_results in results[1:]:
+                            for result, checkpointed_result in izip(results[0], checkpointed_results):
+                                r.append(np.allclose(result, checkpointed_result, atol=1e-4))
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_checkpointed_states(self):
+        """
+        check that with activation checkpointing only states of the last
+        blocks of segments and outputs are kept for every time step
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for i in xrange(self.N):
+            max_input_sequence_len = self.rng.random_integers(100)
+            batch_size, input_dim, hidden_dim = self.rng.random_integers(16, size=3)
+            checkpoint_interval = self.rng.random_integers(max_input_sequence_len)
+            qx = List([Connector(Matrix.from_npa(self.rng.randn(batch_size, input_dim).astype(np.float32)), 0)
+                       for _ in xrange(max_input_sequence_len)])
+            qh_0, qc_0 = [Connector(Matrix.from_npa(self.rng.randn(batch_size, hidden_dim).astype(np.float32)), 0)
+                          for _ in xrange(2)]
+            qW = Connector(Matrix.from_npa(self.rng.randn(input_dim, 4 * hidden_dim).astype(np.float32)), 0)
+            qR = Connector(Matrix.from_npa(self.rng.randn(hidden_dim, 4 * hidden_dim).astype(np.float32)), 0)
+            qb = Connector(Matrix.from_npa(self.rng.rand(1, 4 * hidden_dim).astype(np.float32)), 0)
+            lstm = SequencerBlock(block_class=LstmBlock,
+                                  params=[qW, qR, qb, 5.0],
+                                  sequences=[qx, [None] * len(qx)],
+                                  output_names=['h'],
+                                  prev_names=['c', 'h'],
+                                  paddings=[qc_0, qh_0],
+                                  checkpoint_interval=checkpoint_interval)
+            n_c = len(set(id(block.c) for block in lstm.blocks))
+            n_h = len(set(id(block.h) for block in lstm.blocks))
+            r.append(n_c == min(max_input_sequence_len, checkpoint_interval - 1) + max_input_sequence_len // checkpoint_interval)
+            r.append(n_h == max_input_sequence_len)
+
+        self.assertEqual(sum(r), len(r))
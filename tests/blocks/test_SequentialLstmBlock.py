@@ -30,6 +30,7 @@ from quagga.connector import Connector
 from quagga.blocks import SoftmaxCeBlock
 from quagga.blocks import SigmoidCeBlock
 from quagga.blocks import SequencerBlock
+from quagga.blocks import SequentialLstmBlock
 
 
 class TestSequentialLstmBlock(TestCase):
@@ -218,6 +219,76 @@ class TestSequentialLstmBlock(TestCase):
 
         self.assertEqual(sum(r), len(r))
 
+    def test_sequential_lstm_block(self):
+        """
+        compare `fprop` and `bprop` results of SequentialLstmBlock and
+        SequencerBlock with LstmBlock
+        """
+
+        r = []
+        for i in xrange(self.N):
+            max_input_sequence_len = self.rng.random_integers(100)
+            sequence_len = max_input_sequence_len if i == 0 else self.rng.random_integers(max_input_sequence_len)
+            batch_size = self.rng.random_integers(128)
+            input_dim, hidden_dim = self.rng.random_integers(300, size=2)
+            x = [self.rng.randn(batch_size, input_dim).astype(np.float32) for _ in xrange(max_input_sequence_len)]
+            dL_dh = [self.rng.randn(batch_size, hidden_dim).astype(np.float32) for _ in xrange(max_input_sequence_len)]
+            mask = (self.rng.rand(batch_size, sequence_len) < 0.8).astype(np.float32)
+            h_0 = self.rng.randn(batch_size, hidden_dim).astype(np.float32)
+            c_0 = self.rng.randn(batch_size, hidden_dim).astype(np.float32)
+            W = self.get_orthogonal_matrix(input_dim, 4 * hidden_dim)
+            R = self.get_orthogonal_matrix(hidden_dim, 4 * hidden_dim)
+            b = self.rng.rand(1, 4 * hidden_dim).astype(np.float32)
+            device_id = 0
+
+            for processor_type in ['gpu', 'cpu']:
+                quagga.processor_type = processor_type
+                for reverse in [False, True]:
+                    for with_mask in [False, True]:
+                        results = []
+                        for sequential in [False, True]:
+                            context = Context()
+                            qx = List([Connector(Matrix.from_npa(e), device_id) for e in x])
+                            qh_0 = Connector(Matrix.from_npa(h_0), device_id)
+                            qc_0 = Connector(Matrix.from_npa(c_0), device_id)
+                            qW = Connector(Matrix.from_npa(W), device_id)
+                            qR = Connector(Matrix.from_npa(R), device_id)
+                            qb = Connector(Matrix.from_npa(b), device_id)
+                            qmask = None
+                            if with_mask:
+                                qmask = List([Connector(Matrix.from_npa(mask[:, i:i+1])) for i in xrange(sequence_len)] +
+                                             [Connector(Matrix.empty(batch_size, 1)) for _ in xrange(sequence_len, len(qx))])
+                            if sequential:
+                                lstm = SequentialLstmBlock(qW, qR, qb, 5.0, qx, qmask, qc_0, qh_0, reverse=reverse)
+                            else:
+                                lstm = SequencerBlock(block_class=LstmBlock,
+                                                      params=[qW, qR, qb, 5.0],
+                                                      sequences=[qx, qmask if qmask else [None] * len(qx)],
+                                                      output_names=['h'],
+                                                      prev_names=['c', 'h'],
+                                                      paddings=[qc_0, qh_0],
+                                                      reverse=reverse)
+                            dL_dh_matrices = [h.register_usage(device_id, device_id)[1] for h in lstm.h]
+                            qx.length = sequence_len
+                            if with_mask:
+                                qmask.length = sequence_len
+                                qmask.fprop()
+                            qx.fprop()
+                            for e in [qh_0, qc_0, qW, qR, qb]:
+                                e.fprop()
+                            lstm.fprop()
+                            for dL_dh_matrix, e in izip(dL_dh_matrices, dL_dh[:sequence_len]):
+                                dL_dh_matrix.assign_npa(context, e)
+                            lstm.bprop()
+                            results.append([h.to_host() for h in lstm.h] +
+                                           [e.backward_matrix.to_host() for e in [qW, qR, qb, qc_0, qh_0]] +
+                                           [e.backward_matrix.to_host() for e in qx])
+
+                        for sequencer_result, sequential_result in izip(*results):
+                            r.append(np.allclose(sequencer_result, sequential_result, atol=1e-4))
+
+        self.assertEqual(sum(r), len(r))
+
     def test_theano_fprop(self):
         quagga.processor_type = 'gpu'
         r = []
@@ -0,0 +1,107 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import time
+import quagga
+import numpy as np
+from unittest import TestCase
+from quagga.matrix import CpuMatrix
+from quagga.context import CpuContext
+
+
+class TestCpuContext(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+        cls.cpu_context_workers = quagga.cpu_context_workers
+        quagga.cpu_context_workers = 4
+
+    @classmethod
+    def tearDownClass(cls):
+        quagga.cpu_context_workers = cls.cpu_context_workers
+
+    def test_dependencies(self):
+        N = 10
+        k = 6
+        finished = set()
+        violations = []
+        contexts = [CpuContext() for _ in xrange(k)]
+
+        def node(name, blocking_nodes):
+            time.sleep(self.rng.rand() * 1e-3)
+            if not blocking_nodes.issubset(finished):
+                violations.append(name)
+            finished.add(name)
+
+        for i in xrange(N):
+            for context_id in xrange(3):
+                blocking_nodes = {(i - 1, 5)} if i else set()
+                contexts[context_id].add_callback(node, (i, context_id), blocking_nodes)
+            for context_id in xrange(3, 5):
+                contexts[context_id].wait(*contexts[:3])
+                contexts[context_id].add_callback(node, (i, context_id), {(i, 0), (i, 1), (i, 2)})
+            contexts[5].wait(*contexts[3:5])
+            contexts[5].add_callback(node, (i, 5), {(i, 3), (i, 4)})
+            contexts[5].block(*contexts[:3])
+
+        for context in contexts:
+            context.synchronize()
+        self.assertEqual(len(finished), k * N)
+        self.assertEqual(violations, [])
+
+    def test_matrix_operations(self):
+        a = self.rng.rand(300, 200).astype(np.float32)
+        b = self.rng.rand(200, 100).astype(np.float32)
+        contexts = [CpuContext() for _ in xrange(3)]
+        a_cpu = CpuMatrix.from_npa(a)
+        b_cpu = CpuMatrix.from_npa(b)
+        c_cpu = CpuMatrix.empty(300, 100)
+        d_cpu = CpuMatrix.empty(300, 100)
+        c_cpu.assign_dot(contexts[0], a_cpu, b_cpu)
+        c_cpu.scale(contexts[0], 2.0)
+        # d must wait for c that is computed in another context
+        d_cpu.assign_scaled_addition(contexts[1], 0.5, c_cpu, c_cpu)
+        self.assertTrue(np.allclose(d_cpu.to_host(contexts[2]), 2 * np.dot(a, b), atol=1e-4))
+
+    def test_variable_shapes(self):
+        # the queued work must use the shapes the matrices had when it was
+        # enqueued, they are changed for the next batch before it runs
+        context = CpuContext()
+        w = self.rng.rand(20, 10).astype(np.float32)
+        w_cpu = CpuMatrix.from_npa(w)
+        a_cpu = CpuMatrix.empty(50, 20)
+        batches = []
+        outputs = []
+        for nrows in [50, 7, 31, 1, 18]:
+            context.add_callback(time.sleep, 1e-2)
+            batch = self.rng.rand(nrows, 20).astype(np.float32)
+            a_cpu.assign_npa(context, batch)
+            output = CpuMatrix.empty(nrows, 10)
+            output.assign_dot(context, a_cpu, w_cpu)
+            batches.append(batch)
+            outputs.append(output)
+        context.synchronize()
+        for batch, output in zip(batches, outputs):
+            self.assertTrue(np.allclose(output.npa, np.dot(batch, w), atol=1e-5))
+
+    def test_exception_propagation(self):
+        context = CpuContext()
+
+        def fail():
+            raise ZeroDivisionError()
+
+        context.add_callback(fail)
+        self.assertRaises(ZeroDivisionError, context.synchronize)
+        context.synchronize()
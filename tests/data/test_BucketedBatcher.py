@@ -0,0 +1,60 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import numpy as np
+from unittest import TestCase
+from quagga.data import BucketedBatcher
+
+
+class TestBucketedBatcher(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+        cls.N = 20
+
+    def test_epoch(self):
+        """
+        check that an epoch contains every sequence once and that arrays
+        describe the sequences
+        """
+        r = []
+        for _ in xrange(self.N):
+            n, batch_size, max_len = self.rng.random_integers(1, 50, size=3)
+            sequences = [list(self.rng.randint(100, size=self.rng.randint(2 * max_len))) for _ in xrange(n)]
+            if not any(0 < len(s) <= max_len for s in sequences):
+                sequences.append([1])
+            batcher = BucketedBatcher(sequences, batch_size, max_len, randomize=self.rng.randint(2))
+            expected = sorted(tuple(s) for s in sequences if 0 < len(s) <= max_len)
+            batches = list(batcher)
+            r.append(all(len(x) == batch_size for x, _, _ in batches[:-1]))
+            seen = []
+            for x, lengths, mask in batches:
+                r.append(x.dtype == np.int32 and lengths.dtype == np.int32 and mask.dtype == np.float32)
+                r.append(x.flags.f_contiguous and mask.flags.f_contiguous)
+                r.append(x.shape[1] == lengths.max())
+                r.append(np.array_equal(mask.sum(axis=1, keepdims=True), lengths))
+                for row, length in zip(x, lengths[:, 0]):
+                    seen.append(tuple(row[:length]))
+                    r.append(not np.any(row[length:]))
+            r.append(sorted(seen) == expected)
+        self.assertEqual(sum(r), len(r))
+
+    def test_infinite(self):
+        sequences = [[1] * (k % 7 + 1) for k in xrange(30)]
+        batcher = BucketedBatcher(sequences, 8, randomize=True, infinite=True)
+        epoch_size = len(list(batcher.iter_batch_indices()))
+        batches = iter(batcher)
+        for _ in xrange(3 * epoch_size):
+            next(batches)
@@ -0,0 +1,78 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import shutil
+import tempfile
+import numpy as np
+from unittest import TestCase
+from quagga.data import Corpus
+from quagga.data import BucketedBatcher
+
+
+class TestCorpus(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+        cls.N = 10
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_write(self):
+        """
+        check that sequences read from a written corpus are the same
+        """
+        r = []
+        for i in xrange(self.N):
+            n = self.rng.randint(1, 100)
+            sequences = [self.rng.randint(50, size=self.rng.randint(20)) for _ in xrange(n)]
+            sequences[0] = np.append(sequences[0], 1)
+            vocab = [unicode(k) for k in xrange(50)]
+            corpus = Corpus.write('{}/{}'.format(self.path, i), iter(sequences), vocab)
+            corpus = Corpus(corpus.path)
+            r.append(len(corpus) == n)
+            r.append(isinstance(corpus.tokens, np.memmap))
+            r.append(corpus.vocab == vocab)
+            r.append(np.array_equal(corpus.lengths, [len(s) for s in sequences]))
+            r.append(all(np.array_equal(a, b) for a, b in zip(corpus, sequences)))
+        self.assertEqual(sum(r), len(r))
+
+    def test_from_text(self):
+        lines = [u'a b c', u'', u'c a a d']
+        corpus = Corpus.from_text(self.path, lines)
+        self.assertEqual(corpus.vocab, [u'a', u'b', u'c', u'd'])
+        self.assertEqual([list(s) for s in corpus], [[0, 1, 2], [], [2, 0, 0, 3]])
+        corpus = Corpus.from_text(self.path + '/valid', [u'e b'], lambda line: line.split() + [u'</S>'],
+                                  corpus.vocab + [u'<UNK>', u'</S>'], u'<UNK>')
+        self.assertEqual(list(corpus[0]), [4, 1, 5])
+        self.assertEqual(corpus.token_to_idx[u'</S>'], 5)
+
+    def test_batcher(self):
+        """
+        check that batches from a corpus are the same as from lists
+        """
+        r = []
+        for i in xrange(self.N):
+            n, batch_size, max_len = self.rng.random_integers(1, 50, size=3)
+            sequences = [list(self.rng.randint(100, size=self.rng.randint(2 * max_len))) for _ in xrange(n)]
+            sequences.append([1])
+            corpus = Corpus.write('{}/{}'.format(self.path, i), sequences, [])
+            for a, b in zip(BucketedBatcher(sequences, batch_size, max_len, randomize=True),
+                            BucketedBatcher(corpus, batch_size, max_len, randomize=True)):
+                r.extend(np.array_equal(a_array, b_array) for a_array, b_array in zip(a, b))
+        self.assertEqual(sum(r), len(r))
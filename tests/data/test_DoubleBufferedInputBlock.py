@@ -0,0 +1,64 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import quagga
+import numpy as np
+from unittest import TestCase
+from quagga.matrix import Matrix
+from quagga.context import Context
+from quagga.connector import Connector
+from quagga.data import DoubleBufferedInputBlock
+
+
+class TestDoubleBufferedInputBlock(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+        cls.cpu_context_workers = quagga.cpu_context_workers
+
+    @classmethod
+    def tearDownClass(cls):
+        quagga.cpu_context_workers = cls.cpu_context_workers
+
+    def test_fprop(self):
+        """
+        check that outputs get batches in order with synchronous and
+        asynchronous contexts and that epochs are restarted
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for workers in [0, 2]:
+            quagga.cpu_context_workers = workers
+            batch_size, max_len = 32, 20
+            batches = []
+            for _ in xrange(7):
+                nrows, ncols = self.rng.randint(1, batch_size + 1), self.rng.randint(1, max_len + 1)
+                batches.append((self.rng.randint(100, size=(nrows, ncols)).astype(np.int32),
+                                self.rng.rand(nrows, 1).astype(np.float32)))
+            x = Connector(Matrix.empty(batch_size, max_len, 'int'))
+            y = Connector(Matrix.empty(x.nrows, 1, 'float'))
+            input_block = DoubleBufferedInputBlock(batches, [x, y])
+            consumer_context = Context()
+            input_block.blocking_contexts = [consumer_context]
+            for _ in xrange(2):
+                for x_npa, y_npa in batches:
+                    input_block.fprop()
+                    consumer_context.wait(input_block.context)
+                    r.append(x.nrows == x_npa.shape[0] and x.ncols == x_npa.shape[1])
+                    r.append(np.array_equal(x.to_host(), x_npa))
+                    r.append(np.array_equal(y.to_host(), y_npa))
+                with self.assertRaises(StopIteration):
+                    input_block.fprop()
+        self.assertEqual(sum(r), len(r))
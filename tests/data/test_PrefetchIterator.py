@@ -0,0 +1,51 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import numpy as np
+from unittest import TestCase
+from quagga.data import PrefetchIterator
+
+
+def _failing_iterable():
+    yield 0
+    raise IndexError('data are broken')
+
+
+class TestPrefetchIterator(TestCase):
+    def test_items(self):
+        """
+        check that items are prefetched in the order of the iterable
+        """
+        for use_process in [False, True]:
+            items = [np.arange(k, dtype=np.int32) for k in xrange(20)]
+            prefetched = list(PrefetchIterator(items, 3, use_process))
+            self.assertEqual(len(prefetched), len(items))
+            self.assertTrue(all(np.array_equal(a, b) for a, b in zip(prefetched, items)))
+
+    def test_error(self):
+        for use_process in [False, True]:
+            iterator = PrefetchIterator(_failing_iterable(), 2, use_process)
+            self.assertEqual(next(iterator), 0)
+            with self.assertRaises(RuntimeError):
+                next(iterator)
+            with self.assertRaises(StopIteration):
+                next(iterator)
+
+    def test_close(self):
+        for use_process in [False, True]:
+            iterator = PrefetchIterator(iter(int, 1), 2, use_process)
+            self.assertEqual(next(iterator), 0)
+            iterator.close()
+            self.assertFalse(iterator._worker.is_alive())
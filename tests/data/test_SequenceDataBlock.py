@@ -0,0 +1,81 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import quagga
+import numpy as np
+from unittest import TestCase
+from quagga.data import BucketedBatcher
+from quagga.data import SequenceDataBlock
+
+
+class TestSequenceDataBlock(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+
+    def test_fprop(self):
+        """
+        check that outputs and their shapes follow batches and that the
+        testing mode restarts after the end of an epoch
+        """
+        quagga.processor_type = 'cpu'
+        train = [list(self.rng.randint(1, 100, size=self.rng.randint(1, 20))) for _ in xrange(100)]
+        valid = [list(self.rng.randint(1, 100, size=self.rng.randint(1, 30))) for _ in xrange(10)]
+        train_batcher = BucketedBatcher(train, 16, randomize=True, infinite=True)
+        valid_batcher = BucketedBatcher(valid, 4)
+        data_block = SequenceDataBlock(train_batcher, valid_batcher)
+        train_batches = iter(BucketedBatcher(train, 16, randomize=True, infinite=True))
+        r = []
+        for _ in xrange(10):
+            data_block.fprop()
+            x, lengths, mask = next(train_batches)
+            r.append(np.array_equal(data_block.x.to_host(), x))
+            r.append(np.array_equal(data_block.lengths.to_host(), lengths))
+            r.append(len(data_block.mask) == x.shape[1])
+            r.append(all(np.array_equal(m.to_host(), mask[:, k:k + 1]) for k, m in enumerate(data_block.mask)))
+        data_block.set_testing_mode()
+        for _ in xrange(2):
+            n = 0
+            try:
+                while True:
+                    data_block.fprop()
+                    n += data_block.x.nrows.value
+            except StopIteration:
+                r.append(n == len(valid))
+        data_block.close()
+        self.assertEqual(sum(r), len(r))
+
+    def test_epochs(self):
+        """
+        check that epochs of a finite batcher are prefetched by one
+        background iterator
+        """
+        quagga.processor_type = 'cpu'
+        train = [list(self.rng.randint(1, 100, size=self.rng.randint(1, 20))) for _ in xrange(50)]
+        r = []
+        for use_process in [False, True]:
+            data_block = SequenceDataBlock(BucketedBatcher(train, 8, randomize=True), use_process=use_process)
+            iterator = data_block._train_batches.iterator
+            for _ in xrange(3):
+                n = 0
+                try:
+                    while True:
+                        data_block.fprop()
+                        n += data_block.x.nrows.value
+                except StopIteration:
+                    r.append(n == len(train))
+                r.append(data_block._train_batches.iterator is iterator)
+            data_block.close()
+        self.assertEqual(sum(r), len(r))
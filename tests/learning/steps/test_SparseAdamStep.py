@@ -0,0 +1,79 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import quagga
+import numpy as np
+from itertools import izip
+from unittest import TestCase
+from quagga.matrix import Matrix
+from quagga.context import Context
+from quagga.connector import Connector
+from quagga.blocks import RowSlicingBlock
+from quagga.learning.steps import AdamStep
+from quagga.learning.steps import SparseAdamStep
+from quagga.learning.policies import FixedValuePolicy
+
+
+class TestSparseAdamStep(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+        cls.N = 10
+
+    def setUp(self):
+        quagga.processor_type = 'cpu'
+
+    def test_notify(self):
+        """
+        compare parameters updated by SparseAdamStep and flushed with
+        parameters updated by AdamStep
+        """
+        r = []
+        for i in xrange(self.N):
+            nrows, ncols, batch_size = self.rng.random_integers(1, 20, size=3)
+            n_iterations = self.rng.random_integers(200)
+            W = self.rng.randn(nrows, ncols).astype(np.float32)
+            indices = [self.rng.randint(nrows, size=(batch_size, 1)).astype(np.int32) for _ in xrange(n_iterations)]
+            derivatives = [self.rng.randn(batch_size, ncols).astype(np.float32) for _ in xrange(n_iterations)]
+            results = []
+            for step_class in [AdamStep, SparseAdamStep]:
+                context = Context()
+                qW = Connector(Matrix.from_npa(W, device_id=0), 0)
+                qindices = Connector(Matrix.from_npa(indices[0], device_id=0))
+                block = RowSlicingBlock(qW, qindices, dense=step_class is AdamStep)
+                _, dL_doutput = block.output.register_usage(0, 0)
+                step = step_class([qW], FixedValuePolicy(0.1))
+                for x, dL_dx in izip(indices, derivatives):
+                    qindices.assign_npa(context, x)
+                    qindices.fprop()
+                    qW.fprop()
+                    block.fprop()
+                    dL_doutput.assign_npa(context, dL_dx)
+                    block.bprop()
+                    step.notify()
+                if step_class is SparseAdamStep:
+                    step.flush()
+                results.append(qW.to_host())
+            r.append(np.allclose(results[0], results[1], atol=1e-5))
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_gpu(self):
+        quagga.processor_type = 'gpu'
+        try:
+            with self.assertRaises(NotImplementedError):
+                SparseAdamStep([], FixedValuePolicy(0.1))
+        finally:
+            quagga.processor_type = 'cpu'
@@ -0,0 +1,114 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import quagga
+import numpy as np
+from unittest import TestCase
+from quagga import Model
+from quagga.matrix import Matrix
+from quagga.context import Context
+from quagga.connector import Connector
+from quagga.blocks import DotBlock
+from quagga.blocks import SoftmaxCeBlock
+from quagga.blocks import ParameterContainer
+from quagga.learning import DataParallelTrainer
+from quagga.learning.steps import MomentumStep
+from quagga.learning.policies import FixedValuePolicy
+
+
+class _DataBlock(object):
+    def __init__(self, batches):
+        self.batches = batches
+        x, true_labels = batches[0]
+        self.context = Context()
+        self.x = Connector(Matrix.from_npa(x))
+        self.true_labels = Connector(Matrix.from_npa(true_labels))
+        self.k = 0
+
+    def fprop(self):
+        x, true_labels = self.batches[self.k % len(self.batches)]
+        self.k += 1
+        self.x.assign_npa(self.context, x)
+        self.true_labels.assign_npa(self.context, true_labels)
+        self.x.fprop()
+        self.true_labels.fprop()
+
+
+class TestDataParallelTrainer(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+
+    def setUp(self):
+        quagga.processor_type = 'cpu'
+
+    def get_model_builder(self, batches, dim, n_classes, fail_worker=None):
+        W = self.rng.randn(dim, n_classes).astype(np.float32)
+        b = self.rng.randn(1, n_classes).astype(np.float32)
+
+        def build_model(worker_id, n_workers):
+            if worker_id == fail_worker:
+                raise ValueError('failed to build a model')
+            data_block = _DataBlock([DataParallelTrainer.get_shard(batch, worker_id, n_workers) for batch in batches])
+            # replicas are initialized differently, the trainer takes the
+            # parameters of the worker 0
+            scale = 1.0 + worker_id
+            p = ParameterContainer(W={'init': lambda: scale * W, 'device_id': 0},
+                                   b={'init': lambda: scale * b, 'device_id': 0})
+            dot_block = DotBlock(p['W'], p['b'], data_block.x)
+            sce_block = SoftmaxCeBlock(dot_block.output, data_block.true_labels)
+            return Model([p, data_block, dot_block, sce_block]), p.trainable_parameters
+        return build_model
+
+    def test_run(self):
+        """
+        check that data-parallel training gives the same parameters as
+        training on whole batches in one process
+        """
+        r = []
+        build_steps = lambda parameters: [MomentumStep(parameters, FixedValuePolicy(0.1), FixedValuePolicy(0.9))]
+        for n_workers in [2, 3]:
+            dim, n_classes, n_iterations = self.rng.random_integers(2, 30, size=3)
+            batches = []
+            for _ in xrange(3):
+                x = self.rng.randn(6 * n_workers, dim).astype(np.float32)
+                true_labels = self.rng.randint(n_classes, size=(6 * n_workers, 1)).astype(np.int32)
+                batches.append((x, true_labels))
+            build_model = self.get_model_builder(batches, dim, n_classes)
+
+            model, parameters = build_model(0, 1)
+            names = sorted(parameters)
+            steps = build_steps([parameters[name] for name in names])
+            for _ in xrange(n_iterations):
+                model.fprop()
+                model.bprop()
+                for step in steps:
+                    step.notify()
+            expected = [parameters[name].to_host() for name in names]
+
+            iterations = []
+            trainer = DataParallelTrainer(build_model, build_steps, n_workers)
+            trainer.run(n_iterations, iterations.append)
+            r.append(iterations == range(n_iterations))
+            for name, a in zip(names, expected):
+                r.append(np.allclose(trainer.parameters[name].to_host(), a, atol=1e-5))
+        self.assertEqual(sum(r), len(r))
+
+    def test_worker_error(self):
+        batches = [(np.zeros((4, 3), np.float32), np.zeros((4, 1), np.int32))]
+        build_model = self.get_model_builder(batches, 3, 2, fail_worker=1)
+        trainer = DataParallelTrainer(build_model, lambda parameters: [], 2)
+        with self.assertRaises(RuntimeError):
+            trainer.run(1)
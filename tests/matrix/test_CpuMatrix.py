@@ -0,0 +1,265 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import quagga
+import numpy as np
+from itertools import izip
+from unittest import TestCase
+from quagga.matrix import Matrix
+from quagga.context import Context
+from quagga.matrix import CpuMatrix
+from quagga.matrix import RowSparseMatrix
+from quagga.utils import List
+from quagga.utils import ContiguousList
+from quagga.utils import AllocationCounter
+from quagga.blocks import DotBlock
+from quagga.blocks import LstmBlock
+from quagga.connector import Connector
+from quagga.blocks import SoftmaxCeBlock
+
+
+class TestCpuMatrix(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+        cls.N = 10
+
+    def test_steady_state_allocations(self):
+        """
+        check that fprop and bprop of LstmBlock, DotBlock and SoftmaxCeBlock
+        do not allocate matrix-sized arrays once they are warmed up
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for i in xrange(self.N):
+            batch_size, x_dim, hidden_dim, n_classes = self.rng.random_integers(16, 256, size=4)
+            x = Connector(Matrix.from_npa(self.rng.randn(batch_size, x_dim).astype(np.float32)), 0)
+            mask = Connector(Matrix.from_npa((self.rng.rand(batch_size, 1) < 0.8).astype(np.float32)))
+            prev_c = Connector(Matrix.from_npa(self.rng.randn(batch_size, hidden_dim).astype(np.float32)), 0)
+            prev_h = Connector(Matrix.from_npa(self.rng.randn(batch_size, hidden_dim).astype(np.float32)), 0)
+            W = Connector(Matrix.from_npa((self.rng.randn(x_dim, 4 * hidden_dim) / np.sqrt(x_dim)).astype(np.float32)), 0)
+            R = Connector(Matrix.from_npa((self.rng.randn(hidden_dim, 4 * hidden_dim) / np.sqrt(hidden_dim)).astype(np.float32)), 0)
+            b = Connector(Matrix.from_npa(self.rng.randn(1, 4 * hidden_dim).astype(np.float32)), 0)
+            Wo = Connector(Matrix.from_npa((self.rng.randn(hidden_dim, n_classes) / np.sqrt(hidden_dim)).astype(np.float32)), 0)
+            bo = Connector(Matrix.from_npa(self.rng.randn(1, n_classes).astype(np.float32)), 0)
+            true_labels = Connector(Matrix.from_npa(self.rng.randint(n_classes, size=(batch_size, 1)).astype(np.int32)))
+            lstm = LstmBlock(W, R, b, 5.0, x, mask, prev_c, prev_h)
+            dot = DotBlock(Wo, bo, lstm.h)
+            sce = SoftmaxCeBlock(dot.output, true_labels, mask)
+            connectors = [x, mask, prev_c, prev_h, W, R, b, Wo, bo, true_labels]
+            blocks = [lstm, dot, sce]
+
+            def step():
+                for connector in connectors:
+                    connector.fprop()
+                for block in blocks:
+                    block.fprop()
+                for block in reversed(blocks):
+                    block.bprop()
+                for connector in connectors:
+                    if connector.bpropagable:
+                        connector.backward_matrix
+            for _ in xrange(2):
+                step()
+            with AllocationCounter() as counter:
+                step()
+            smallest_matrix_nbytes = 4 * batch_size * min(x_dim, hidden_dim, n_classes)
+            r.append(all(size < smallest_matrix_nbytes for size in counter.sizes))
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_sparse_updates(self):
+        """
+        check that lazy sparse optimizer updates followed by a flush give
+        the same state as dense updates with zero derivatives of the rows
+        that were not touched
+        """
+        r = []
+        for i in xrange(self.N):
+            nrows, ncols, batch_size, n_iterations = self.rng.random_integers(1, 20, size=4)
+            axis = i % 2
+            W = self.rng.randn(nrows, ncols).astype(np.float32)
+            W_dense = {'momentum': W.copy(), 'rmsprop': W.copy(), 'adam': W.copy()}
+            state = dict((name, np.zeros_like(W)) for name in ['velocity', 'grad_sqr', 'm', 'v'])
+            W_sparse = dict((name, CpuMatrix.from_npa(W)) for name in W_dense)
+            sparse_state = dict((name, CpuMatrix.from_npa(np.zeros_like(W))) for name in state)
+            last_updates = dict((name, np.zeros(W.shape[axis], np.int64)) for name in W_dense)
+            learning_rates = -0.1 / np.sqrt(np.arange(1, n_iterations + 2))
+            context = Context()
+            for iteration in xrange(1, n_iterations + 1):
+                ids = self.rng.randint(W.shape[axis], size=batch_size).astype(np.int32)
+                values = self.rng.randn(batch_size, W.shape[1 - axis]).astype(np.float32)
+                dL_dW = np.zeros_like(W)
+                np.add.at(dL_dW.T if axis else dL_dW, ids, values)
+                sparse = RowSparseMatrix()
+                if axis:
+                    sparse.add_columns_slice(context, CpuMatrix.from_npa(ids[np.newaxis]), CpuMatrix.from_npa(values.T))
+                else:
+                    sparse.add_rows_slice(context, CpuMatrix.from_npa(ids[:, np.newaxis]), CpuMatrix.from_npa(values))
+
+                state['velocity'] = 0.9 * state['velocity'] - 0.1 * dL_dW
+                W_dense['momentum'] += state['velocity']
+                state['grad_sqr'] = 0.9 * state['grad_sqr'] + 0.1 * dL_dW ** 2
+                W_dense['rmsprop'] -= 0.1 * dL_dW / np.sqrt(state['grad_sqr'] + 1e-6)
+                state['m'] = 0.9 * state['m'] + 0.1 * dL_dW
+                state['v'] = 0.999 * state['v'] + 0.001 * dL_dW ** 2
+                W_dense['adam'] += learning_rates[iteration] * state['m'] / np.sqrt(state['v'] + 1e-8)
+
+                W_sparse['momentum'].sparse_momentum_update(context, -0.1, 0.9, sparse_state['velocity'], sparse, last_updates['momentum'], iteration, axis)
+                W_sparse['rmsprop'].sparse_rmsprop_update(context, -0.1, 0.9, 1e-6, sparse_state['grad_sqr'], sparse, last_updates['rmsprop'], iteration, axis)
+                W_sparse['adam'].sparse_adam_update(context, learning_rates, 0.9, 0.999, 1e-8, sparse_state['m'], sparse_state['v'], sparse, last_updates['adam'], iteration, axis)
+            W_sparse['momentum'].sparse_momentum_update(context, 0.0, 0.9, sparse_state['velocity'], None, last_updates['momentum'], n_iterations, axis)
+            W_sparse['rmsprop'].sparse_rmsprop_update(context, 0.0, 0.9, 1e-6, sparse_state['grad_sqr'], None, last_updates['rmsprop'], n_iterations, axis)
+            W_sparse['adam'].sparse_adam_update(context, learning_rates, 0.9, 0.999, 1e-8, sparse_state['m'], sparse_state['v'], None, last_updates['adam'], n_iterations, axis)
+
+            r.append(np.allclose(W_sparse['momentum'].to_host(), W_dense['momentum'], atol=1e-5))
+            r.append(np.allclose(W_sparse['rmsprop'].to_host(), W_dense['rmsprop'], atol=1e-5))
+            r.append(np.allclose(W_sparse['adam'].to_host(), W_dense['adam'], atol=1e-5))
+            for name in state:
+                r.append(np.allclose(sparse_state[name].to_host(), state[name], atol=1e-5))
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_attention(self):
+        """
+        compare batched attention operations with per timestep numpy
+        computations for separate matrices and for column blocks of one
+        matrix
+        """
+        quagga.processor_type = 'cpu'
+        context = Context()
+        r = []
+        for i in xrange(self.N):
+            batch_size, dim, n = self.rng.random_integers(1, 50, size=3)
+            h = [self.rng.randn(batch_size, dim).astype(np.float32) for _ in xrange(n)]
+            u = self.rng.randn(dim, 1).astype(np.float32)
+            a = self.rng.rand(batch_size, n).astype(np.float32)
+            a /= a.sum(axis=1, keepdims=True)
+            derivative = self.rng.randn(batch_size, dim).astype(np.float32)
+
+            g = np.hstack([np.sum(h_i * derivative, axis=1, keepdims=True) for h_i in h])
+            true_dL_dpre_a = a * (g - np.sum(a * g, axis=1, keepdims=True))
+            true_dL_du = sum(np.dot(h_i.T, true_dL_dpre_a[:, [k]]) for k, h_i in enumerate(h))
+            true_dL_dh = [a[:, [k]] * derivative + np.dot(true_dL_dpre_a[:, [k]], u.T) for k in xrange(n)]
+
+            for blocks in [False, True]:
+                if blocks:
+                    matrix = CpuMatrix.from_npa(np.hstack(h))
+                    matrices = [matrix[:, k * dim:(k + 1) * dim] for k in xrange(n)]
+                    dL_dmatrix = CpuMatrix.from_npa(np.zeros((batch_size, n * dim), np.float32))
+                    dL_dmatrices = [dL_dmatrix[:, k * dim:(k + 1) * dim] for k in xrange(n)]
+                else:
+                    matrices = [CpuMatrix.from_npa(h_i) for h_i in h]
+                    dL_dmatrices = [CpuMatrix.from_npa(np.zeros_like(h_i)) for h_i in h]
+                scores = CpuMatrix.empty(batch_size, n)
+                scores.assign_sequential_dot(context, matrices, CpuMatrix.from_npa(u))
+                output = CpuMatrix.empty(batch_size, dim)
+                output.assign_sequential_weighted_sum(context, CpuMatrix.from_npa(a), matrices)
+                dL_dpre_a = CpuMatrix.empty(batch_size, n)
+                dL_dpre_a.assign_dL_dpre_a(context, CpuMatrix.from_npa(derivative), CpuMatrix.from_npa(a), matrices)
+                dL_du = CpuMatrix.from_npa(np.zeros_like(u))
+                dL_du.add_attention_derivative(context, dL_dpre_a, matrices)
+                CpuMatrix.add_attention_tile(context, CpuMatrix.from_npa(derivative), CpuMatrix.from_npa(a),
+                                             dL_dpre_a, CpuMatrix.from_npa(u), dL_dmatrices)
+
+                r.append(np.allclose(scores.to_host(), np.hstack([np.dot(h_i, u) for h_i in h]), atol=1e-4))
+                r.append(np.allclose(output.to_host(), sum(a[:, [k]] * h_i for k, h_i in enumerate(h)), atol=1e-4))
+                r.append(np.allclose(dL_dpre_a.to_host(), true_dL_dpre_a, atol=1e-4))
+                r.append(np.allclose(dL_du.to_host(), true_dL_du, atol=1e-4))
+                for dL_dh, true_dL_dh_i in izip(dL_dmatrices, true_dL_dh):
+                    r.append(np.allclose(dL_dh.to_host(), true_dL_dh_i, atol=1e-4))
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_contiguous_sequence(self):
+        """
+        compare sequence operations on elements of a ContiguousList, which
+        take the whole buffer at once, with the same operations on separate
+        matrices
+        """
+        quagga.processor_type = 'cpu'
+        context = Context()
+        r = []
+        for i in xrange(self.N):
+            batch_size, x_dim, y_dim, max_length, vocab_size = self.rng.random_integers(1, 20, size=5)
+            length = self.rng.randint(1, max_length + 1)
+            x = [self.rng.randn(batch_size, x_dim).astype(np.float32) for _ in xrange(length)]
+            y = [self.rng.randn(batch_size, y_dim).astype(np.float32) for _ in xrange(length)]
+            a = self.rng.randn(batch_size, x_dim).astype(np.float32)
+            W = self.rng.randn(vocab_size, x_dim).astype(np.float32)
+            indices = self.rng.randint(vocab_size, size=(batch_size, length)).astype(np.int32)
+
+            results = []
+            for contiguous in [False, True]:
+                if contiguous:
+                    sequence = lambda ncols: ContiguousList(max_length, batch_size, ncols, length=length)
+                else:
+                    sequence = lambda ncols: List([CpuMatrix.empty(batch_size, ncols) for _ in xrange(max_length)], length)
+                x_sequence, y_sequence, xy_sequence = sequence(x_dim), sequence(y_dim), sequence(x_dim + y_dim)
+                for m, x_i, y_i in izip(xy_sequence, x, y):
+                    m.assign_npa(context, np.hstack((x_i, y_i)))
+                CpuMatrix.batch_hsplit(context, xy_sequence, x_sequence, y_sequence)
+                CpuMatrix.batch_hstack(context, y_sequence, x_sequence, xy_sequence)
+                result = {'hsplit': [m.to_host() for m in list(x_sequence) + list(y_sequence)],
+                          'hstack': [m.to_host() for m in xy_sequence]}
+                output = CpuMatrix.empty(batch_size, x_dim)
+                output.assign_sequential_sum_pooling(context, x_sequence)
+                result['sum'] = output.to_host()
+                output.assign_sequential_mean_pooling(context, x_sequence[:-1] or x_sequence)
+                result['mean'] = output.to_host()
+                CpuMatrix.sequentially_tile(context, CpuMatrix.from_npa(a), x_sequence)
+                result['tile'] = [m.to_host() for m in x_sequence]
+                W_matrix = CpuMatrix.from_npa(W)
+                W_matrix.slice_rows_batch(context, CpuMatrix.from_npa(indices), x_sequence)
+                result['slice'] = [m.to_host() for m in x_sequence]
+                W_matrix.add_scaled_rows_batch_slice(context, CpuMatrix.from_npa(indices), 0.5, x_sequence)
+                result['scatter'] = W_matrix.to_host()
+                results.append(result)
+            loop, contiguous = results
+
+            r.append(all(np.allclose(m, np.hstack((y_i, x_i))) for m, x_i, y_i in izip(loop['hstack'], x, y)))
+            r.append(all(np.allclose(m, x_i) for m, x_i in izip(loop['hsplit'], x + y)))
+            r.append(np.allclose(loop['sum'], sum(x), atol=1e-5))
+            r.append(np.allclose(loop['mean'], np.mean(x[:-1] or x, axis=0), atol=1e-5))
+            r.append(all(np.allclose(m, W[indices[:, k]]) for k, m in enumerate(loop['slice'])))
+            for key in loop:
+                r.append(all(np.allclose(m, c, atol=1e-5) for m, c in izip(loop[key], contiguous[key])))
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_slice_out_of_bounds(self):
+        """
+        Slicing with indices outside of the matrix raises instead of
+        clamping them to the border rows and columns.
+        """
+        quagga.processor_type = 'cpu'
+        context = Context()
+        W = CpuMatrix.from_npa(self.rng.rand(7, 5).astype(np.float32))
+        r = []
+        for indices in [[0, 7], [-1, 2]]:
+            row_indxs = CpuMatrix.from_npa(np.array([indices], dtype=np.int32))
+            batch_indxs = CpuMatrix.from_npa(np.array([indices], dtype=np.int32).T)
+            column_indxs = CpuMatrix.from_npa(np.array([indices], dtype=np.int32) - 2)
+            operations = [lambda: W.slice_rows(context, row_indxs, CpuMatrix.empty(2, 5)),
+                          lambda: W.slice_rows_batch(context, batch_indxs, List([CpuMatrix.empty(2, 5)])),
+                          lambda: W.slice_columns(context, column_indxs, CpuMatrix.empty(7, 2)),
+                          lambda: W.slice_columns_and_transpose(context, column_indxs, CpuMatrix.empty(2, 7))]
+            for operation in operations:
+                try:
+                    operation()
+                    r.append(False)
+                except IndexError:
+                    r.append(True)
+        self.assertEqual(sum(r), len(r))
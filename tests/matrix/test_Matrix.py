@@ -22,7 +22,6 @@ from quagga.matrix import GpuMatrix
 from quagga.matrix import CpuMatrix
 from quagga.context import GpuContext
 from quagga.context import CpuContext
-from quagga.matrix import SparseMatrix
 
 
 class TestMatrix(TestCase):
@@ -338,6 +337,28 @@ class TestMatrix(TestCase):
 
         self.assertEqual(sum(r), self.N)
 
+    def test_add_scaled_rows_batch_slice_duplicates(self):
+        r = []
+        for _ in xrange(self.N):
+            a = TestMatrix.get_random_array(high=100)
+            K = self.rng.random_integers(20)
+            nrows = self.rng.random_integers(500)
+            # few distinct indices so that most of them are repeated
+            indxs = self.rng.randint(min(5, a.shape[0]), size=(nrows, K)).astype(np.int32)
+            m = [TestMatrix.get_random_array((nrows, a.shape[1])) for _ in xrange(K)]
+            alpha = 2 * self.rng.rand() - 1
+
+            expected = a.copy()
+            for k in xrange(K):
+                np.add.at(expected, indxs[:, k], alpha * m[k])
+
+            a_cpu = CpuMatrix.from_npa(a)
+            a_cpu.add_scaled_rows_batch_slice(self.cpu_context, CpuMatrix.from_npa(indxs), alpha,
+                                              [CpuMatrix.from_npa(e) for e in m])
+            r.append(np.allclose(a_cpu.to_host(), expected, atol=1e-3))
+
+        self.assertEqual(sum(r), self.N)
+
     def test_assign_hstack(self):
         r = []
         for _ in xrange(self.N):
@@ -584,6 +605,28 @@ class TestMatrix(TestCase):
 
         self.assertEqual(sum(r), self.N)
 
+    def test_assign_sequential_dot(self):
+        r = []
+        for _ in xrange(self.N):
+            a = [self.get_random_array(high=1000)]
+            for _ in xrange(self.rng.random_integers(100) - 1):
+                a.append(self.get_random_array(a[-1].shape))
+            u = self.get_random_array((a[0].shape[1], 1))
+
+            a_cpu = [CpuMatrix.from_npa(each) for each in a]
+            u_cpu = CpuMatrix.from_npa(u)
+            out_cpu = CpuMatrix.empty(a[0].shape[0], len(a))
+            a_gpu = [GpuMatrix.from_npa(each) for each in a]
+            u_gpu = GpuMatrix.from_npa(u)
+            out_gpu = GpuMatrix.empty(a[0].shape[0], len(a))
+
+            out_cpu.assign_sequential_dot(self.cpu_context, a_cpu, u_cpu)
+            out_gpu.assign_sequential_dot(self.gpu_context, a_gpu, u_gpu)
+
+            r.append(np.allclose(out_cpu.to_host(), out_gpu.to_host(), atol=1e-4))
+
+        self.assertEqual(sum(r), self.N)
+
     def test_sequentially_tile(self):
         r = []
         for _ in xrange(self.N):
@@ -905,6 +948,86 @@ class TestMatrix(TestCase):
 
         self.assertEqual(sum(r), len(r))
 
+    def test_lstm_fprop(self):
+        r = []
+        for _ in xrange(self.N):
+            batch_size, input_dim, dim = self.rng.random_integers(300, size=3)
+            x = self.get_random_array((batch_size, input_dim))
+            W = self.get_random_array((input_dim, 4 * dim))
+            prev_h = self.get_random_array((batch_size, dim))
+            R = self.get_random_array((dim, 4 * dim))
+            b = self.get_random_array((1, 4 * dim))
+            prev_c = self.get_random_array((batch_size, dim))
+            mask = (self.rng.rand(batch_size, 1) < 0.8).astype(np.float32)
+            with_x, with_mask = self.rng.randint(2, size=2)
+
+            matrices = {}
+            for processor_type, Matrix, context in [('cpu', CpuMatrix, self.cpu_context),
+                                                    ('gpu', GpuMatrix, self.gpu_context)]:
+                args = [Matrix.from_npa(x) if with_x else None,
+                        Matrix.from_npa(W) if with_x else None,
+                        Matrix.from_npa(prev_h),
+                        Matrix.from_npa(R),
+                        Matrix.from_npa(b),
+                        Matrix.from_npa(prev_c),
+                        Matrix.from_npa(mask) if with_mask else None]
+                outputs = [Matrix.empty(batch_size, 4 * dim),
+                           Matrix.empty(batch_size, dim),
+                           Matrix.empty(batch_size, dim),
+                           Matrix.empty(batch_size, dim),
+                           Matrix.empty(batch_size, 4 * dim),
+                           Matrix.empty(batch_size, dim)]
+                Matrix.lstm_fprop(context, *(args + outputs))
+                matrices[processor_type] = [m.to_host() for m in outputs]
+
+            for m_cpu, m_gpu in izip(matrices['cpu'], matrices['gpu']):
+                r.append(np.allclose(m_cpu, m_gpu, atol=1e-3))
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_lstm_bprop(self):
+        r = []
+        for _ in xrange(self.N):
+            batch_size, dim = self.rng.random_integers(300, size=2)
+            zifo = self.rng.rand(batch_size, 4 * dim).astype(np.float32)
+            dzifo_dpre_zifo = self.rng.rand(batch_size, 4 * dim).astype(np.float32)
+            tanh_c = self.get_random_array((batch_size, dim))
+            dtanh_c_dc = self.rng.rand(batch_size, dim).astype(np.float32)
+            prev_c = self.get_random_array((batch_size, dim))
+            dL_dc = self.get_random_array((batch_size, dim))
+            dL_dh = self.get_random_array((batch_size, dim))
+            mask = (self.rng.rand(batch_size, 1) < 0.8).astype(np.float32)
+            dL_dprev_c = self.get_random_array((batch_size, dim))
+            dL_dprev_h = self.get_random_array((batch_size, dim))
+            with_mask, with_dL_dprev_c, with_dL_dprev_h, with_clipping = self.rng.randint(2, size=4)
+
+            matrices = {}
+            for processor_type, Matrix, context in [('cpu', CpuMatrix, self.cpu_context),
+                                                    ('gpu', GpuMatrix, self.gpu_context)]:
+                outputs = [Matrix.from_npa(dzifo_dpre_zifo),
+                           Matrix.from_npa(dL_dc),
+                           Matrix.from_npa(dL_dh),
+                           Matrix.from_npa(dL_dprev_c) if with_dL_dprev_c else None,
+                           Matrix.from_npa(dL_dprev_h) if with_dL_dprev_h else None]
+                Matrix.lstm_bprop(context,
+                                  Matrix.from_npa(zifo),
+                                  outputs[0],
+                                  Matrix.from_npa(tanh_c),
+                                  Matrix.from_npa(dtanh_c_dc),
+                                  Matrix.from_npa(prev_c),
+                                  outputs[1],
+                                  outputs[2],
+                                  Matrix.from_npa(mask) if with_mask else None,
+                                  outputs[3],
+                                  outputs[4],
+                                  0.5 if with_clipping else None)
+                matrices[processor_type] = [m.to_host() for m in outputs if m is not None]
+
+            for m_cpu, m_gpu in izip(matrices['cpu'], matrices['gpu']):
+                r.append(np.allclose(m_cpu, m_gpu, atol=1e-3))
+
+        self.assertEqual(sum(r), len(r))
+
     def test_relu(self):
         r = []
         for _ in xrange(self.N):
@@ -1126,64 +1249,6 @@ class TestMatrix(TestCase):
 
         self.assertEqual(sum(r), len(r))
 
-    def test_add_scaled_sparse_matrix(self):
-        r = []
-        device_id = 0
-        for _ in xrange(self.N):
-            a = self.get_random_array()
-            column_indxs = []
-            column_dense_matrix = []
-            for i in xrange(2):
-                k = self.rng.random_integers(a.shape[1])
-                column_indxs.append(self.rng.choice(a.shape[1], k).astype(np.int32))
-                column_indxs[-1] = column_indxs[-1].reshape((1, k))
-                column_dense_matrix.append(self.get_random_array((a.shape[0], k)))
-            row_indxs = []
-            row_dense_matrix = []
-            for i in xrange(2):
-                k = self.rng.random_integers(a.shape[0])
-                row_indxs.append(self.rng.choice(a.shape[0], k).astype(np.int32))
-                row_indxs[-1] = row_indxs[-1].reshape((k, 1))
-                row_dense_matrix.append(self.get_random_array((k, a.shape[1])))
-            batch_rows_indxs = []
-            dense_matrices = []
-            for i in xrange(2):
-                k = self.rng.random_integers(a.shape[0])
-                m = self.rng.random_integers(20)
-                batch_rows_indxs.append(self.rng.choice(a.shape[0], (k, m)).astype(np.int32))
-                dense_matrices.append([])
-                for i in xrange(m):
-                    dense_matrices[-1].append(self.get_random_array((k, a.shape[1])))
-            alpha = ct.c_float(2 * self.rng.rand() - 1)
-
-            a_gpu = GpuMatrix.from_npa(a)
-            quagga.processor_type = 'gpu'
-            sparse_m_gpu = SparseMatrix()
-            for i in xrange(2):
-                sparse_m_gpu.add_columns_slice(GpuMatrix.from_npa(column_indxs[i]),
-                                               GpuMatrix.from_npa(column_dense_matrix[i]))
-                sparse_m_gpu.add_rows_slice(GpuMatrix.from_npa(row_indxs[i]),
-                                            GpuMatrix.from_npa(row_dense_matrix[i]))
-                sparse_m_gpu.add_rows_batch_slice(GpuMatrix.from_npa(batch_rows_indxs[i]),
-                                                  [GpuMatrix.from_npa(e) for e in dense_matrices[i]])
-
-            a_cpu = CpuMatrix.from_npa(a)
-            quagga.processor_type = 'cpu'
-            sparse_m_cpu = SparseMatrix()
-            for i in xrange(2):
-                sparse_m_cpu.add_columns_slice(CpuMatrix.from_npa(column_indxs[i]),
-                                               CpuMatrix.from_npa(column_dense_matrix[i]))
-                sparse_m_cpu.add_rows_slice(CpuMatrix.from_npa(row_indxs[i]),
-                                            CpuMatrix.from_npa(row_dense_matrix[i]))
-                sparse_m_cpu.add_rows_batch_slice(CpuMatrix.from_npa(batch_rows_indxs[i]),
-                                                  [CpuMatrix.from_npa(e) for e in dense_matrices[i]])
-
-            a_cpu.add_scaled(self.cpu_context, alpha, sparse_m_cpu)
-            a_gpu.add_scaled(self.gpu_context, alpha, sparse_m_gpu)
-            r.append(np.allclose(a_cpu.to_host(), a_gpu.to_host(), atol=1e-5))
-
-        self.assertEqual(sum(r), len(r))
-
     def test_assign_sum(self):
         r = []
         for _ in xrange(self.N):
@@ -0,0 +1,165 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import quagga
+import numpy as np
+from itertools import izip
+from unittest import TestCase
+from quagga import Model
+from quagga.utils import List
+from quagga.matrix import Matrix
+from quagga.context import Context
+from quagga.blocks import DotBlock
+from quagga.blocks import LstmBlock
+from quagga.connector import Connector
+from quagga.blocks import SoftmaxCeBlock
+from quagga.blocks import SequencerBlock
+from quagga.blocks import RowSlicingBlock
+from quagga.blocks import ParameterContainer
+
+
+class _DataBlock(object):
+    def __init__(self, connectors):
+        self.connectors = connectors
+
+    def fprop(self):
+        for connector in self.connectors:
+            connector.fprop()
+
+
+class TestMemoryPlanner(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+        cls.N = 5
+
+    def build_model(self, seed, max_len, batch_size, vocab_size, embd_dim, hidden_dim):
+        rng = np.random.RandomState(seed)
+        init = lambda *shape: lambda: (0.3 * rng.randn(*shape)).astype(np.float32)
+        p = ParameterContainer(embd_W={'init': init(vocab_size, embd_dim), 'device_id': 0},
+                               W={'init': init(embd_dim, 4 * hidden_dim), 'device_id': 0},
+                               R={'init': init(hidden_dim, 4 * hidden_dim), 'device_id': 0},
+                               b={'init': init(1, 4 * hidden_dim), 'device_id': 0},
+                               c0={'init': init(batch_size, hidden_dim), 'device_id': 0},
+                               h0={'init': init(batch_size, hidden_dim), 'device_id': 0},
+                               Wo={'init': init(hidden_dim, vocab_size), 'device_id': 0},
+                               bo={'init': init(1, vocab_size), 'device_id': 0})
+        x = Connector(Matrix.from_npa(rng.randint(vocab_size, size=(batch_size, max_len)).astype(np.int32)))
+        y = List([Connector(Matrix.from_npa(rng.randint(vocab_size, size=(batch_size, 1)).astype(np.int32)))
+                  for _ in xrange(max_len)])
+        mask = List([Connector(Matrix.from_npa((rng.rand(batch_size, 1) < 0.8).astype(np.float32)))
+                     for _ in xrange(max_len)])
+        embd = RowSlicingBlock(p['embd_W'], x)
+        lstm = SequencerBlock(block_class=LstmBlock,
+                              params=[p['W'], p['R'], p['b'], 5.0],
+                              sequences=[embd.output, mask],
+                              output_names=['h'],
+                              prev_names=['c', 'h'],
+                              paddings=[p['c0'], p['h0']])
+        dot = SequencerBlock(block_class=DotBlock,
+                             params=[p['Wo'], p['bo']],
+                             sequences=[lstm.h],
+                             output_names=['output'])
+        sce = SequencerBlock(block_class=SoftmaxCeBlock,
+                             params=[],
+                             sequences=[dot.output, y, mask])
+        model = Model([p, _DataBlock([x] + list(y) + list(mask)), embd, lstm, dot, sce])
+        return model, p, x
+
+    def test_overwriting_operations(self):
+        """
+        check that operations which outputs are placed into the
+        uninitialized arena do not read the previous values
+        """
+        quagga.processor_type = 'cpu'
+        # does not consume `self.rng`, so the other tests see the same sizes
+        rng = np.random.RandomState(seed=24)
+        r = []
+        for i in xrange(self.N):
+            nrows, k, ncols = rng.random_integers(1, 64, size=3)
+            a = Matrix.from_npa(rng.randn(nrows, k).astype(np.float32))
+            context = Context()
+            b = Matrix.from_npa(rng.randn(k, ncols).astype(np.float32))
+            probs = Matrix.from_npa(rng.rand(nrows, k).astype(np.float32))
+            out = Matrix.from_npa(np.empty((nrows, ncols), np.float32))
+            out.sync_fill(np.nan)
+            out.assign_dot(context, a, b)
+            r.append(np.allclose(out.to_host(), np.dot(a.to_host(), b.to_host()), atol=1e-5))
+            out = Matrix.from_npa(np.empty((nrows, k), np.float32))
+            out.sync_fill(np.nan)
+            out.assign_softmax_derivative(context, probs, a)
+            r.append(np.all(np.isfinite(out.to_host())))
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_planned_model(self):
+        """
+        compare gradients of a model with and without memory planning
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for i in xrange(self.N):
+            seed = self.rng.randint(1000)
+            max_len = self.rng.random_integers(2, 30)
+            sequence_lens = [max_len, self.rng.random_integers(max_len), max_len]
+            args = self.rng.random_integers(2, 64, size=4)
+            results = []
+            for plan in [False, True]:
+                model, p, x = self.build_model(seed, max_len, *args)
+                if plan:
+                    nbytes_before, nbytes_after = model.plan_memory()
+                    r.append(nbytes_after < nbytes_before)
+                gradients = []
+                for sequence_len in sequence_lens:
+                    x.ncols = sequence_len
+                    model.fprop()
+                    model.bprop()
+                    gradients.extend(e.backward_matrix.to_host() for _, e in sorted(p.trainable_parameters.iteritems()))
+                results.append(gradients)
+            for unplanned, planned in izip(*results):
+                r.append(np.allclose(unplanned, planned))
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_plan_memory_step(self):
+        """
+        check that planning calls the step once and does not change
+        gradients computed by it
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for i in xrange(self.N):
+            seed = self.rng.randint(1000)
+            max_len = self.rng.random_integers(2, 30)
+            args = self.rng.random_integers(2, 64, size=4)
+            results = []
+            for plan in [False, True]:
+                model, p, x = self.build_model(seed, max_len, *args)
+                calls = []
+                def step():
+                    calls.append(None)
+                    model.fprop()
+                    model.bprop()
+                if plan:
+                    nbytes_before, nbytes_after = model.plan_memory(step)
+                    r.append(nbytes_after <= nbytes_before)
+                else:
+                    step()
+                r.append(len(calls) == 1)
+                results.append([e.backward_matrix.to_host() for _, e in sorted(p.trainable_parameters.iteritems())])
+            for unplanned, planned in izip(*results):
+                r.append(np.allclose(unplanned, planned))
+
+        self.assertEqual(sum(r), len(r))
@@ -0,0 +1,137 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import quagga
+import numpy as np
+from itertools import izip
+from unittest import TestCase
+from quagga.context import Context
+from quagga.matrix import Matrix
+from quagga.matrix import RowSparseMatrix
+from quagga.connector import Connector
+from quagga.blocks import ColSlicingBlock
+from quagga.blocks import RowSlicingBlock
+
+
+class TestRowSparseMatrix(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+        cls.N = 20
+
+    def setUp(self):
+        quagga.processor_type = 'cpu'
+
+    def test_add_slices(self):
+        """
+        check that coalesced slices have unique ids and sum up to the
+        same dense matrix
+        """
+        r = []
+        for _ in xrange(self.N):
+            nrows, ncols, batch_size = self.rng.random_integers(1, 40, size=3)
+            context = Context()
+            for axis in [0, 1]:
+                a = np.zeros((nrows, ncols), np.float32)
+                sparse = RowSparseMatrix()
+                for _ in xrange(self.rng.randint(1, 5)):
+                    if axis:
+                        indxs = self.rng.randint(ncols, size=(1, batch_size)).astype(np.int32)
+                        values = self.rng.randn(nrows, batch_size).astype(np.float32)
+                        sparse.add_columns_slice(context, Matrix.from_npa(indxs), Matrix.from_npa(values))
+                        np.add.at(a.T, indxs[0], values.T)
+                    elif self.rng.randint(2):
+                        indxs = self.rng.randint(nrows, size=(batch_size, 1)).astype(np.int32)
+                        values = self.rng.randn(batch_size, ncols).astype(np.float32)
+                        sparse.add_rows_slice(context, Matrix.from_npa(indxs), Matrix.from_npa(values))
+                        np.add.at(a, indxs[:, 0], values)
+                    else:
+                        k = self.rng.randint(1, 4)
+                        indxs = self.rng.randint(nrows, size=(batch_size, k + 1)).astype(np.int32)
+                        values = [self.rng.randn(batch_size, ncols).astype(np.float32) for _ in xrange(k)]
+                        sparse.add_rows_batch_slice(context, Matrix.from_npa(indxs), [Matrix.from_npa(v) for v in values])
+                        for i in xrange(k):
+                            np.add.at(a, indxs[:, i], values[i])
+                r.append(len(np.unique(sparse.ids)) == len(sparse.ids))
+                dense = Matrix.from_npa(np.zeros((nrows, ncols), np.float32))
+                dense.add_scaled(context, 0.5, sparse)
+                r.append(np.allclose(dense.to_host(), 0.5 * a, atol=1e-5))
+                r.append(np.allclose(sparse.get_norm(), np.linalg.norm(a), atol=1e-4))
+        self.assertEqual(sum(r), len(r))
+
+    def test_add_scale_clear(self):
+        context = Context()
+        a = RowSparseMatrix()
+        a.add_rows_slice(context, Matrix.from_npa(np.array([[3], [1], [3]], np.int32)), Matrix.from_npa(np.ones((3, 2), np.float32)))
+        b = RowSparseMatrix()
+        b.add_rows_slice(context, Matrix.from_npa(np.array([[0], [1]], np.int32)), Matrix.from_npa(np.ones((2, 2), np.float32)))
+        a.add(context, b)
+        a.scale(context, 2.0)
+        self.assertEqual(dict(zip(a.ids, a.values[:, 0])), {3: 4.0, 1: 4.0, 0: 2.0})
+        a.clear(context)
+        self.assertEqual(len(a.ids), 0)
+        a.add(context, b)
+        self.assertEqual(dict(zip(a.ids, a.values[:, 1])), {0: 1.0, 1: 1.0})
+        with self.assertRaises(ValueError):
+            a.add_columns_slice(context, Matrix.from_npa(np.array([[0]], np.int32)), Matrix.from_npa(np.ones((2, 1), np.float32)))
+
+    def test_slicing_blocks(self):
+        """
+        check that parameters updated with derivatives of slicing blocks
+        accumulated in a ``RowSparseMatrix`` are the same as with dense
+        derivatives
+        """
+        r = []
+        for workers in [0, 2]:
+            quagga.cpu_context_workers = workers
+            try:
+                for _ in xrange(self.N // 4):
+                    nrows, ncols, batch_size = self.rng.random_integers(1, 40, size=3)
+                    W = self.rng.randn(nrows, ncols).astype(np.float32)
+                    row_indxs = self.rng.randint(nrows, size=(batch_size, 3)).astype(np.int32)
+                    col_indxs = self.rng.randint(ncols, size=(1, batch_size)).astype(np.int32)
+                    dL_drows = [self.rng.randn(batch_size, ncols).astype(np.float32) for _ in xrange(3)]
+                    dL_dcols = self.rng.randn(nrows, batch_size).astype(np.float32)
+                    expected_rows = W.copy()
+                    for k in xrange(3):
+                        np.add.at(expected_rows, row_indxs[:, k], dL_drows[k])
+                    expected_cols = W.copy()
+                    np.add.at(expected_cols.T, col_indxs[0], dL_dcols.T)
+
+                    for dense in [True, False]:
+                        qW = Connector(Matrix.from_npa(W, device_id=0), 0)
+                        qV = Connector(Matrix.from_npa(W, device_id=0), 0)
+                        qrow_indxs = Connector(Matrix.from_npa(row_indxs))
+                        qcol_indxs = Connector(Matrix.from_npa(col_indxs))
+                        row_slicing_block = RowSlicingBlock(qW, qrow_indxs, dense)
+                        col_slicing_block = ColSlicingBlock(qV, qcol_indxs)
+                        outputs = list(row_slicing_block.output) + [col_slicing_block.output]
+                        backward_matrices = [output.register_usage(0, 0)[1] for output in outputs]
+                        for connector in [qW, qV, qrow_indxs, qcol_indxs]:
+                            connector.fprop()
+                        row_slicing_block.fprop()
+                        col_slicing_block.fprop()
+                        context = Context()
+                        for dL_doutput, npa in izip(backward_matrices, dL_drows + [dL_dcols]):
+                            dL_doutput.assign(context, Matrix.from_npa(npa))
+                        row_slicing_block.bprop()
+                        col_slicing_block.bprop()
+                        qW.add(context, qW.backward_matrix)
+                        qV.add(context, qV.backward_matrix)
+                        r.append(np.allclose(qW.to_host(), expected_rows, atol=1e-5))
+                        r.append(np.allclose(qV.to_host(), expected_cols, atol=1e-5))
+            finally:
+                quagga.cpu_context_workers = 0
+        self.assertEqual(sum(r), len(r))
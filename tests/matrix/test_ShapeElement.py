@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ----------------------------------------------------------------------------
+import threading
 import numpy as np
 from unittest import TestCase
 from quagga.context import GpuContext
@@ -302,4 +303,89 @@ class TestMatrix(TestCase):
             with self.assertRaises(ValueError):
                 a_se = ShapeElement(float(a))
                 r.append(l[a_se] == l[a])
-        self.assertTrue(all(r))
\ No newline at end of file
+        self.assertTrue(all(r))
+
+    def test_propagation_order(self):
+        """
+        check that every dependent element is recomputed and every handler
+        is called once, after all values are updated
+        """
+        r = []
+        for _ in xrange(self.N // 10):
+            a = 1 + self.rng.randint(self.max_int)
+            delta = 1 + self.rng.randint(self.max_int)
+            a_se = ShapeElement(a)
+            b_se = a_se + 1
+            c_se = a_se * 2
+            d_se = b_se + c_se
+            e_se = ShapeElement(0)
+            e_se[:] = d_se
+            calls = []
+            d_se.add_modification_handler(lambda: calls.append(('d', d_se.value, e_se.value)))
+            handler = lambda: calls.append(('e', e_se.value))
+            e_se.add_modification_handler(handler)
+            d_se.add_modification_handler(handler)
+
+            a_se[:] = a + delta
+            r.append(d_se.value == 3 * (a + delta) + 1)
+            r.append(e_se.value == d_se.value)
+            r.append(sorted(calls) == [('d', d_se.value, e_se.value), ('e', e_se.value)])
+        self.assertTrue(all(r))
+
+    def test_batch_update(self):
+        r = []
+        for _ in xrange(self.N // 10):
+            a = self.rng.randint(self.max_int)
+            b = self.rng.randint(self.max_int)
+            delta = 1 + self.rng.randint(self.max_int)
+            a_se = ShapeElement(a)
+            b_se = ShapeElement(b)
+            c_se = a_se + b_se
+            calls = []
+            c_se.add_modification_handler(lambda: calls.append(c_se.value))
+            with ShapeElement.batch_update():
+                a_se[:] = a + delta
+                b_se[:] = b + delta
+                r.append(c_se.value == a + b)
+                r.append(not calls)
+            r.append(c_se.value == a + b + 2 * delta)
+            r.append(calls == [a + b + 2 * delta])
+
+            with ShapeElement.batch_update():
+                a_se[:] = a
+                a_se[:] = a + delta
+            r.append(calls == [a + b + 2 * delta])
+        self.assertTrue(all(r))
+
+    def test_batch_update_threads(self):
+        a_se = ShapeElement(1)
+        b_se = a_se + 1
+        c_se = ShapeElement(1)
+        d_se = c_se + 1
+
+        def change():
+            c_se[:] = 2
+        with ShapeElement.batch_update():
+            a_se[:] = 2
+            thread = threading.Thread(target=change)
+            thread.start()
+            thread.join()
+            # changes of other threads are propagated immediately
+            r = [b_se.value == 2, d_se.value == 3]
+        r.append(b_se.value == 3)
+        self.assertTrue(all(r))
+
+    def test_pruning(self):
+        class Owner(object):
+            pass
+
+        a_se = ShapeElement(self.max_int)
+        elements = [a_se + k for k in xrange(self.N)]
+        owners = [Owner() for _ in xrange(self.N)]
+        for k in xrange(self.N):
+            a_se.add_modification_handler(lambda: None, owners[k])
+        self.assertEqual(len(a_se._dependents), self.N)
+        self.assertEqual(len(a_se._handlers), self.N)
+        del elements, owners
+        self.assertEqual(len(a_se._dependents), 0)
+        self.assertEqual(len(a_se._handlers), 0)
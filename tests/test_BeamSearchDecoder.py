@@ -0,0 +1,104 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import quagga
+import numpy as np
+from itertools import product
+from unittest import TestCase
+from quagga import RecurrentEngine
+from quagga import BeamSearchDecoder
+from quagga.matrix import Matrix
+from quagga.connector import Connector
+
+
+class TestBeamSearchDecoder(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+        cls.N = 5
+
+    def get_engine(self, vocab_size, dim, n_layers, n_slots):
+        m = lambda nrows, ncols: Connector(Matrix.from_npa(self.rng.randn(nrows, ncols).astype(np.float32), device_id=0))
+        lstm_parameters = [(m(dim, 4 * dim), m(dim, 4 * dim), m(1, 4 * dim)) for _ in xrange(n_layers)]
+        return RecurrentEngine(m(vocab_size, dim), lstm_parameters, m(dim, vocab_size), m(1, vocab_size), n_slots)
+
+    @staticmethod
+    def get_log_prob(engine, prefix, hypothesis):
+        engine.add_stream('scoring')
+        for token_id in prefix:
+            probs = engine.step([token_id], ['scoring'])
+        log_prob = 0.0
+        for token_id in hypothesis:
+            log_prob += np.log(probs[0, token_id])
+            probs = engine.step([token_id], ['scoring'])
+        engine.evict_stream('scoring')
+        return log_prob
+
+    def test_greedy(self):
+        """
+        compare the beam of width one with greedy decoding
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for i in xrange(self.N):
+            vocab_size, dim = self.rng.random_integers(4, 32, size=2)
+            engine = self.get_engine(vocab_size, dim, self.rng.random_integers(3), 2)
+            prefix = self.rng.randint(vocab_size, size=self.rng.random_integers(5)).tolist()
+            decoder = BeamSearchDecoder(engine, 1, 10, eos_token_id=0)
+            hypothesis = decoder.decode(prefix)[0][0]
+
+            engine.add_stream('greedy')
+            for token_id in prefix:
+                probs = engine.step([token_id], ['greedy'])
+            greedy_hypothesis = []
+            while len(greedy_hypothesis) < 10:
+                greedy_hypothesis.append(int(np.argmax(probs[0])))
+                if greedy_hypothesis[-1] == 0:
+                    break
+                probs = engine.step(greedy_hypothesis[-1:], ['greedy'])
+            r.append(hypothesis == greedy_hypothesis)
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_exhaustive(self):
+        """
+        check that a beam that is wider than the number of all hypotheses
+        finds the best one and that scores are normalized log-probabilities
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for i in xrange(self.N):
+            vocab_size, max_length = 4, 3
+            engine = self.get_engine(vocab_size, self.rng.random_integers(4, 16), 2, 65)
+            prefix = [self.rng.randint(vocab_size)]
+            length_normalization = self.rng.choice([0.0, 0.5, 1.0])
+            decoder = BeamSearchDecoder(engine, 64, max_length, 0, length_normalization)
+            hypotheses = decoder.decode(prefix)
+
+            all_hypotheses = []
+            for length in xrange(1, max_length + 1):
+                for hypothesis in product(range(1, vocab_size), repeat=length - 1):
+                    all_hypotheses.append(list(hypothesis) + [0])
+                    if length == max_length:
+                        all_hypotheses.extend(list(hypothesis) + [k] for k in xrange(1, vocab_size))
+            scores = [self.get_log_prob(engine, prefix, h) / len(h) ** length_normalization for h in all_hypotheses]
+            best = np.argmax(scores)
+            r.append(hypotheses[0][0] == all_hypotheses[best])
+            r.append(np.isclose(hypotheses[0][1], scores[best], atol=1e-5))
+            for hypothesis, score in hypotheses:
+                r.append(np.isclose(score, scores[all_hypotheses.index(hypothesis)], atol=1e-5))
+            r.append(all(a[1] >= b[1] for a, b in zip(hypotheses, hypotheses[1:])))
+
+        self.assertEqual(sum(r), len(r))
@@ -0,0 +1,143 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import quagga
+import numpy as np
+from itertools import izip
+from unittest import TestCase
+from quagga import Model
+from quagga.matrix import Matrix
+from quagga.blocks import DotBlock
+from quagga.blocks import SoftmaxCeBlock
+from quagga.connector import Connector
+from quagga.blocks import ParameterContainer
+from quagga.benchmarks.model_benchmarks import get_bidirectional_lstm
+
+
+class TestBlockScheduler(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+        cls.N = 5
+
+    def get_model(self, x1, x2, true_labels1, true_labels2, W, b1, b2):
+        """
+        two branches that share the parameter `W`
+        """
+        init = lambda a: {'init': lambda: a, 'device_id': 0}
+        p = ParameterContainer(W=init(W), b1=init(b1), b2=init(b2))
+        x1, x2 = Connector(Matrix.from_npa(x1)), Connector(Matrix.from_npa(x2))
+        true_labels1 = Connector(Matrix.from_npa(true_labels1))
+        true_labels2 = Connector(Matrix.from_npa(true_labels2))
+        dot1 = DotBlock(p['W'], p['b1'], x1)
+        dot2 = DotBlock(p['W'], p['b2'], x2)
+        sce1 = SoftmaxCeBlock(dot1.output, true_labels1)
+        sce2 = SoftmaxCeBlock(dot2.output, true_labels2)
+        for connector in [x1, x2, true_labels1, true_labels2]:
+            connector.fprop()
+        return Model([p, dot1, dot2, sce1, sce2]), [sce1.probs, sce2.probs], p
+
+    def test_schedule(self):
+        """
+        compare outputs and gradients of a scheduled model with the ones of
+        the sequential model, check that independent blocks do not wait
+        for each other
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for i in xrange(self.N):
+            batch_size, x_dim, n_classes = self.rng.random_integers(4, 64, size=3)
+            arrays = [self.rng.randn(batch_size, x_dim),
+                      self.rng.randn(batch_size, x_dim),
+                      self.rng.randint(n_classes, size=(batch_size, 1)),
+                      self.rng.randint(n_classes, size=(batch_size, 1)),
+                      self.rng.randn(x_dim, n_classes),
+                      self.rng.randn(1, n_classes),
+                      self.rng.randn(1, n_classes)]
+            arrays = [a.astype(np.int32 if a.dtype.kind == 'i' else np.float32) for a in arrays]
+
+            output = {}
+            for scheduled in [False, True]:
+                model, probs, p = self.get_model(*arrays)
+                if scheduled:
+                    model.schedule_blocks(lambda: (model.fprop(), model.bprop()), n_threads=4)
+                model.fprop()
+                model.bprop()
+                output[scheduled] = [e.to_host() for e in probs] + \
+                                    [p[name].backward_matrix.to_host() for name in ['W', 'b1', 'b2']]
+            model.scheduler.close()
+            r.append(all(np.allclose(a, b) for a, b in izip(output[False], output[True])))
+
+            p, dot1, dot2, sce1, sce2 = model.blocks
+            fprop_index = lambda block: model.fpropable_blocks.index(block)
+            bprop_index = lambda block: model.bpropable_blocks.index(block)
+            dependencies = model.scheduler.fprop_dependencies
+            r.append(fprop_index(dot1) not in dependencies[fprop_index(dot2)])
+            r.append(fprop_index(dot1) not in dependencies[fprop_index(sce2)])
+            r.append(fprop_index(dot2) in dependencies[fprop_index(sce2)])
+            dependencies = model.scheduler.bprop_dependencies
+            r.append(bprop_index(sce2) in dependencies[bprop_index(dot2)])
+            r.append(bprop_index(sce1) not in dependencies[bprop_index(sce2)])
+            # both dot blocks accumulate the derivative of `W`
+            r.append(bprop_index(dot2) in dependencies[bprop_index(dot1)])
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_bidirectional_lstm(self):
+        """
+        compare gradients of the scheduled bidirectional LSTM with the ones
+        of the sequential model, check that ``fprop`` of the directions do
+        not wait for each other
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for i in xrange(self.N):
+            batch_size, dim, sequence_length, vocab_size = self.rng.random_integers(2, 16, size=4)
+            output = {}
+            for scheduled in [False, True]:
+                model = get_bidirectional_lstm(batch_size, dim, sequence_length, vocab_size, seed=i)
+                if scheduled:
+                    model.schedule_blocks(lambda: (model.fprop(), model.bprop()), n_threads=4)
+                model.fprop()
+                model.bprop()
+                p = model.blocks[0]
+                output[scheduled] = [p[name].backward_matrix.to_host() for name in sorted(p.trainable_parameters)]
+            model.scheduler.close()
+            r.append(all(np.allclose(a, b, atol=1e-6) for a, b in izip(output[False], output[True])))
+
+            fwd_lstm_block, bwd_lstm_block = model.blocks[4], model.blocks[7]
+            fwd, bwd = model.fpropable_blocks.index(fwd_lstm_block), model.fpropable_blocks.index(bwd_lstm_block)
+            r.append(fwd not in model.scheduler.fprop_dependencies[bwd])
+            # both directions accumulate derivatives of the shared embeddings
+            fwd, bwd = model.bpropable_blocks.index(fwd_lstm_block), model.bpropable_blocks.index(bwd_lstm_block)
+            r.append(bwd in model.scheduler.bprop_dependencies[fwd])
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_step(self):
+        """
+        check that a step that skips some of the blocks is rejected and
+        that the blocks are restored
+        """
+        quagga.processor_type = 'cpu'
+        arrays = [self.rng.randn(4, 3), self.rng.randn(4, 3),
+                  self.rng.randint(5, size=(4, 1)), self.rng.randint(5, size=(4, 1)),
+                  self.rng.randn(3, 5), self.rng.randn(1, 5), self.rng.randn(1, 5)]
+        arrays = [a.astype(np.int32 if a.dtype.kind == 'i' else np.float32) for a in arrays]
+        model, probs, p = self.get_model(*arrays)
+        self.assertRaises(ValueError, model.schedule_blocks, model.fprop)
+        self.assertEqual(model.scheduler, None)
+        self.assertTrue(all('fprop' not in block.__dict__ and 'bprop' not in block.__dict__
+                            for block in model.blocks))
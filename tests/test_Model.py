@@ -0,0 +1,91 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import quagga
+import numpy as np
+from unittest import TestCase
+from quagga import Model
+from quagga.matrix import Matrix
+from quagga.blocks import DotBlock
+from quagga.blocks import LstmBlock
+from quagga.blocks import SoftmaxCeBlock
+from quagga.connector import Connector
+from quagga.blocks import ParameterContainer
+
+
+class TestModel(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+        cls.N = 5
+
+    def get_model(self, x, true_labels, W, R, b, Wo, bo):
+        init = lambda a: {'init': lambda: a, 'device_id': 0}
+        p = ParameterContainer(W=init(W), R=init(R), b=init(b), Wo=init(Wo), bo=init(bo))
+        x = Connector(Matrix.from_npa(x))
+        mask = Connector(Matrix.from_npa(np.ones((x.nrows, 1), np.float32)))
+        hidden_dim = R.shape[0]
+        prev_c = Connector(Matrix.from_npa(np.zeros((x.nrows, hidden_dim), np.float32)))
+        prev_h = Connector(Matrix.from_npa(np.zeros((x.nrows, hidden_dim), np.float32)))
+        lstm = LstmBlock(p['W'], p['R'], p['b'], 5.0, x, mask, prev_c, prev_h)
+        dot = DotBlock(p['Wo'], p['bo'], lstm.h)
+        true_labels = Connector(Matrix.from_npa(true_labels))
+        sce = SoftmaxCeBlock(dot.output, true_labels, mask)
+        for connector in [x, true_labels, mask, prev_c, prev_h]:
+            connector.fprop()
+        return Model([p, lstm, dot, sce]), sce.probs, p
+
+    def test_inference(self):
+        """
+        compare outputs of models that are built with and without the
+        inference mode, check that the inference one allocates less memory
+        and has no trainable parameters
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for i in xrange(self.N):
+            batch_size, x_dim, hidden_dim, n_classes = self.rng.random_integers(4, 64, size=4)
+            arrays = [self.rng.randn(batch_size, x_dim),
+                      self.rng.randn(x_dim, 4 * hidden_dim),
+                      self.rng.randn(hidden_dim, 4 * hidden_dim),
+                      self.rng.randn(1, 4 * hidden_dim),
+                      self.rng.randn(hidden_dim, n_classes),
+                      self.rng.randn(1, n_classes)]
+            arrays = [a.astype(np.float32) for a in arrays]
+            arrays.insert(1, self.rng.randint(n_classes, size=(batch_size, 1)).astype(np.int32))
+
+            model, probs, _ = self.get_model(*arrays)
+            model.set_training_mode()
+            model.fprop()
+            model.bprop()
+            training_probs = probs.to_host()
+            training_nbytes = model.get_nbytes()
+
+            quagga.inference = True
+            try:
+                model, probs, p = self.get_model(*arrays)
+            finally:
+                quagga.inference = False
+            model.set_testing_mode()
+            model.fprop()
+            inference_probs = probs.to_host()
+            inference_nbytes = model.get_nbytes()
+
+            r.append(np.allclose(training_probs, inference_probs, atol=1e-6))
+            r.append(inference_nbytes < training_nbytes)
+            r.append(not p.trainable_parameters)
+            r.append(not any(param.bpropagable for param in p.parameters.itervalues()))
+
+        self.assertEqual(sum(r), len(r))
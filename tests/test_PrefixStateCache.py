@@ -0,0 +1,90 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import quagga
+import numpy as np
+from unittest import TestCase
+from quagga import RecurrentEngine
+from quagga import PrefixStateCache
+from quagga.matrix import Matrix
+from quagga.connector import Connector
+
+
+class TestPrefixStateCache(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+        cls.N = 5
+
+    def test_lookup(self):
+        """
+        check longest prefix lookups, counters and the lru eviction
+        """
+        n = PrefixStateCache.node_nbytes
+        cache = PrefixStateCache(max_nbytes=30 + 5 * n)
+        self.assertEqual(cache.lookup([1, 2, 3]), (0, None))
+        cache.put([1, 2], 'a', 10)
+        cache.put([1, 2, 3, 4], 'b', 10)
+        cache.put([5], 'c', 10)
+        self.assertEqual(cache.lookup([1, 2, 3]), (2, 'a'))
+        self.assertEqual(cache.lookup([1, 2, 3, 4, 5]), (4, 'b'))
+        self.assertEqual(cache.lookup([2]), (0, None))
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+        # [5] is the least recently used one
+        cache.put([1, 3], 'd', 10)
+        self.assertEqual(cache.lookup([5]), (0, None))
+        self.assertEqual(cache.lookup([1, 2]), (2, 'a'))
+        # replacing of a value does not change the number of entries
+        cache.put([1, 3], 'e', 5)
+        self.assertEqual((len(cache), cache.nbytes), (3, 25 + 5 * n))
+        # too large values are not cached, nodes of prefixes are counted
+        cache.put([7], 'f', 31 + 4 * n)
+        self.assertEqual(cache.lookup([7]), (0, None))
+        cache.put([8], 'g', 30 + 4 * n)
+        self.assertEqual((len(cache), cache.nbytes), (1, 30 + 5 * n))
+        self.assertEqual(cache.lookup([1, 2, 3, 4]), (0, None))
+        self.assertEqual(cache._root.children.keys(), [8])
+
+    def test_prime(self):
+        """
+        compare probabilities and states of streams primed with and without
+        the cache
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for i in xrange(self.N):
+            vocab_size, dim = self.rng.random_integers(4, 32, size=2)
+            m = lambda nrows, ncols: Connector(Matrix.from_npa(self.rng.randn(nrows, ncols).astype(np.float32), device_id=0))
+            lstm_parameters = [(m(dim, 4 * dim), m(dim, 4 * dim), m(1, 4 * dim)) for _ in xrange(2)]
+            engine = RecurrentEngine(m(vocab_size, dim), lstm_parameters, m(dim, vocab_size), m(1, vocab_size), 2)
+            engine.add_stream('cached')
+            engine.add_stream('plain')
+            cache = PrefixStateCache(max_nbytes=2 ** 20)
+            prefix = self.rng.randint(vocab_size, size=5).tolist()
+            for k in xrange(10):
+                token_ids = prefix[:self.rng.random_integers(5)] + \
+                            self.rng.randint(vocab_size, size=self.rng.randint(3)).tolist()
+                probs = engine.prime('cached', token_ids, cache)
+                plain_probs = engine.prime('plain', token_ids)
+                r.append(np.allclose(probs, plain_probs, atol=1e-5))
+                for state, plain_state in zip(engine.get_states('cached'), engine.get_states('plain')):
+                    r.extend(np.allclose(s, plain_s, atol=1e-5) for s, plain_s in zip(state, plain_state))
+                probs = engine.step([1], ['cached'])
+                plain_probs = engine.step([1], ['plain'])
+                r.append(np.allclose(probs, plain_probs, atol=1e-5))
+            r.append(cache.hits > 0)
+            r.append(cache.hits + cache.misses == 10)
+
+        self.assertEqual(sum(r), len(r))
@@ -0,0 +1,108 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import os
+import json
+import quagga
+import tempfile
+import numpy as np
+from unittest import TestCase
+from quagga import Model
+from quagga import Profiler
+from quagga.matrix import Matrix
+from quagga.blocks import DotBlock
+from quagga.blocks import LstmBlock
+from quagga.connector import Connector
+from quagga.blocks import SoftmaxCeBlock
+
+
+class TestProfiler(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+        cls.N = 5
+
+    def get_model(self, batch_size, x_dim, hidden_dim, n_classes):
+        m = lambda nrows, ncols: Matrix.from_npa(self.rng.randn(nrows, ncols).astype(np.float32))
+        x = Connector(m(batch_size, x_dim), 0)
+        mask = Connector(Matrix.from_npa((self.rng.rand(batch_size, 1) < 0.8).astype(np.float32)))
+        prev_c = Connector(m(batch_size, hidden_dim), 0)
+        prev_h = Connector(m(batch_size, hidden_dim), 0)
+        W = Connector(m(x_dim, 4 * hidden_dim), 0)
+        R = Connector(m(hidden_dim, 4 * hidden_dim), 0)
+        b = Connector(m(1, 4 * hidden_dim), 0)
+        Wo = Connector(m(hidden_dim, n_classes), 0)
+        bo = Connector(m(1, n_classes), 0)
+        true_labels = Connector(Matrix.from_npa(self.rng.randint(n_classes, size=(batch_size, 1)).astype(np.int32)))
+        lstm = LstmBlock(W, R, b, 5.0, x, mask, prev_c, prev_h)
+        dot = DotBlock(Wo, bo, lstm.h)
+        sce = SoftmaxCeBlock(dot.output, true_labels, mask)
+        connectors = [x, mask, prev_c, prev_h, W, R, b, Wo, bo, true_labels]
+        return Model([lstm, dot, sce]), connectors
+
+    def test_stats(self):
+        """
+        check that every call of the model and its blocks is recorded and
+        that detached blocks get their methods back
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for i in xrange(self.N):
+            dims = self.rng.random_integers(16, 128, size=4)
+            model, connectors = self.get_model(*dims)
+            methods = [(block.fprop, block.bprop) for block in model.blocks]
+            profiler = Profiler(synchronize=True, track_allocations=True)
+            profiler.attach(model)
+            n = self.rng.randint(1, 5)
+            for _ in xrange(n):
+                for connector in connectors:
+                    connector.fprop()
+                model.fprop()
+                model.bprop()
+            profiler.detach()
+            model.fprop()
+
+            names = ['Model', '0:LstmBlock', '1:DotBlock', '2:SoftmaxCeBlock']
+            r.append(all(profiler.stats[name, method].calls == n
+                         for name in names for method in ['fprop', 'bprop']))
+            r.append(len(profiler.events) == 2 * n * len(names))
+            r.append(profiler.stats['Model', 'fprop'].time >= profiler.stats['0:LstmBlock', 'fprop'].time)
+            r.append(all(block.fprop == fprop and block.bprop == bprop
+                         for block, (fprop, bprop) in zip(model.blocks, methods)))
+            r.append(all('fprop' not in vars(block) for block in model.blocks + [model]))
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_save_chrome_trace(self):
+        quagga.processor_type = 'cpu'
+        model, connectors = self.get_model(16, 16, 16, 16)
+        profiler = Profiler()
+        profiler.attach(model)
+        for connector in connectors:
+            connector.fprop()
+        model.fprop()
+        model.bprop()
+        profiler.detach()
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            profiler.save_chrome_trace(path)
+            with open(path) as f:
+                trace = json.load(f)
+        finally:
+            os.remove(path)
+        self.assertEqual(len(trace['traceEvents']), 8)
+        self.assertEqual(set(e['ph'] for e in trace['traceEvents']), {'X'})
+        self.assertIn('0:LstmBlock', profiler.get_table())
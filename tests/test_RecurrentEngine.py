@@ -0,0 +1,146 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import quagga
+import numpy as np
+from unittest import TestCase
+from quagga import RecurrentEngine
+from quagga.matrix import Matrix
+from quagga.connector import Connector
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+class TestRecurrentEngine(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+        cls.N = 5
+
+    def get_parameters(self, vocab_size, x_dim, hidden_dims):
+        randn = lambda *shape: (0.5 * self.rng.randn(*shape)).astype(np.float32)
+        embd_W = randn(vocab_size, x_dim)
+        lstm_parameters = []
+        initial_states = []
+        for hidden_dim in hidden_dims:
+            lstm_parameters.append((randn(x_dim, 4 * hidden_dim),
+                                    randn(hidden_dim, 4 * hidden_dim),
+                                    randn(1, 4 * hidden_dim)))
+            initial_states.append((randn(1, hidden_dim), randn(1, hidden_dim)))
+            x_dim = hidden_dim
+        sce_W = randn(x_dim, vocab_size)
+        sce_b = randn(1, vocab_size)
+        return embd_W, lstm_parameters, sce_W, sce_b, initial_states
+
+    def get_engine(self, embd_W, lstm_parameters, sce_W, sce_b, initial_states, n_slots):
+        connector = lambda a: Connector(Matrix.from_npa(a, device_id=0))
+        lstm_parameters = [[connector(a) for a in e] for e in lstm_parameters]
+        return RecurrentEngine(connector(embd_W), lstm_parameters,
+                               connector(sce_W), connector(sce_b),
+                               n_slots, initial_states)
+
+    @staticmethod
+    def np_step(token_id, states, embd_W, lstm_parameters, sce_W, sce_b):
+        x = embd_W[[token_id]]
+        new_states = []
+        for (W, R, b), (c, h) in zip(lstm_parameters, states):
+            pre_zifo = np.dot(x, W) + np.dot(h, R) + b
+            n = h.shape[1]
+            z = np.tanh(pre_zifo[:, :n])
+            i, f, o = [sigmoid(pre_zifo[:, k * n:(k + 1) * n]) for k in xrange(1, 4)]
+            c = i * z + f * c
+            h = o * np.tanh(c)
+            new_states.append((c, h))
+            x = h
+        logits = np.dot(x, sce_W) + sce_b
+        probs = np.exp(logits - logits.max())
+        return probs / probs.sum(), new_states
+
+    def test_step(self):
+        """
+        interleave steps, reorderings, resets and evictions of streams and compare
+        probabilities and states of every stream with the ones of
+        the stream that is processed alone
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for i in xrange(self.N):
+            vocab_size, x_dim = self.rng.random_integers(4, 32, size=2)
+            hidden_dims = self.rng.random_integers(4, 32, size=self.rng.random_integers(3))
+            n_slots = self.rng.random_integers(2, 8)
+            parameters = self.get_parameters(vocab_size, x_dim, hidden_dims)
+            initial_states = parameters[-1]
+            engine = self.get_engine(*(parameters + (n_slots, )))
+            np_states = {}
+            next_stream_id = 0
+            for _ in xrange(30):
+                action = self.rng.randint(10)
+                if action == 0 and np_states:
+                    stream_id = self.rng.choice(np_states.keys())
+                    engine.evict_stream(stream_id)
+                    del np_states[stream_id]
+                elif action == 1 and np_states:
+                    stream_id = self.rng.choice(np_states.keys())
+                    engine.reset_stream(stream_id)
+                    np_states[stream_id] = list(initial_states)
+                elif action < 4 and len(np_states) < n_slots:
+                    engine.add_stream(next_stream_id)
+                    np_states[next_stream_id] = list(initial_states)
+                    next_stream_id += 1
+                elif np_states:
+                    stream_ids = list(np_states)
+                    self.rng.shuffle(stream_ids)
+                    stream_ids = stream_ids[:self.rng.random_integers(len(stream_ids))]
+                    token_ids = self.rng.randint(vocab_size, size=len(stream_ids))
+                    probs = engine.step(token_ids, stream_ids)
+                    for k, stream_id in enumerate(stream_ids):
+                        np_probs, np_states[stream_id] = self.np_step(token_ids[k], np_states[stream_id], *parameters[:-1])
+                        r.append(np.allclose(probs[[k]], np_probs, atol=1e-5))
+                    if self.rng.randint(2):
+                        stream_ids = list(np_states)
+                        parent_stream_ids = [stream_ids[k] for k in self.rng.randint(len(stream_ids), size=len(stream_ids))]
+                        engine.reorder(stream_ids, parent_stream_ids)
+                        parent_states = [np_states[stream_id] for stream_id in parent_stream_ids]
+                        np_states.update(zip(stream_ids, parent_states))
+            for stream_id, states in np_states.iteritems():
+                for (c, h), (np_c, np_h) in zip(engine.get_states(stream_id), states):
+                    r.append(np.allclose(c, np_c, atol=1e-5))
+                    r.append(np.allclose(h, np_h, atol=1e-5))
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_slots(self):
+        """
+        check that slots are reused and that misuse of streams is reported
+        """
+        quagga.processor_type = 'cpu'
+        parameters = self.get_parameters(10, 5, [7])
+        engine = self.get_engine(*(parameters + (2, )))
+        self.assertEqual(engine.add_stream('a'), 0)
+        self.assertEqual(engine.add_stream('b'), 1)
+        self.assertRaises(ValueError, engine.add_stream, 'c')
+        self.assertRaises(ValueError, engine.add_stream, 'a')
+        engine.evict_stream('a')
+        self.assertEqual(engine.add_stream('c'), 0)
+        self.assertEqual(sorted(engine.streams), ['b', 'c'])
+        self.assertRaises(ValueError, engine.step, [1], ['a'])
+        self.assertRaises(ValueError, engine.step, [1, 2], ['b', 'b'])
+        self.assertRaises(ValueError, engine.step, [1, 2], ['b'])
+        self.assertRaises(ValueError, engine.reorder, ['b'], ['c'])
+        engine.step([1, 2], ['b', 'c'])
+        engine.reorder(['b'], ['c'])
+        self.assertRaises(ValueError, engine.reorder, ['b'], ['a'])